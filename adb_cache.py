@@ -0,0 +1,95 @@
+# adb_cache.py
+# ==========================================================
+#  Cache TTL cho các truy vấn chỉ-đọc lặp lại nhiều lần (wm size, getprop abi/sdk,
+#  SurfaceOrientation, 'tesseract --list-langs'...).
+#  - Khoá (serial, lệnh); serial "" cho lệnh của máy host (tesseract).
+#  - TTL theo từng lệnh (TTLS), lệnh chưa khai báo dùng DEFAULT_TTL.
+#  - Chỉ cache kết quả hợp lệ (keep(result) == True), lỗi thì lần sau chạy lại.
+#  - invalidate(serial) khi máy reconnect / đổi trạng thái (device_watcher gọi).
+#  - hits / misses để xem cache có ăn không (stats()).
+#  Tắt bằng BB_ADB_CACHE=0 (luôn chạy lệnh thật).
+# ==========================================================
+from __future__ import annotations
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TTL = 30.0
+TTLS: Dict[str, float] = {
+    "wm size": 300.0,
+    "dumpsys display": 300.0,
+    "getprop ro.product.cpu.abi": 24 * 3600.0,      # chỉ đổi khi máy reconnect (invalidate)
+    "getprop ro.build.version.sdk": 24 * 3600.0,
+    "SurfaceOrientation": 5.0,                        # xoay màn hình được -> TTL ngắn
+    "tesseract --list-langs": 600.0,
+}
+
+
+class QueryCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, serial: str, cmd: str, fn: Callable[[], Any], ttl: Optional[float] = None,
+            keep: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Kết quả còn hạn thì trả luôn, không thì chạy fn() và cache nếu keep(kết quả)."""
+        key = (serial or "", cmd)
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+        value = fn()
+        if keep is None or keep(value):
+            ttl = TTLS.get(cmd, DEFAULT_TTL) if ttl is None else ttl
+            with self._lock:
+                self._data[key] = (time.monotonic() + ttl, value)
+        return value
+
+    def invalidate(self, serial: Optional[str] = None, cmd: Optional[str] = None):
+        """Xoá cache của 1 máy (hoặc 1 lệnh của máy đó); serial=None -> xoá hết."""
+        with self._lock:
+            if serial is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if k[0] == serial and (cmd is None or k[1] == cmd)]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data),
+                    "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+class _NoCache(QueryCache):
+    def get(self, serial, cmd, fn, ttl=None, keep=None):
+        with self._lock:
+            self.misses += 1
+        return fn()
+
+
+_CACHE: Optional[QueryCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> QueryCache:
+    """Cache dùng chung cả tiến trình (BB_ADB_CACHE=0 -> bản không cache, vẫn đếm miss)."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            off = os.environ.get("BB_ADB_CACHE", "1") in ("0", "false", "False")
+            _CACHE = _NoCache() if off else QueryCache()
+        return _CACHE
+
+
+def cached_shell(serial: str, cmd: str, fn: Callable[[], Tuple[int, Any, Any]],
+                 ttl: Optional[float] = None) -> Tuple[int, Any, Any]:
+    """fn trả (code, out, err) kiểu adb_safe/_adb_shell; chỉ cache khi code == 0 và có output."""
+    return get_cache().get(serial, cmd, fn, ttl, keep=lambda r: bool(r) and r[0] == 0 and bool(r[1]))
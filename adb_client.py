@@ -0,0 +1,323 @@
+# adb_client.py
+# ==========================================================
+#  Client thuần Python nói chuyện thẳng với adb server (smart socket, mặc định 127.0.0.1:5037),
+#  không spawn adb.exe cho mỗi lệnh.
+#
+#  Giao thức: gửi "<4 hex độ dài><service>", server trả "OKAY" hoặc "FAIL<4 hex><lý do>".
+#    host:devices / host:track-devices         : danh sách máy
+#    host-serial:<serial>:get-state             : trạng thái 1 máy
+#    host:transport:<serial> rồi service máy:   shell,v2,raw:<cmd> | shell:<cmd> | exec:<cmd> | sync:
+#  shell v2 trả gói [id 1 byte][len 4 byte LE][data]: 1=stdout, 2=stderr, 3=exit code.
+#  Máy không có 'shell_v2' -> shell: cũ, exit code lấy qua dòng đánh dấu ở cuối output.
+#  sync: SEND/DATA/DONE (push), RECV/DATA/DONE (pull), QUIT.
+#
+#  AdbClient.run_args(serial, args) nhận args kiểu subprocess ("shell", ...), ("exec-out", ...),
+#  ("push", l, r), ("pull", r, l), ("get-state",), trả (code, out, err); None = không hỗ trợ /
+#  server không kết nối được -> caller chạy adb.exe như cũ.
+# ==========================================================
+from __future__ import annotations
+
+import os
+import time
+import socket
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+
+_SYNC_CHUNK = 64 * 1024
+_EXIT_MARK = b"__BB_EXIT__"
+_UNAVAILABLE_BACKOFF_SEC = 10.0
+
+
+class AdbError(Exception):
+    """Server trả FAIL hoặc giao thức sai."""
+
+
+class AdbUnavailable(AdbError):
+    """Không kết nối được tới adb server."""
+
+
+def _server_addr() -> Tuple[str, int]:
+    port = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+    return "127.0.0.1", port
+
+
+def parse_devices(text: str) -> List[Tuple[str, str]]:
+    """'serial\\tstate' mỗi dòng -> [(serial, state)]."""
+    out = []
+    for line in text.splitlines():
+        parts = line.strip().split()
+        if len(parts) >= 2:
+            out.append((parts[0], parts[1]))
+    return out
+
+
+class _Conn:
+    """1 kết nối tới adb server (mỗi service 1 kết nối, server tự đóng khi xong)."""
+
+    def __init__(self, addr: Tuple[str, int], timeout: float):
+        try:
+            self.sock = socket.create_connection(addr, timeout=min(timeout, 3.0))
+        except OSError as e:
+            raise AdbUnavailable(str(e))
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def recv_exact(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise AdbError("server đóng kết nối")
+            buf += chunk
+        return bytes(buf)
+
+    def recv_all(self) -> bytes:
+        parts = []
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return b"".join(parts)
+            parts.append(chunk)
+
+    def read_hex_block(self) -> bytes:
+        n = int(self.recv_exact(4), 16)
+        return self.recv_exact(n) if n else b""
+
+    def send_service(self, service: str):
+        data = service.encode("utf-8")
+        self.sock.sendall(b"%04x" % len(data) + data)
+        status = self.recv_exact(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self.read_hex_block().decode("utf-8", errors="ignore"))
+        raise AdbError(f"phản hồi lạ: {status!r}")
+
+
+class AdbClient:
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, timeout: float = 8.0):
+        dh, dp = _server_addr()
+        self.addr = (host or dh, int(port or dp))
+        self.timeout = timeout
+        self._features: dict = {}
+        self._down_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---------------- host services ----------------
+    def _connect(self, timeout: Optional[float] = None) -> _Conn:
+        return _Conn(self.addr, self.timeout if timeout is None else timeout)
+
+    def _host_query(self, service: str, timeout: Optional[float] = None) -> str:
+        with self._connect(timeout) as c:
+            c.send_service(service)
+            return c.read_hex_block().decode("utf-8", errors="ignore")
+
+    def version(self) -> int:
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self) -> List[Tuple[str, str]]:
+        return parse_devices(self._host_query("host:devices"))
+
+    def get_state(self, serial: str, timeout: Optional[float] = None) -> str:
+        return self._host_query(f"host-serial:{serial}:get-state", timeout).strip()
+
+    def track_devices(self, stop_evt: Optional[threading.Event] = None) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Generator: mỗi lần danh sách máy đổi, server đẩy 1 bản đầy đủ -> yield [(serial, state)].
+        Kết nối giữ mở tới khi server đóng / stop_evt set (kiểm tra mỗi giây).
+        """
+        c = self._connect()
+        try:
+            c.send_service("host:track-devices")
+            c.sock.settimeout(1.0)
+            while stop_evt is None or not stop_evt.is_set():
+                try:
+                    head = c.recv_exact(4)
+                except socket.timeout:
+                    continue
+                n = int(head, 16)
+                c.sock.settimeout(self.timeout)
+                body = c.recv_exact(n) if n else b""
+                c.sock.settimeout(1.0)
+                yield parse_devices(body.decode("utf-8", errors="ignore"))
+        finally:
+            c.close()
+
+    def features(self, serial: str) -> Set[str]:
+        with self._lock:
+            if serial in self._features:
+                return self._features[serial]
+        try:
+            feats = set(self._host_query(f"host-serial:{serial}:features").strip().split(","))
+        except AdbError:
+            return set()    # không cache: máy có thể đang offline
+        with self._lock:
+            self._features[serial] = feats
+        return feats
+
+    def forget(self, serial: str):
+        """Bỏ cache features (máy reconnect / đổi Android)."""
+        with self._lock:
+            self._features.pop(serial, None)
+
+    # ---------------- device services ----------------
+    def _open(self, serial: str, service: str, timeout: Optional[float] = None) -> _Conn:
+        c = self._connect(timeout)
+        try:
+            c.send_service(f"host:transport:{serial}")
+            c.send_service(service)
+        except Exception:
+            c.close()
+            raise
+        return c
+
+    def shell(self, serial: str, cmd: str, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """Chạy lệnh shell, trả (exit code, stdout, stderr) dạng bytes."""
+        if "shell_v2" in self.features(serial):
+            with self._open(serial, f"shell,v2,raw:{cmd}", timeout) as c:
+                out, err, code = bytearray(), bytearray(), 255
+                while True:
+                    try:
+                        head = c.recv_exact(5)
+                    except AdbError:
+                        break
+                    pid, n = head[0], struct.unpack("<I", head[1:])[0]
+                    data = c.recv_exact(n) if n else b""
+                    if pid == 1:
+                        out += data
+                    elif pid == 2:
+                        err += data
+                    elif pid == 3:
+                        code = data[0] if data else 255
+                        break
+                return code, bytes(out), bytes(err)
+        # shell cũ: không có exit code -> in thêm dòng đánh dấu
+        with self._open(serial, f"shell:( {cmd} ); echo {_EXIT_MARK.decode()}$?", timeout) as c:
+            raw = c.recv_all()
+        i = raw.rfind(_EXIT_MARK)
+        if i < 0:
+            return 255, raw, b""
+        try:
+            code = int(raw[i + len(_EXIT_MARK):].strip() or b"255")
+        except ValueError:
+            code = 255
+        return code, raw[:i], b""
+
+    def exec_out(self, serial: str, cmd: str, timeout: Optional[float] = None) -> bytes:
+        """Như 'adb exec-out': stdout nhị phân sạch (không PTY)."""
+        with self._open(serial, f"exec:{cmd}", timeout) as c:
+            return c.recv_all()
+
+    def push(self, serial: str, local, remote: str, mode: int = 0o644, timeout: Optional[float] = None):
+        local = Path(local)
+        with self._open(serial, "sync:", timeout) as c:
+            spec = f"{remote},{mode}".encode("utf-8")
+            c.sock.sendall(b"SEND" + struct.pack("<I", len(spec)) + spec)
+            with open(local, "rb") as f:
+                while True:
+                    chunk = f.read(_SYNC_CHUNK)
+                    if not chunk:
+                        break
+                    c.sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+            c.sock.sendall(b"DONE" + struct.pack("<I", int(local.stat().st_mtime)))
+            status, n = c.recv_exact(4), struct.unpack("<I", c.recv_exact(4))[0]
+            if status != b"OKAY":
+                msg = c.recv_exact(n).decode("utf-8", errors="ignore") if n else ""
+                raise AdbError(f"push lỗi: {msg}")
+            c.sock.sendall(b"QUIT" + struct.pack("<I", 0))
+
+    def pull(self, serial: str, remote: str, local, timeout: Optional[float] = None):
+        local = Path(local)
+        tmp = local.with_name(local.name + ".part")
+        try:
+            with self._open(serial, "sync:", timeout) as c:
+                path = remote.encode("utf-8")
+                c.sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+                with open(tmp, "wb") as f:
+                    while True:
+                        status, n = c.recv_exact(4), struct.unpack("<I", c.recv_exact(4))[0]
+                        if status == b"DATA":
+                            f.write(c.recv_exact(n))
+                        elif status == b"DONE":
+                            break
+                        elif status == b"FAIL":
+                            msg = c.recv_exact(n).decode("utf-8", errors="ignore")
+                            raise AdbError(f"pull lỗi: {msg}")
+                        else:
+                            raise AdbError(f"sync phản hồi lạ: {status!r}")
+                c.sock.sendall(b"QUIT" + struct.pack("<I", 0))
+            os.replace(tmp, local)
+        except Exception:
+            try:
+                tmp.unlink()
+            except Exception:
+                pass
+            raise
+
+    # ---------------- cầu nối kiểu subprocess ----------------
+    @property
+    def available(self) -> bool:
+        return time.monotonic() - self._down_at >= _UNAVAILABLE_BACKOFF_SEC
+
+    def run_args(self, serial: str, args, timeout: float = 8, text: bool = True):
+        """
+        Chạy args kiểu 'adb -s serial <args...>' qua socket. Trả (code, out, err) giống subprocess
+        (str khi text=True, bytes khi text=False); None nếu không hỗ trợ lệnh này hoặc server không kết nối được.
+        """
+        if not args or not self.available:
+            return None
+        args = [str(a) for a in args]
+        op, rest = args[0], args[1:]
+        try:
+            if op == "shell" and rest:
+                code, out, err = self.shell(serial, " ".join(rest), timeout)
+            elif op == "exec-out" and rest:
+                code, out, err = 0, self.exec_out(serial, " ".join(rest), timeout), b""
+            elif op == "get-state" and not rest:
+                code, out, err = 0, (self.get_state(serial, timeout) + "\n").encode(), b""
+            elif op == "push" and len(rest) == 2:
+                self.push(serial, rest[0], rest[1], timeout=timeout)
+                code, out, err = 0, b"", b""
+            elif op == "pull" and len(rest) == 2:
+                self.pull(serial, rest[0], rest[1], timeout=timeout)
+                code, out, err = 0, b"", b""
+            else:
+                return None
+        except AdbUnavailable:
+            self._down_at = time.monotonic()
+            return None
+        except socket.timeout:
+            code, out, err = 124, b"", b"timeout"
+        except (AdbError, OSError) as e:
+            code, out, err = 1, b"", str(e).encode("utf-8", errors="ignore")
+        if text:
+            return code, out.decode("utf-8", errors="ignore"), err.decode("utf-8", errors="ignore")
+        return code, out, err
+
+
+_CLIENT: Optional[AdbClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> Optional[AdbClient]:
+    """Client dùng chung; None nếu tắt bằng BB_ADB_CLIENT=0."""
+    global _CLIENT
+    if os.environ.get("BB_ADB_CLIENT", "1") in ("0", "false", "False"):
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = AdbClient()
+        return _CLIENT
@@ -0,0 +1,206 @@
+# adb_scheduler.py
+# ==========================================================
+#  Hàng đợi lệnh adb theo máy, có độ ưu tiên:
+#     INPUT (tap/swipe/keyevent, broadcast gõ chữ của text_input) > FRAME (screencap) > PROBE (dumpsys/pidof/getprop...) > HOUSEKEEPING
+#  - N thread worker dùng chung = trần số lệnh adb chạy cùng lúc toàn cục (BB_ADB_INFLIGHT_GLOBAL).
+#  - Mỗi máy tối đa BB_ADB_INFLIGHT_DEVICE lệnh cùng lúc; PROBE/HOUSEKEEPING chừa lại 1 chỗ
+#    để lệnh INPUT không phải chờ sau 1 'dumpsys' chậm.
+#  - Cùng độ ưu tiên thì lệnh vào trước chạy trước (công bằng giữa các máy).
+#  - Lệnh chờ trong hàng quá deadline thì bị huỷ (DeadlineExceeded), không chạy muộn.
+#  Lệnh đi qua adb shell sống lâu (adb_shell_session, xem module.adb_safe) cũng xếp hàng ở đây
+#  trước khi vào hàng FIFO của session -> tap/swipe vẫn vượt được dumpsys/pidof đang chờ.
+# ==========================================================
+from __future__ import annotations
+
+import os
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional
+
+PRIO_INPUT = 0
+PRIO_FRAME = 1
+PRIO_PROBE = 2
+PRIO_HOUSEKEEPING = 3
+PRIO_NAMES = {PRIO_INPUT: "input", PRIO_FRAME: "frame", PRIO_PROBE: "probe", PRIO_HOUSEKEEPING: "housekeeping"}
+
+_HOUSEKEEPING_CMDS = ("push", "pull", "install", "uninstall", "forward", "reverse")
+_HOUSEKEEPING_SHELL = ("pm", "rm", "chmod", "mkdir", "logcat", "kill")
+# 'am broadcast -a <action>' của text_input (ADBKeyboard / Clipper) là gõ phím, không phải probe
+_INPUT_BROADCASTS = ("ADB_INPUT_B64", "ADB_CLEAR_TEXT", "clipper.set")
+
+
+class DeadlineExceeded(Exception):
+    """Lệnh chờ trong hàng quá deadline, đã huỷ không chạy."""
+
+
+def classify(args) -> int:
+    """Đoán lớp ưu tiên từ args kiểu 'adb -s serial <args...>'."""
+    a = [str(x) for x in args]
+    if not a:
+        return PRIO_PROBE
+    if a[0] in _HOUSEKEEPING_CMDS:
+        return PRIO_HOUSEKEEPING
+    if a[0] == "exec-out":
+        return PRIO_FRAME
+    if a[0] == "shell" and len(a) > 1:
+        # script nhiều lệnh (input_batch, sendevent) -> xét lệnh đầu của từng đoạn
+        segs = [seg.split() for seg in " ".join(a[1:]).replace("&&", ";").split(";") if seg.strip()]
+        heads = [seg[0] for seg in segs]
+        if any(h in ("input", "sendevent") for h in heads):
+            return PRIO_INPUT
+        if any(seg[:2] == ["am", "broadcast"] and any(t in _INPUT_BROADCASTS for t in seg[2:]) for seg in segs):
+            return PRIO_INPUT
+        head = heads[0] if heads else ""
+        if head == "screencap" or "minicap" in head:
+            return PRIO_FRAME
+        if head in _HOUSEKEEPING_SHELL:
+            return PRIO_HOUSEKEEPING
+    return PRIO_PROBE
+
+
+class _Job:
+    __slots__ = ("serial", "prio", "seq", "fn", "args", "kwargs", "deadline", "future", "t_submit")
+
+    def __init__(self, serial, prio, seq, fn, args, kwargs, deadline):
+        self.serial = serial
+        self.prio = prio
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.t_submit = time.monotonic()
+
+
+class AdbScheduler:
+    def __init__(self, per_device: Optional[int] = None, global_cap: Optional[int] = None):
+        self.per_device = max(1, int(per_device or os.environ.get("BB_ADB_INFLIGHT_DEVICE", "2")))
+        self.global_cap = max(1, int(global_cap or os.environ.get("BB_ADB_INFLIGHT_GLOBAL", "8")))
+        self._cv = threading.Condition()
+        self._queues: Dict[str, List] = {}          # serial -> heap[(prio, seq, job)]
+        self._inflight: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._stop = False
+        self.stats = {name: {"done": 0, "cancelled": 0, "wait_ms_max": 0.0} for name in PRIO_NAMES.values()}
+        self._workers = [threading.Thread(target=self._worker, name=f"AdbSched-{i}", daemon=True)
+                         for i in range(self.global_cap)]
+        for t in self._workers:
+            t.start()
+
+    # ---------------- API ----------------
+    def submit(self, serial: str, fn: Callable, *args, prio: int = PRIO_PROBE,
+               deadline: Optional[float] = None, **kwargs) -> Future:
+        """Xếp fn(*args, **kwargs) vào hàng của serial. deadline: time.monotonic() muộn nhất được BẮT ĐẦU chạy."""
+        with self._cv:
+            job = _Job(serial, prio, next(self._seq), fn, args, kwargs, deadline)
+            heapq.heappush(self._queues.setdefault(serial, []), (prio, job.seq, job))
+            self._cv.notify()
+        return job.future
+
+    def run(self, serial: str, fn: Callable, *args, prio: int = PRIO_PROBE,
+            timeout: Optional[float] = None, **kwargs):
+        """submit + chờ kết quả. timeout (giây) vừa là deadline xếp hàng vừa là thời gian chờ tối đa."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        fut = self.submit(serial, fn, *args, prio=prio, deadline=deadline, **kwargs)
+        # lệnh đã chạy thì tự có timeout riêng -> chờ thêm 1 khoảng dư cho chắc
+        return fut.result(None if timeout is None else timeout * 2 + 5)
+
+    def pending(self, serial: Optional[str] = None) -> int:
+        with self._cv:
+            if serial is not None:
+                return len(self._queues.get(serial, ()))
+            return sum(len(q) for q in self._queues.values())
+
+    def shutdown(self):
+        with self._cv:
+            self._stop = True
+            self._cv.notify_all()
+
+    # ---------------- nội bộ ----------------
+    def _cap_for(self, prio: int) -> int:
+        if prio >= PRIO_PROBE and self.per_device > 1:
+            return self.per_device - 1
+        return self.per_device
+
+    def _pick(self) -> Optional[_Job]:
+        """Job ưu tiên cao nhất (rồi cũ nhất) trong các máy còn chỗ; huỷ job quá deadline gặp trên đường."""
+        now = time.monotonic()
+        best = None
+        for serial, q in self._queues.items():
+            while q and q[0][2].deadline is not None and q[0][2].deadline < now:
+                _, _, job = heapq.heappop(q)
+                self._cancel(job)
+            if not q:
+                continue
+            prio, seq, job = q[0]
+            if self._inflight.get(serial, 0) >= self._cap_for(prio):
+                continue
+            if best is None or (prio, seq) < (best.prio, best.seq):
+                best = job
+        if best is not None:
+            heapq.heappop(self._queues[best.serial])
+        return best
+
+    def _cancel(self, job: _Job):
+        self.stats[PRIO_NAMES[job.prio]]["cancelled"] += 1
+        if job.future.set_running_or_notify_cancel():
+            job.future.set_exception(DeadlineExceeded(f"{PRIO_NAMES[job.prio]} quá deadline trong hàng đợi"))
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                job = None
+                while not self._stop:
+                    job = self._pick()
+                    if job is not None:
+                        break
+                    self._cv.wait(0.5)
+                if job is None:
+                    return
+                self._inflight[job.serial] = self._inflight.get(job.serial, 0) + 1
+                st = self.stats[PRIO_NAMES[job.prio]]
+                st["wait_ms_max"] = max(st["wait_ms_max"], (time.monotonic() - job.t_submit) * 1000.0)
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._cv:
+                    self._inflight[job.serial] -= 1
+                    st["done"] += 1
+                    self._cv.notify_all()
+
+
+_SCHED: Optional[AdbScheduler] = None
+_SCHED_LOCK = threading.Lock()
+
+
+def get_scheduler() -> Optional[AdbScheduler]:
+    """Scheduler dùng chung; None nếu tắt bằng BB_ADB_SCHED=0."""
+    global _SCHED
+    if os.environ.get("BB_ADB_SCHED", "1") in ("0", "false", "False"):
+        return None
+    with _SCHED_LOCK:
+        if _SCHED is None:
+            _SCHED = AdbScheduler()
+        return _SCHED
+
+
+def run_scheduled(serial: str, fn: Callable, args, timeout: float, timeout_result):
+    """
+    Chạy fn(args, timeout) qua scheduler với lớp ưu tiên đoán từ args.
+    Hàng đợi quá deadline -> trả timeout_result (giống adb bị timeout).
+    """
+    sched = get_scheduler()
+    if sched is None:
+        return fn(args, timeout)
+    try:
+        return sched.run(serial, fn, args, timeout, prio=classify(args), timeout=timeout)
+    except (DeadlineExceeded, FutureTimeout):
+        return timeout_result
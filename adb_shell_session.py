@@ -0,0 +1,217 @@
+# adb_shell_session.py
+# ==========================================================
+#  1 tiến trình 'adb -s SERIAL shell' sống lâu cho mỗi máy, thay cho việc spawn
+#  'adb shell input ...' mỗi lần tap/swipe (30-80ms/lần trên Windows).
+#  - Lệnh xếp hàng (queue.Queue), 1 thread gửi lần lượt vào stdin của shell.
+#  - Mỗi lệnh chạy dạng: ( cmd ) </dev/null 2>&1; echo "__BB_""END__ <n> $?"
+#    -> đọc stdout tới dòng sentinel đúng số thứ tự n để tách output + exit code.
+#    (chuỗi sentinel bị cắt đôi trong lệnh để tiếng vọng của lệnh không khớp nhầm)
+#  - Shell chết/treo (timeout) -> kill, lần sau tự mở lại.
+#  stderr gộp vào stdout (err trả về luôn rỗng khi lệnh chạy được).
+# ==========================================================
+from __future__ import annotations
+
+import os
+import time
+import queue
+import threading
+import subprocess
+from typing import Callable, Optional, Tuple
+
+_SENTINEL = "__BB_END__"
+_SPAWN_BACKOFF_SEC = 10.0
+
+
+class _SessionBroken(Exception):
+    pass
+
+
+class _Cmd:
+    __slots__ = ("cmd", "deadline", "done", "result", "cancelled")
+
+    def __init__(self, cmd: str, timeout: float):
+        self.cmd = cmd
+        self.deadline = time.monotonic() + timeout
+        self.done = threading.Event()
+        self.result: Optional[Tuple[int, str, str]] = None
+        self.cancelled = False
+
+
+class AdbShellSession:
+    def __init__(self, adb_path: str, serial: str, log_cb: Optional[Callable[[str], None]] = None):
+        self.adb_path = adb_path
+        self.serial = serial
+        self._log_cb = log_cb
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._q: "queue.Queue[Optional[_Cmd]]" = queue.Queue()
+        self._n = 0
+        self._stop = threading.Event()
+        self._spawn_failed_at = 0.0
+        self.spawns = 0
+        self.commands = 0
+        self._thread = threading.Thread(target=self._loop, name=f"AdbShell-{serial}", daemon=True)
+        self._thread.start()
+
+    # ---------------- API ----------------
+    @property
+    def available(self) -> bool:
+        """False trong BACKOFF giây sau lần mở shell thất bại (caller nên dùng subprocess như cũ)."""
+        return (not self._stop.is_set()
+                and time.monotonic() - self._spawn_failed_at >= _SPAWN_BACKOFF_SEC)
+
+    def run(self, cmd: str, timeout: float = 8) -> Optional[Tuple[int, str, str]]:
+        """
+        Chạy 1 dòng lệnh shell, trả (code, out, err) như adb_safe.
+        None nếu lệnh CHƯA được gửi (session không dùng được) -> caller tự fallback.
+        Sau khi đã gửi mà shell chết giữa chừng thì trả (255, "", lý do), không chạy lại.
+        """
+        if not self.available:
+            return None
+        item = _Cmd(cmd, timeout)
+        self._q.put(item)
+        if not item.done.wait(timeout + 10):
+            item.cancelled = True
+            return item.result if item.done.is_set() else None
+        return item.result
+
+    def close(self):
+        self._stop.set()
+        self._q.put(None)
+        self._kill()
+
+    # ---------------- nội bộ ----------------
+    def _log(self, s: str):
+        if self._log_cb:
+            try:
+                self._log_cb(s)
+            except Exception:
+                pass
+
+    def _alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _kill(self):
+        p, self._proc = self._proc, None
+        if p is None:
+            return
+        try:
+            p.stdin.close()
+        except Exception:
+            pass
+        try:
+            p.kill()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _pump(stream, lines: queue.Queue):
+        try:
+            for raw in iter(stream.readline, b""):
+                lines.put(raw)
+        except Exception:
+            pass
+        lines.put(None)
+
+    def _spawn(self) -> bool:
+        self._kill()
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        try:
+            self._proc = subprocess.Popen([self.adb_path, "-s", self.serial, "shell"],
+                                          stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                          stderr=subprocess.STDOUT, bufsize=0, startupinfo=startupinfo)
+        except Exception as e:
+            self._log(f"[SHELL] không mở được adb shell: {e}")
+            self._proc = None
+            return False
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc.stdout, self._lines),
+                         name=f"AdbShellOut-{self.serial}", daemon=True).start()
+        try:
+            n = self._send("true")
+            code, _ = self._collect(n, time.monotonic() + 5.0)
+            return code == 0
+        except (OSError, _SessionBroken):
+            self._kill()
+            return False
+
+    def _send(self, cmd: str) -> int:
+        self._n += 1
+        n = self._n
+        script = f'( {cmd} ) </dev/null 2>&1; echo "__BB_""END__ {n} $?"\n'
+        self._proc.stdin.write(script.encode("utf-8"))
+        self._proc.stdin.flush()
+        return n
+
+    def _collect(self, n: int, deadline: float) -> Tuple[int, str]:
+        out = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _SessionBroken("timeout")
+            try:
+                raw = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                raise _SessionBroken("timeout")
+            if raw is None:
+                raise _SessionBroken("adb shell đã thoát")
+            line = raw.decode("utf-8", errors="ignore").replace("\r\n", "\n")
+            i = line.find(_SENTINEL + " ")
+            if i < 0:
+                out.append(line)
+                continue
+            parts = line[i:].split()
+            if len(parts) < 3 or parts[1] != str(n):
+                continue    # sentinel của lệnh cũ đã timeout
+            if i:
+                out.append(line[:i])   # output không có '\n' cuối dính vào sentinel
+            try:
+                code = int(parts[2])
+            except ValueError:
+                code = 255
+            return code, "".join(out)
+
+    def _run_item(self, item: _Cmd) -> Optional[Tuple[int, str, str]]:
+        for _ in range(2):
+            if not self._alive():
+                if not self._spawn():
+                    self._spawn_failed_at = time.monotonic()
+                    return None
+                self.spawns += 1
+            try:
+                n = self._send(item.cmd)
+            except OSError:
+                self._kill()        # chưa gửi được -> mở lại shell, thử thêm 1 lần
+                continue
+            try:
+                code, out = self._collect(n, item.deadline)
+                self.commands += 1
+                return code, out, ""
+            except _SessionBroken as e:
+                self._kill()
+                return (124 if str(e) == "timeout" else 255), "", str(e)
+        self._spawn_failed_at = time.monotonic()
+        return None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            item = self._q.get()
+            if item is None:
+                break
+            if item.cancelled:
+                item.done.set()
+                continue
+            if time.monotonic() >= item.deadline:
+                item.result = (124, "", "timeout")
+                item.done.set()
+                continue
+            try:
+                item.result = self._run_item(item)
+            except Exception as e:
+                self._kill()
+                item.result = (255, "", str(e))
+            item.done.set()
+        self._kill()
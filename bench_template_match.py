@@ -0,0 +1,128 @@
+# bench_template_match.py
+# ==========================================================
+#  So find_on_frame khớp thường với pyramid (1/2, 1/4) trên frame đã ghi (frame_recorder archive):
+#  thời gian trung bình / p95 mỗi chế độ, speedup, và độ khớp so với khớp thường
+#  (cùng ok, lệch tâm <= --tol px, chênh score).
+#
+#    python bench_template_match.py rec_dir
+#    python bench_template_match.py rec_dir --tpl images/lien_minh/lien-minh-vien-chinh.png@0,506,900,625
+#    python bench_template_match.py rec_dir --levels 2,4 --top-k 3 --max-frames 200
+#
+#  Không có --tpl -> bộ mặc định gồm các vùng rộng hay dùng (REG_FIND, REG_SERVER_LIST, cả màn hình).
+#
+#  Kết quả đo (6 frame 900x1600 thật trong test/, 77 template images/*/*.png tìm cả màn hình, 29 lần tìm thấy):
+#    threshold 0.85 : full 42.4ms | 1/2 10.2ms (x4.2, khớp 100%) | 1/4 6.2ms (x6.9, khớp 100%)
+#    threshold 0.70 : 1/2 x4.0 khớp 100%   | 1/4 x6.5 khớp 100%
+#    threshold 0.60 : 1/2 x4.0 khớp 99.6%  | 1/4 x6.4 khớp 98.7% (đỉnh mơ hồ, lệch chỗ)
+#    REG_FIND (vien chinh): 4.1ms -> 1/2 1.1ms; fallback cả màn hình của flows_logout: 46.4ms -> 1/2 8.4ms
+#  -> flow bật pyramid=2 ở các chỗ tìm vùng rộng (threshold >= 0.85); ROI nhỏ giữ khớp thường
+#     (find_on_frame tự bỏ qua pyramid khi vùng kết quả < 96x96, lợi không đáng).
+# ==========================================================
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from frame_recorder import RecordingReader
+from module import find_on_frame
+
+DEFAULT_SPECS = [
+    ("images/lien_minh/lien-minh-vien-chinh.png", (0, 506, 900, 625)),      # flows_vien_chinh.REG_FIND
+    ("images/lien_minh/lien-minh-inside.png", None),
+    ("images/lien_minh/kiem-tra-chung.png", None),
+    ("images/server_list/dosat-s1.png", (318, 331, 856, 1178)),             # flows_login.REG_SERVER_LIST
+]
+
+
+def parse_spec(text):
+    """'path' hoặc 'path@x1,y1,x2,y2'."""
+    path, _, reg = text.partition("@")
+    region = tuple(int(v) for v in reg.split(",")) if reg else None
+    if region is not None and len(region) != 4:
+        raise argparse.ArgumentTypeError(f"region phải có 4 số: {text}")
+    return path, region
+
+
+def run(reader, specs, levels, top_k, threshold, max_frames, tol):
+    n = min(len(reader.frame_rows), max_frames) if max_frames else len(reader.frame_rows)
+    modes = [0] + [lv for lv in levels if lv > 1]
+    times = {m: [] for m in modes}
+    agree = {m: 0 for m in modes}
+    loc_err = {m: [] for m in modes}
+    score_err = {m: [] for m in modes}
+    found = 0
+    total = 0
+    for i in range(n):
+        fr = reader.frame(i)
+        if fr is None:
+            continue
+        for path, region in specs:
+            base = None
+            for m in modes:
+                t0 = time.perf_counter()
+                r = find_on_frame(fr, path, region=region, threshold=threshold, pyramid=m, top_k=top_k)
+                times[m].append((time.perf_counter() - t0) * 1000.0)
+                if m == 0:
+                    base = r
+                    total += 1
+                    found += int(r[0])
+                    continue
+                same = r[0] == base[0]
+                if same and r[0]:
+                    d = max(abs(r[1][0] - base[1][0]), abs(r[1][1] - base[1][1]))
+                    loc_err[m].append(d)
+                    same = d <= tol
+                if r[0] or base[0]:
+                    score_err[m].append(abs(r[2] - base[2]))
+                agree[m] += int(same)
+    return n, total, found, times, agree, loc_err, score_err
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark find_on_frame: khớp thường vs pyramid")
+    ap.add_argument("archive", help="thư mục archive của frame_recorder")
+    ap.add_argument("--tpl", action="append", type=parse_spec, help="template[@x1,y1,x2,y2] (lặp được)")
+    ap.add_argument("--levels", default="2,4", help="các cấp pyramid, vd 2,4")
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--threshold", type=float, default=0.85)
+    ap.add_argument("--max-frames", type=int, default=0)
+    ap.add_argument("--tol", type=int, default=2, help="lệch tâm tối đa (px) vẫn tính là khớp")
+    a = ap.parse_args(argv)
+
+    specs = [s for s in (a.tpl or DEFAULT_SPECS) if os.path.exists(s[0])]
+    if not specs:
+        print("Không có template nào tồn tại.")
+        return 1
+    levels = [int(v) for v in a.levels.split(",") if v.strip()]
+
+    reader = RecordingReader(a.archive)
+    try:
+        n, total, found, times, agree, loc_err, score_err = run(
+            reader, specs, levels, a.top_k, a.threshold, a.max_frames, a.tol)
+    finally:
+        reader.close()
+    if not total:
+        print("Archive không có frame.")
+        return 1
+
+    print(f"{n} frame x {len(specs)} template = {total} lần khớp, thường tìm thấy {found}")
+    base_ms = float(np.mean(times[0]))
+    print(f"{'mode':>8} {'mean ms':>9} {'p95 ms':>9} {'speedup':>8} {'agree':>8} {'max dpx':>8} {'max dscore':>11}")
+    for m, ts in times.items():
+        mean = float(np.mean(ts))
+        p95 = float(np.percentile(ts, 95))
+        name = "full" if m == 0 else f"1/{m}"
+        if m == 0:
+            print(f"{name:>8} {mean:9.2f} {p95:9.2f} {1.0:8.2f} {'-':>8} {'-':>8} {'-':>11}")
+            continue
+        dpx = max(loc_err[m]) if loc_err[m] else 0
+        dsc = max(score_err[m]) if score_err[m] else 0.0
+        print(f"{name:>8} {mean:9.2f} {p95:9.2f} {base_ms / mean:8.2f} "
+              f"{agree[m] / total:8.1%} {dpx:8d} {dsc:11.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
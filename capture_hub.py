@@ -0,0 +1,401 @@
+# capture_hub.py
+# ==========================================================
+#  CaptureHub: 1 nơi lo chụp ảnh cho mọi máy đang chạy auto.
+#  - 1 thread điều phối + ThreadPoolExecutor giới hạn (BB_CAPTURE_HUB_WORKERS)
+#    thay cho mỗi máy 1 MinicapWorker thread riêng.
+#  - Socket stream minicap của mọi máy đọc chung bằng selectors (non-blocking).
+#  - Việc chặn (bootstrap, dựng/tắt stream, snapshot 'minicap -s') chạy trên pool,
+#    mỗi máy tối đa 1 việc cùng lúc, xếp lượt round-robin.
+#  - get_frame(serial): Frame đã decode (cache theo seq), grab_screen_np gọi qua wk.capture_hub.
+#  - export_shm(serial): publish thêm frame đã decode sang shared memory (shm_frames)
+#    cho runner chạy ở tiến trình con.
+# ==========================================================
+from __future__ import annotations
+
+import os
+import time
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from frame import Frame
+from minicap_worker import MinicapWorker, StreamParser, _StreamDropped
+from shm_frames import ShmFrameWriter, shm_name_for
+
+_RECV_CHUNK = 256 * 1024
+_FPS_WINDOW = 5.0          # giây, cửa sổ tính fps
+_BOOT_RETRY_SEC = 5.0
+
+
+class _Device:
+    """Trạng thái 1 máy trong hub (chỉ thread điều phối sửa, trừ phần cache decode)."""
+
+    def __init__(self, worker: MinicapWorker, target_fps: float):
+        self.worker = worker
+        self.target_fps = target_fps
+        self.ready = False                 # đã bootstrap xong
+        self.job: Optional[Future] = None
+        self.job_kind = ""
+        self.job_t0 = 0.0
+        self.next_boot = 0.0
+        self.next_snap = 0.0
+        self.stream_retry_at = 0.0
+        self.sock = None
+        self.parser: Optional[StreamParser] = None
+        # cache decode cho get_frame
+        self.frame: Optional[Frame] = None
+        self.frame_lock = threading.Lock()
+        # thống kê
+        self.pub_ts = deque(maxlen=512)
+        self.frames = 0
+        self.drops = 0
+        self.decode_ms = 0.0
+        self.snap_ms = 0.0
+        self.stream_drops = 0
+        # shared memory cho tiến trình con (export_shm)
+        self.shm: Optional[ShmFrameWriter] = None
+        self.shm_job: Optional[Future] = None
+        self.shm_seq = 0
+        self.shm_demand = 0
+        self.shm_drops = 0
+
+    @property
+    def mode(self) -> str:
+        if not self.ready:
+            return "boot"
+        if self.sock is not None:
+            return "stream"
+        if self.worker.demand_state() == "paused":
+            return "paused"
+        return "snapshot"
+
+
+def _ema(old: float, new: float, k: float = 0.2) -> float:
+    return new if old <= 0 else old + k * (new - old)
+
+
+class CaptureHub:
+    def __init__(self, max_workers: Optional[int] = None, target_fps: Optional[float] = None):
+        if max_workers is None:
+            max_workers = int(os.environ.get("BB_CAPTURE_HUB_WORKERS", str(min(8, (os.cpu_count() or 2)))))
+        self.max_workers = max(1, int(max_workers))
+        self.target_fps = float(os.environ.get("BB_CAPTURE_FPS", "15") if target_fps is None else target_fps)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="CaptureHub")
+        self._sel = selectors.DefaultSelector()
+        self._devices: Dict[str, _Device] = {}
+        self._order: List[str] = []
+        self._rr = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------- API ----------------
+    def register(self, adb_path: str, serial: str, mailbox_dir: Path,
+                 virt_size=(900, 1600), jpeg_quality: int = 100,
+                 target_fps: Optional[float] = None) -> MinicapWorker:
+        """
+        Thêm máy vào hub, trả MinicapWorker (không start thread) để flows dùng ring/wait_newer như cũ.
+        Đăng ký lại serial đang có thì trả worker cũ.
+        """
+        with self._lock:
+            dev = self._devices.get(serial)
+            if dev is not None:
+                return dev.worker
+            worker = MinicapWorker(adb_path, serial, mailbox_dir,
+                                   virt_size=virt_size, jpeg_quality=jpeg_quality)
+            fps = self.target_fps if target_fps is None else float(target_fps)
+            self._devices[serial] = _Device(worker, fps)
+            self._order.append(serial)
+        self._ensure_thread()
+        return worker
+
+    def unregister(self, serial: str):
+        """Bỏ máy khỏi hub, tắt stream (chạy trên pool, không chặn caller)."""
+        with self._lock:
+            dev = self._devices.pop(serial, None)
+            if serial in self._order:
+                self._order.remove(serial)
+        if dev is None:
+            return
+        dev.worker.request_stop()
+        self._unwatch(dev)
+        if dev.shm is not None:
+            dev.shm.close(unlink=True)
+            dev.shm = None
+        try:
+            self._pool.submit(dev.worker._stop_stream)
+        except RuntimeError:
+            pass
+
+    def export_shm(self, serial: str, name: Optional[str] = None) -> Optional[str]:
+        """
+        Bật publish frame đã decode của máy sang shared memory; trả tên vùng nhớ để tiến trình con
+        mở bằng ShmFrameReader(name). Reader.touch() được tính như flow đang cần frame.
+        """
+        dev = self._devices.get(serial)
+        if dev is None:
+            return None
+        if dev.shm is None:
+            w = dev.worker
+            dev.shm = ShmFrameWriter(name or shm_name_for(serial), width=w.virt_w, height=w.virt_h)
+        return dev.shm.name
+
+    def set_target_fps(self, serial: str, fps: float):
+        dev = self._devices.get(serial)
+        if dev is not None:
+            dev.target_fps = float(fps)
+
+    def worker(self, serial: str) -> Optional[MinicapWorker]:
+        dev = self._devices.get(serial)
+        return dev.worker if dev else None
+
+    def get_frame(self, serial: str, max_age: Optional[float] = None,
+                  timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        Frame hiện tại của máy (decode 1 lần / seq, dùng chung cache gray/HSV).
+        None nếu serial chưa đăng ký hoặc chưa kịp có frame -> caller fallback screencap.
+        """
+        dev = self._devices.get(serial)
+        if dev is None:
+            return None
+        if max_age is None:
+            max_age = float(os.environ.get("BB_FRAME_MAX_AGE", "0.5"))
+        if timeout is None:
+            timeout = float(os.environ.get("BB_FRAME_WAKE_WAIT", "1.5"))
+        ent = dev.worker.current(max_age=max_age, timeout=timeout)
+        if ent is None or not ent.data:
+            return None
+        with dev.frame_lock:
+            if dev.frame is not None and dev.frame.seq == ent.seq:
+                return dev.frame
+            t0 = time.perf_counter()
+            img = cv2.imdecode(np.frombuffer(ent.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return None
+            dev.decode_ms = _ema(dev.decode_ms, (time.perf_counter() - t0) * 1000.0)
+            dev.frame = Frame(img, seq=ent.seq, ts=ent.ts)
+            return dev.frame
+
+    def stats(self) -> Dict[str, dict]:
+        """{serial: {mode, fps, frames, drops, stream_drops, decode_ms, snap_ms, target_fps}}"""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            devices = list(self._devices.items())
+        for serial, dev in devices:
+            recent = sum(1 for t in list(dev.pub_ts) if now - t <= _FPS_WINDOW)
+            out[serial] = {
+                "mode": dev.mode,
+                "fps": round(recent / _FPS_WINDOW, 2),
+                "frames": dev.frames,
+                "drops": dev.drops,
+                "stream_drops": dev.stream_drops,
+                "decode_ms": round(dev.decode_ms, 2),
+                "snap_ms": round(dev.snap_ms, 1),
+                "target_fps": dev.target_fps,
+            }
+            if dev.shm is not None:
+                out[serial]["shm"] = dev.shm.name
+                out[serial]["shm_drops"] = dev.shm_drops
+        return out
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            serials = list(self._order)
+        for s in serials:
+            self.unregister(s)
+        if self._thread is not None:
+            self._thread.join(timeout=3)
+        self._pool.shutdown(wait=False)
+
+    # ---------------- điều phối ----------------
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="CaptureHub-sched", daemon=True)
+                self._thread.start()
+
+    def _submit(self, dev: _Device, kind: str, fn, *args):
+        dev.job_kind = kind
+        dev.job_t0 = time.monotonic()
+        dev.job = self._pool.submit(fn, *args)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                order = list(self._order)
+                devices = [self._devices[s] for s in order]
+            if devices:
+                # xoay điểm bắt đầu mỗi vòng để máy đầu danh sách không luôn được xếp hàng trước
+                start = self._rr % len(devices)
+                self._rr += 1
+                for dev in devices[start:] + devices[:start]:
+                    try:
+                        self._step(dev)
+                    except Exception:
+                        pass
+            if self._sel.get_map():
+                try:
+                    events = self._sel.select(timeout=0.05)
+                except OSError:
+                    events = []
+                for key, _ in events:
+                    self._drain(key.data)
+            else:
+                self._stop.wait(0.05)
+
+    def _step(self, dev: _Device):
+        w = dev.worker
+        now = time.monotonic()
+        if dev.shm is not None:
+            demand = dev.shm.demand_count()
+            if demand != dev.shm_demand:
+                dev.shm_demand = demand
+                w.touch()
+            self._export_latest(dev)
+
+        if dev.job is not None:
+            if not dev.job.done():
+                return
+            self._finish_job(dev, now)
+
+        if not dev.ready:
+            if now >= dev.next_boot:
+                self._submit(dev, "boot", w.bootstrap)
+            return
+
+        state = w.demand_state()
+        if state == "paused":
+            if dev.sock is not None:
+                self._close_stream(dev, retry_after=0.0)
+            return
+
+        if dev.sock is not None:
+            return
+        if w.use_stream and now >= dev.stream_retry_at:
+            self._submit(dev, "open", self._open_stream_job, w)
+            return
+        if now >= dev.next_snap:
+            self._submit(dev, "snap", w.snapshot_once, w.remote_bin, w.proj)
+
+    def _finish_job(self, dev: _Device, now: float):
+        kind, fut = dev.job_kind, dev.job
+        dev.job = None
+        try:
+            res = fut.result()
+        except Exception:
+            res = None
+        w = dev.worker
+        if kind == "boot":
+            if res:
+                dev.ready = True
+            else:
+                dev.next_boot = now + _BOOT_RETRY_SEC
+        elif kind == "open":
+            if res and w._stream_sock is not None:
+                sock = w._stream_sock
+                try:
+                    sock.setblocking(False)
+                    self._sel.register(sock, selectors.EVENT_READ, dev)
+                    dev.sock = sock
+                    dev.parser = StreamParser()
+                except Exception:
+                    self._close_stream(dev, retry_after=w.stream_retry_sec)
+            else:
+                # không dựng được stream -> snapshot một lúc rồi thử lại
+                dev.stream_retry_at = now + w.stream_retry_sec
+        elif kind == "snap":
+            dev.snap_ms = _ema(dev.snap_ms, (now - dev.job_t0) * 1000.0)
+            if res:
+                dev.frames += 1
+                dev.pub_ts.append(now)
+            state = w.demand_state()
+            fps = dev.target_fps if state == "active" else w.idle_fps
+            interval = (1.0 / fps) if fps > 0 else 0.0
+            dev.next_snap = dev.job_t0 + max(interval, 0.05) if res else now + 0.2
+
+    def _export_latest(self, dev: _Device):
+        """Decode frame mới nhất trên pool rồi ghi sang shm; đang bận thì bỏ lượt (đếm shm_drops)."""
+        ent = dev.worker.ring.latest()
+        if ent is None or ent.seq == dev.shm_seq:
+            return
+        if dev.shm_job is not None and not dev.shm_job.done():
+            return
+        if dev.shm_job is not None and ent.seq > dev.shm_seq + 1:
+            dev.shm_drops += ent.seq - dev.shm_seq - 1
+        dev.shm_seq = ent.seq
+        dev.shm_job = self._pool.submit(self._shm_job, dev, ent)
+
+    def _shm_job(self, dev: _Device, ent):
+        img = cv2.imdecode(np.frombuffer(ent.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        shm = dev.shm
+        if img is not None and shm is not None:
+            shm.publish(img, seq=ent.seq, ts=ent.ts)
+
+    def _open_stream_job(self, w: MinicapWorker) -> bool:
+        if w._start_stream(w.remote_bin, w.proj):
+            return True
+        w._stop_stream()
+        return False
+
+    def _unwatch(self, dev: _Device):
+        if dev.sock is not None:
+            try:
+                self._sel.unregister(dev.sock)
+            except Exception:
+                pass
+            dev.sock = None
+            dev.parser = None
+
+    def _close_stream(self, dev: _Device, retry_after: float):
+        """Gỡ socket khỏi selector và tắt minicap/forward trên pool."""
+        self._unwatch(dev)
+        dev.stream_retry_at = time.monotonic() + retry_after
+        self._submit(dev, "close", dev.worker._stop_stream)
+
+    def _drain(self, dev: _Device):
+        sock = dev.sock
+        if sock is None:
+            return
+        try:
+            data = sock.recv(_RECV_CHUNK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            dev.stream_drops += 1
+            self._close_stream(dev, retry_after=dev.worker.stream_retry_sec)
+            return
+        try:
+            payloads = dev.parser.feed(data)
+        except _StreamDropped:
+            dev.stream_drops += 1
+            self._close_stream(dev, retry_after=dev.worker.stream_retry_sec)
+            return
+        for payload in payloads:
+            if dev.worker.offer_frame(payload, max_fps=dev.target_fps):
+                dev.frames += 1
+                dev.pub_ts.append(time.monotonic())
+            else:
+                dev.drops += 1
+
+
+_HUB: Optional[CaptureHub] = None
+_HUB_LOCK = threading.Lock()
+
+
+def get_hub() -> CaptureHub:
+    """Hub dùng chung cho cả tiến trình (tạo lười)."""
+    global _HUB
+    with _HUB_LOCK:
+        if _HUB is None:
+            _HUB = CaptureHub()
+        return _HUB
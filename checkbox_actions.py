@@ -24,6 +24,13 @@ from flows_chuc_phuc import run_bless_flow
 from ui_auth import CloudClient
 from utils_crypto import decrypt
 from minicap_worker import MinicapWorker
+from capture_hub import get_hub
+from frame_recorder import FrameRecorder
+from adb_shell_session import AdbShellSession
+from adb_client import get_client as get_adb_client
+from adb_cache import get_cache as get_query_cache
+from foreground_watcher import ForegroundWatcher
+from adb_scheduler import run_scheduled
 
 GAME_PKG = "com.phsgdbz.vn"
 GAME_ACT = "com.phsgdbz.vn/org.cocos2dx.javascript.GameTwActivity"
@@ -231,16 +238,45 @@ class SimpleNoxWorker:
         except Exception as e:
             return 125, b"", str(e).encode()
 
-    def adb(self, *args, timeout=8):
+    def _run_client(self, args, timeout, text):
+        """Chạy qua adb_client (socket tới adb server, không spawn adb.exe); None -> dùng subprocess."""
+        cli = get_adb_client()
+        if cli is None:
+            return None
+        try:
+            return cli.run_args(self._serial, args, timeout=timeout, text=text)
+        except Exception:
+            return None
+
+    def _adb_direct(self, args, timeout):
+        res = self._run_client(args, timeout, True)
+        if res is not None:
+            return res
         return self._run(list(args), timeout=timeout, text=True)
 
-    def adb_bin(self, *args, timeout=8):
+    def _adb_bin_direct(self, args, timeout):
+        res = self._run_client(args, timeout, False)
+        if res is not None:
+            return res
         return self._run_raw(list(args), timeout=timeout)
 
+    def adb(self, *args, timeout=8):
+        # xếp hàng theo máy: tap/swipe đi trước dumpsys/pidof khi nhiều lệnh cùng chờ
+        return run_scheduled(self._serial, self._adb_direct, args, timeout, (124, "", "timeout"))
+
+    def adb_bin(self, *args, timeout=8):
+        return run_scheduled(self._serial, self._adb_bin_direct, args, timeout, (124, b"", b"timeout"))
+
     def app_in_foreground(self, pkg: str) -> bool:
+        fw = getattr(self, "fg_watcher", None)
+        comp = fw.top_component() if fw is not None else None
+        if comp is not None:
+            return pkg in comp
         code, out, _ = self.adb("shell", "cmd", "activity", "get-foreground-activity", timeout=6)
         if code == 0 and out and "ComponentInfo{" in out:
             comp = out.split("ComponentInfo{", 1)[1].split("}", 1)[0]
+            if fw is not None:
+                fw.seed(comp)
             return pkg in comp
         return False
 
@@ -290,15 +326,26 @@ class AccountRunner(QObject, threading.Thread):
             if use_minicap:
                 mailbox = Path("frame_mailbox") / self.device_id.replace(":", "_")
                 jpeg_q = int(os.environ.get("BB_MINICAP_Q", "100"))
-                self.minicap = MinicapWorker(self.adb_path, self.device_id, mailbox,
-                                             virt_size=(SCREEN_W, SCREEN_H), jpeg_quality=jpeg_q)
-                self.minicap.start()
+                self.capture_hub = None
+                if os.environ.get("BB_CAPTURE_HUB", "0") in ("1", "true", "True"):
+                    # 1 hub chung cho mọi máy: pool giới hạn thay vì mỗi máy 1 thread chụp
+                    self.capture_hub = get_hub()
+                    self.minicap = self.capture_hub.register(self.adb_path, self.device_id, mailbox,
+                                                             virt_size=(SCREEN_W, SCREEN_H),
+                                                             jpeg_quality=jpeg_q)
+                    setattr(self.wk, "capture_hub", self.capture_hub)
+                else:
+                    self.minicap = MinicapWorker(self.adb_path, self.device_id, mailbox,
+                                                 virt_size=(SCREEN_W, SCREEN_H), jpeg_quality=jpeg_q)
+                    self.minicap.start()
 
                 def _fetcher():
                     return self.minicap.read_latest_frame()
 
                 setattr(self.wk, "frame_fetcher", _fetcher)
-                self.log("MinicapWorker đã khởi động, dùng mailbox ảnh thay cho screencap.")
+                # grab_screen_np đọc thẳng ring buffer (latest()/get(seq)) của worker
+                setattr(self.wk, "minicap", self.minicap)
+                self.log("MinicapWorker đã khởi động, dùng ring buffer ảnh thay cho screencap.")
             else:
                 self.minicap = None
                 self.log("BB_MINICAP=0 => dùng screencap ADB như logic gốc.")
@@ -306,15 +353,74 @@ class AccountRunner(QObject, threading.Thread):
             self.log(f"MinicapWorker khởi động thất bại: {_e}. Sẽ fallback screencap như cũ.")
             self.minicap = None
 
+        # --- adb shell sống lâu cho lệnh input (adb_safe tự dùng nếu có) ---
+        self.shell_session = None
+        if os.environ.get("BB_SHELL_SESSION", "1") not in ("0", "false", "False"):
+            try:
+                self.shell_session = AdbShellSession(self.adb_path, self.device_id,
+                                                     log_cb=lambda s: _ui_log(ctrl, device_id, s))
+                setattr(self.wk, "shell_session", self.shell_session)
+            except Exception as _e:
+                self.log(f"Không mở được adb shell session: {_e}")
+                self.shell_session = None
+
+        # --- Activity foreground theo logcat events (state_simple / app_in_foreground chỉ tra bộ nhớ) ---
+        self.fg_watcher = None
+        if os.environ.get("BB_FG_WATCHER", "1") not in ("0", "false", "False"):
+            try:
+                self.fg_watcher = ForegroundWatcher.for_serial(self.adb_path, self.device_id,
+                                                               log_cb=lambda s: _ui_log(ctrl, device_id, s))
+                setattr(self.wk, "fg_watcher", self.fg_watcher)
+            except Exception as _e:
+                self.log(f"Không mở được foreground watcher: {_e}")
+                self.fg_watcher = None
+
+        # --- Ghi lại frame + lệnh input để replay offline (frame_recorder) ---
+        self.recorder = None
+        rec_dir = os.environ.get("BB_RECORD_DIR")
+        if rec_dir:
+            try:
+                name = f"{self.device_id.replace(':', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                self.recorder = FrameRecorder(Path(rec_dir) / name)
+                setattr(self.wk, "recorder", self.recorder)
+                self.log(f"Đang ghi frame/lệnh input vào {Path(rec_dir) / name}")
+            except Exception as _e:
+                self.log(f"Không mở được recorder: {_e}")
+                self.recorder = None
+
     def request_stop(self):
         self.stop_evt.set()
         self._stop.set()
         setattr(self.wk, "_abort", True)
         try:
-            if getattr(self, "minicap", None):
+            if getattr(self, "capture_hub", None):
+                st = self.capture_hub.stats().get(self.device_id)
+                if st:
+                    self.log(f"[FRAME] hub: mode={st['mode']}, fps={st['fps']}, frames={st['frames']}, "
+                             f"drops={st['drops']}, decode={st['decode_ms']}ms")
+                self.capture_hub.unregister(self.device_id)
+            elif getattr(self, "minicap", None):
                 self.minicap.request_stop()
         except Exception:
             pass
+        if getattr(self, "shell_session", None):
+            sess, self.shell_session = self.shell_session, None
+            setattr(self.wk, "shell_session", None)
+            sess.close()
+        if getattr(self, "fg_watcher", None):
+            fw, self.fg_watcher = self.fg_watcher, None
+            setattr(self.wk, "fg_watcher", None)
+            fw.release()
+        if getattr(self, "recorder", None):
+            rec, self.recorder = self.recorder, None
+            setattr(self.wk, "recorder", None)
+            self.log(f"[REC] đã ghi {rec.frames} frame, {rec.events} lệnh input")
+            rec.close()
+        try:
+            st = get_query_cache().stats()
+            self.log(f"[CACHE] adb query: hits={st['hits']}, misses={st['misses']}, entries={st['entries']}")
+        except Exception:
+            pass
         try:
             mc = getattr(self, "_stats_minicap", 0)
             sc = getattr(self, "_stats_screencap", 0)
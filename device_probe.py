@@ -0,0 +1,70 @@
+# device_probe.py
+# ==========================================================
+#  Gộp các lệnh kiểm tra sức khoẻ máy ảo mỗi tick (getprop boot_completed, pidof game,
+#  dumpsys activity/window, trạng thái màn hình, wm size) vào 1 script shell duy nhất
+#  -> 1 lần gọi adb thay cho 5-7 tiến trình/máy/tick.
+#  Output mỗi dòng 'key=value', dòng cuối 'end=1' để biết record đầy đủ:
+#     boot=1 | pid=1234 | fg=<dòng topResumedActivity/mCurrentFocus> | power=mWakefulness=Awake
+#     size=Physical size: 900x1600 | end=1
+#  dumpsys chỉ grep 1 dòng ngay trên máy (không kéo vài chục KB về host).
+#  Máy không chạy game (package=None) chỉ probe boot= + end=: rẻ như getprop cũ,
+#  không dumpsys/wm size trên máy rảnh.
+# ==========================================================
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+_RE_COMPONENT = re.compile(r"([a-zA-Z0-9_.]+/[a-zA-Z0-9_.$]+)")
+_RE_SIZE = re.compile(r"(\d+)x(\d+)")
+
+
+def probe_script(package: Optional[str], with_foreground: bool = True) -> str:
+    """
+    Script 1 dòng cho 'adb shell'. with_foreground=False khi đã có foreground_watcher.
+    package=None -> chỉ boot (máy không được yêu cầu chạy game).
+    """
+    parts = ['echo "boot=$(getprop sys.boot_completed)"']
+    if package:
+        parts.append(f'echo "pid=$(pidof {package})"')
+        if with_foreground:
+            parts.append("a=$(dumpsys activity activities | grep -m1 -E 'topResumedActivity|mResumedActivity')")
+            parts.append("[ -n \"$a\" ] || a=$(dumpsys window windows | grep -m1 -E 'mCurrentFocus|mFocusedApp')")
+            parts.append('echo "fg=$a"')
+        parts.append('echo "power=$(dumpsys power | grep -m1 mWakefulness=)"')
+        parts.append('echo "size=$(wm size | tail -n1)"')
+    parts.append('echo "end=1"')
+    return "; ".join(parts)
+
+
+def parse_probe(text: str) -> Optional[dict]:
+    """
+    Output probe_script -> {"boot": bool, "full": bool, "pid": int|None, "foreground": str|None,
+                            "screen_on": bool|None, "size": (w, h)|None}.
+    full=False: script chỉ có boot (package=None), pid/foreground None nghĩa là "không hỏi",
+    không phải "game không chạy". None nếu thiếu dòng 'end=1' (script bị cắt / lỗi).
+    """
+    kv = {}
+    for line in (text or "").splitlines():
+        key, sep, value = line.strip().partition("=")
+        if sep:
+            kv[key] = value.strip()
+    if kv.get("end") != "1":
+        return None
+    pid = None
+    for tok in kv.get("pid", "").split():
+        if tok.isdigit():
+            pid = int(tok)
+            break
+    m = _RE_COMPONENT.search(kv.get("fg", ""))
+    power = kv.get("power", "")
+    screen_on = True if "Awake" in power else (False if power else None)
+    ms = _RE_SIZE.search(kv.get("size", ""))
+    return {
+        "boot": kv.get("boot") == "1",
+        "full": "pid" in kv,
+        "pid": pid,
+        "foreground": m.group(1) if m else None,
+        "screen_on": screen_on,
+        "size": (int(ms.group(1)), int(ms.group(2))) if ms else None,
+    }
@@ -0,0 +1,115 @@
+# device_watcher.py
+# ==========================================================
+#  Theo dõi danh sách máy ảo bằng 'host:track-devices' của adb server (adb_client),
+#  thay cho việc spawn 'adb devices' mỗi 5 giây trên GUI thread.
+#  - 1 thread nền giữ kết nối track-devices; server đẩy bản đầy đủ mỗi khi có thay đổi
+#    (bản đầu tiên = lần quét lúc khởi động).
+#  - Giữ map {device_id: "LDPlayer - device"} và chỉ emit signal khi map thật sự đổi.
+#  - Không nối được adb server (chưa chạy / BB_ADB_CLIENT=0) -> gọi fallback_scan()
+#    (list_adb_ports_with_status: spawn adb devices, tiện thể khởi động server) rồi thử lại sau.
+#  Signal được emit từ thread nền -> Qt tự chuyển (queued) sang GUI thread.
+# ==========================================================
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Optional
+
+from PySide6.QtCore import QObject, Signal
+
+from adb_client import get_client as get_adb_client
+from adb_cache import get_cache
+
+_RETRY_SEC = 5.0
+
+
+def is_emulator_serial(serial: str) -> bool:
+    return "emulator-" in serial or "127.0.0.1:" in serial
+
+
+class DeviceWatcher(QObject):
+    devicesChanged = Signal(dict)           # map đầy đủ {device_id: "Tên - Trạng thái"}
+    deviceAdded = Signal(str, str)          # device_id, trạng thái
+    deviceRemoved = Signal(str)             # device_id
+    deviceStateChanged = Signal(str, str)   # device_id, trạng thái mới
+
+    def __init__(self, label: str = "LDPlayer",
+                 fallback_scan: Optional[Callable[[], Dict[str, str]]] = None, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.fallback_scan = fallback_scan
+        self._map: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.updates = 0
+
+    # ---------------- API ----------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="DeviceWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._map)
+
+    # ---------------- nội bộ ----------------
+    def _apply(self, new_map: Dict[str, str]):
+        """So với map cũ, emit signal cho từng thay đổi + 1 devicesChanged nếu có đổi."""
+        with self._lock:
+            old = self._map
+            if new_map == old:
+                return
+            self._map = dict(new_map)
+            self.updates += 1
+        cli = get_adb_client()
+        cache = get_cache()
+        for did, full in new_map.items():
+            status = full.split(" - ")[-1]
+            if did not in old:
+                cache.invalidate(did)
+                self.deviceAdded.emit(did, status)
+            elif old[did] != full:
+                if cli is not None:
+                    cli.forget(did)     # máy reconnect -> features / wm size... có thể đã đổi
+                cache.invalidate(did)
+                self.deviceStateChanged.emit(did, status)
+        for did in old:
+            if did not in new_map:
+                if cli is not None:
+                    cli.forget(did)
+                cache.invalidate(did)
+                self.deviceRemoved.emit(did)
+        self.devicesChanged.emit(dict(new_map))
+
+    def _to_map(self, pairs) -> Dict[str, str]:
+        return {serial: f"{self.label} - {state}" for serial, state in pairs if is_emulator_serial(serial)}
+
+    def _scan_fallback(self):
+        if self.fallback_scan is None:
+            return
+        try:
+            self._apply(self.fallback_scan())
+        except Exception as e:
+            print(f"[DeviceWatcher] quét adb devices lỗi: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            cli = get_adb_client()
+            if cli is None:
+                self._scan_fallback()
+                self._stop.wait(_RETRY_SEC)
+                continue
+            try:
+                for pairs in cli.track_devices(self._stop):
+                    self._apply(self._to_map(pairs))
+            except Exception as e:
+                # server chưa chạy / bị kill -> 'adb devices' sẽ khởi động lại server
+                print(f"[DeviceWatcher] track-devices ngắt: {e}")
+                self._scan_fallback()
+            self._stop.wait(_RETRY_SEC)
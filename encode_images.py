@@ -1,8 +1,13 @@
 # encode_images.py
+# Mặc định: compile images/**/*.png thành atlas nhị phân images.atlas (template_atlas: pixel đã giải mã,
+# mmap không copy). Thêm --py để ghi thêm image_data.py base64 kiểu cũ (bản dự phòng khi thiếu atlas).
 import os
+import sys
 import base64
 from pathlib import Path
 
+from template_atlas import compile_atlas, ATLAS_FILE
+
 # Thư mục chứa tất cả các ảnh của bạn
 IMAGE_SOURCE_DIR = "images"
 # File Python đầu ra sẽ chứa dữ liệu ảnh đã mã hóa
@@ -53,5 +58,13 @@ def encode_images_to_py():
     print(f"\n✅ Hoàn tất! Đã lưu dữ liệu vào file '{OUTPUT_PY_FILE}'")
 
 
+def compile_images_atlas():
+    header = compile_atlas(IMAGE_SOURCE_DIR, ATLAS_FILE)
+    size_mb = Path(ATLAS_FILE).stat().st_size / 1048576.0
+    print(f"✅ Đã ghi {len(header)} template vào '{ATLAS_FILE}' ({size_mb:.1f} MB)")
+
+
 if __name__ == "__main__":
-    encode_images_to_py()
\ No newline at end of file
+    compile_images_atlas()
+    if "--py" in sys.argv[1:]:
+        encode_images_to_py()
\ No newline at end of file
@@ -2,7 +2,7 @@
 """
 flows_chuc_phuc.py
 Flow chúc phúc: chỉ dùng phương án 2 (fallback) lặp đến khi thấy bảng xếp hạng.
-Vuốt chậm (dur_ms tăng), delay 1.5s sau các thao tác tap/gesture, OCR bỏ dấu + non-alnum.
+Vuốt chậm (dur_ms tăng); sau mỗi tap chỉ xét frame chụp SAU thao tác (tối đa 1.5s), OCR bỏ dấu + non-alnum.
 """
 
 from __future__ import annotations
@@ -13,8 +13,8 @@ import unicodedata
 import re
 
 from module import (
-    grab_screen_np, find_on_frame, tap, tap_center, swipe,
-    sleep_coop, free_img, adb_safe, ocr_region,
+    grab_screen_np, find_on_frame, find_many_on_frame, tap, tap_center, swipe,
+    sleep_coop, free_img, adb_safe, ocr_region, find_after_action, aborted, input_batch,
     log_wk as _log,resource_path,
 )
 
@@ -53,6 +53,7 @@ THR_BTN  = 0.85
 WAIT_PAIR_ICONS_SEC = 15
 SCROLL_LIMIT = 10
 SWIPE_DUR_MS = 1500  # vuốt chậm & ổn định; chỉnh theo ý nếu cần
+POST_TAP_WAIT = 1.5  # tối đa chờ UI phản hồi sau tap (trước đây ngủ cứng 1.5s)
 TAP_THIRD = (366, 83)
 # ---------------- Logging helper ----------------
 def L(wk, msg: str):
@@ -98,8 +99,9 @@ def _key_back(wk):
 def _both_icons_present(wk) -> bool:
     img = grab_screen_np(wk)
     try:
-        ok1, pos1, _ = find_on_frame(img, IMG_MENU, region=REG_MENU, threshold=THR_MENU)
-        ok2, pos2, _ = find_on_frame(img, IMG_GUILD_OUT, region=REG_GUILD_OUT, threshold=THR_GUILD)
+        hits = find_many_on_frame(img, [(IMG_MENU, REG_MENU, THR_MENU), (IMG_GUILD_OUT, REG_GUILD_OUT, THR_GUILD)])
+        ok1, pos1 = hits[IMG_MENU]["ok"], hits[IMG_MENU]["pt"]
+        ok2, pos2 = hits[IMG_GUILD_OUT]["ok"], hits[IMG_GUILD_OUT]["pt"]
         L(wk, f"Check icons → menu: {ok1} pos={pos1} | guild: {ok2} pos={pos2}")
         return ok1 and ok2
     finally:
@@ -110,10 +112,10 @@ def _open_ranking_loop(wk) -> bool:
     """
     Chỉ dùng phương án 2, lặp đến khi thấy bang-xep-hang:
       - Chờ thấy cả nut-menu & lien-minh-outside
-      - bấm nut-menu (ưu tiên theo template; nếu không → tọa độ fallback) → đợi 1.5s
-      - tìm & bấm nut-xep-hang (REG_BTN_RANK) → đợi 1.5s
-      - tìm & bấm lien-server (REG_BTN_SERVER) → đợi 1.5s
-      - kiểm tra bang-xep-hang (REG_RANK)
+      - bấm nut-menu (ưu tiên theo template; nếu không → tọa độ fallback)
+      - tìm & bấm nut-xep-hang (REG_BTN_RANK) trên frame chụp sau tap (tối đa 1.5s)
+      - tìm & bấm lien-server (REG_BTN_SERVER) trên frame chụp sau tap (tối đa 1.5s)
+      - kiểm tra bang-xep-hang (REG_RANK) trên frame chụp sau tap (tối đa 1.5s)
     """
     L(wk, "Open ranking (phương án 2) bắt đầu…")
     loops = 0
@@ -136,45 +138,32 @@ def _open_ranking_loop(wk) -> bool:
         finally:
             free_img(img)
         if okm and posm:
-            tap(wk, *posm); L(wk, f"Tap MENU tại {posm}")
+            t_act = tap(wk, *posm); L(wk, f"Tap MENU tại {posm}")
         else:
-            tap(wk, 30, 630); L(wk, "Tap MENU fallback (30,630)")
-        if not sleep_coop(wk, 1.5):  # đợi sau tap
-            return False
+            t_act = tap(wk, 30, 630); L(wk, "Tap MENU fallback (30,630)")
 
-        # bấm nut-xep-hang
-        img = grab_screen_np(wk)
-        try:
-            ok, pos, _ = find_on_frame(img, IMG_BTN_RANK, region=REG_BTN_RANK, threshold=THR_BTN)
-            L(wk, f"Find BTN_RANK → ok={ok} pos={pos}")
-        finally:
-            free_img(img)
+        # bấm nut-xep-hang (chỉ xét frame chụp sau tap MENU)
+        ok, pos, _ = find_after_action(wk, t_act, IMG_BTN_RANK, region=REG_BTN_RANK,
+                                       thr=THR_BTN, timeout=POST_TAP_WAIT)
+        L(wk, f"Find BTN_RANK → ok={ok} pos={pos}")
         if ok and pos:
-            tap(wk, *pos); L(wk, f"Tap 'xếp hạng' tại {pos}")
-            if not sleep_coop(wk, 1.5):  # đợi sau tap
-                return False
+            t_act = tap(wk, *pos); L(wk, f"Tap 'xếp hạng' tại {pos}")
 
             # bấm lien-server
-            img = grab_screen_np(wk)
-            try:
-                oks, poss, _ = find_on_frame(img, IMG_BTN_SERVER, region=REG_BTN_SERVER, threshold=THR_BTN)
-                L(wk, f"Find BTN_SERVER → ok={oks} pos={poss}")
-            finally:
-                free_img(img)
+            oks, poss, _ = find_after_action(wk, t_act, IMG_BTN_SERVER, region=REG_BTN_SERVER,
+                                             thr=THR_BTN, timeout=POST_TAP_WAIT)
+            L(wk, f"Find BTN_SERVER → ok={oks} pos={poss}")
             if oks and poss:
-                tap(wk, *poss); L(wk, f"Tap 'liên server' tại {poss}")
-                if not sleep_coop(wk, 1.5):  # đợi sau tap
-                    return False
+                t_act = tap(wk, *poss); L(wk, f"Tap 'liên server' tại {poss}")
         else:
             L(wk, "Không thấy nút 'xếp hạng' trong REG_BTN_RANK — lặp lại.")
 
         # kiểm tra bang-xep-hang
-        img = grab_screen_np(wk)
-        try:
-            okr, posr, _ = find_on_frame(img, IMG_RANK, region=REG_RANK, threshold=THR_RANK)
-            L(wk, f"Find RANK → ok={okr} pos={posr}")
-        finally:
-            free_img(img)
+        okr, posr, _ = find_after_action(wk, t_act, IMG_RANK, region=REG_RANK,
+                                         thr=THR_RANK, timeout=POST_TAP_WAIT)
+        L(wk, f"Find RANK → ok={okr} pos={posr}")
+        if aborted(wk):
+            return False
         if okr:
             L(wk, "Đã thấy bang-xep-hang.")
             return True
@@ -197,7 +186,7 @@ def _ocr_page_and_bless(wk, targets: List[str]) -> List[str]:
     """
     OCR 7 vùng, nếu tên có trong targets thì nhấn 3 điểm và trả về DANH SÁCH TÊN GỐC đã chúc.
     - So khớp theo dạng đã chuẩn hoá (bỏ dấu + bỏ ký tự không chữ/số) ở CẢ 2 phía.
-    - Tap 3 điểm: tap1 -> tap2 -> (366, 83) với delay 1.0s, 1.0s, 0.5s.
+    - Tap 3 điểm: tap1 -> tap2 -> (366, 83) với delay 1.0s, 1.0s, 0.5s (1 lần input_batch, nghỉ ngay trên máy).
     """
     done: List[str] = []
     if not targets:
@@ -236,9 +225,9 @@ def _ocr_page_and_bless(wk, targets: List[str]) -> List[str]:
             L(wk, f"Slot#{idx} → KHỚP: '{orig_name}' | Tap {tap1} → {tap2} → (366, 83)")
 
             # TAP 3 ĐIỂM với delay yêu cầu
-            tap(wk, *tap1);           sleep_coop(wk, 1.0)
-            tap(wk, *tap2);           sleep_coop(wk, 1.0)
-            tap(wk, 366, 83);         sleep_coop(wk, 0.5)
+            if aborted(wk):
+                break
+            input_batch(wk, [("tap", tap1, 1000), ("tap", tap2, 1000), ("tap", (366, 83), 500)])
 
             done.append(orig_name)
 
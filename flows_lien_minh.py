@@ -29,6 +29,7 @@ from module import (
     mem_relief as _mem_relief,     # NEW: bổ sung trong module.py (xem patch bên dưới)
     resource_path
 )
+from frame import hsv_of
 
 # ================== REGIONS ==================
 REG_OUTSIDE   = (581, 1485, 758, 1600)   # nút Liên minh ngoài map
@@ -74,16 +75,14 @@ def _classify_join_color(wk) -> str | None:
     if img is None:
         return None
     try:
-        import cv2, numpy as np
-        # ưu tiên lấy trung bình trên ROI nhỏ
-        roi = _crop_np(img, REG_JOIN_COLOR)
-        if roi is None or roi.size == 0:
+        import numpy as np
+        # ưu tiên lấy trung bình trên ROI nhỏ (Frame: dùng lại plane HSV nếu đã có)
+        hsv = hsv_of(img, REG_JOIN_COLOR)
+        if hsv is None or hsv.size == 0:
             # fallback: lấy 3x3 quanh điểm PT_JOIN_COLOR
             x, y = PT_JOIN_COLOR
-            x1, y1, x2, y2 = max(0, x-1), max(0, y-1), x+2, y+2
-            roi = img[y1:y2, x1:x2]
+            hsv = hsv_of(img, (max(0, x-1), max(0, y-1), x+2, y+2))
 
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
         h = float(np.mean(hsv[...,0]))
         s = float(np.mean(hsv[...,1]))
         v = float(np.mean(hsv[...,2]))
@@ -92,15 +91,15 @@ def _classify_join_color(wk) -> str | None:
 
         # Xám: bão hoà thấp
         if s <= GRAY_S_MAX:
-            _free_img(img, roi, hsv)
+            _free_img(img, hsv)
             return "full"
 
         # Xanh: hue nằm trong dải xanh + đủ S/V
         if (GREEN_H_LOW <= h <= GREEN_H_HIGH) and (s >= GREEN_S_MIN) and (v >= GREEN_V_MIN):
-            _free_img(img, roi, hsv)
+            _free_img(img, hsv)
             return "ok"
 
-        _free_img(img, roi, hsv)
+        _free_img(img, hsv)
         return None
     except Exception:
         _free_img(img)
@@ -194,7 +193,7 @@ def join_guild_once(wk, log=None) -> bool:
     """
     from module import (
         log_wk as _log, grab_screen_np as _grab_screen_np, free_img,
-        find_on_frame, tap as _tap, sleep_coop as _sleep_coop, adb_safe as _adb_safe,
+        find_on_frame, find_many_on_frame, tap as _tap, sleep_coop as _sleep_coop, adb_safe as _adb_safe,
         resource_path, type_text as _type_text
     )
     import time
@@ -220,15 +219,16 @@ def join_guild_once(wk, log=None) -> bool:
     def _state_now():
         img = _grab_screen_np(wk)
         try:
-            ok_inside, _, _ = find_on_frame(img, IMG_INSIDE, region=REG_INSIDE, threshold=THR)
-            if ok_inside:
+            # 3 template khớp chung 1 lượt trên cùng frame, ưu tiên theo thứ tự inside > join > kiểm tra
+            hits = find_many_on_frame(img, [(IMG_INSIDE, REG_INSIDE, THR),
+                                            (IMG_JOIN_BTN, REG_JOIN_BTN, THR),
+                                            (IMG_KIEM_TRA_CHUNG, REG_KIEM_TRA_CHUNG, THR)])
+            if hits[IMG_INSIDE]["ok"]:
                 return "inside", None
-            ok_join, pt_join, _ = find_on_frame(img, IMG_JOIN_BTN, region=REG_JOIN_BTN, threshold=THR)
-            if ok_join and pt_join:
-                return "join_btn", pt_join
-            ok_kc, pt_kc, _ = find_on_frame(img, IMG_KIEM_TRA_CHUNG, region=REG_KIEM_TRA_CHUNG, threshold=THR)
-            if ok_kc and pt_kc:
-                return "kiemtra", pt_kc
+            if hits[IMG_JOIN_BTN]["ok"]:
+                return "join_btn", hits[IMG_JOIN_BTN]["pt"]
+            if hits[IMG_KIEM_TRA_CHUNG]["ok"]:
+                return "kiemtra", hits[IMG_KIEM_TRA_CHUNG]["pt"]
             return "unknown", None
         finally:
             free_img(img)
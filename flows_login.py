@@ -21,10 +21,12 @@ from module import (
     back as _back,
     state_simple as _state_simple,
     free_img,resource_path,
-    ocr_region as _ocr_region
+    ocr_region as _ocr_region,
+    input_batch as _input_batch
 )
 import unicodedata, re
 from pathlib import Path
+from frame import hsv_of
 # ================== VÙNG ==================
 REG_CLEAR_EMAIL_X = (645, 556, 751, 731)
 REG_EMAIL_EMPTY = (146, 586, 756, 720)
@@ -69,8 +71,7 @@ def _is_pixel_gray(img: np.ndarray, x: int, y: int) -> tuple[bool, str]:
     try:
         y1, x1 = max(0, y - 1), max(0, x - 1)
         y2, x2 = min(img.shape[0], y + 2), min(img.shape[1], x + 2)
-        roi = img[y1:y2, x1:x2]
-        hsv_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+        hsv_roi = hsv_of(img, (x1, y1, x2, y2))
         avg_saturation = np.mean(hsv_roi[:, :, 1])
         msg = f"Kiểm tra bảo trì tại ({x},{y}): Độ bão hòa màu = {avg_saturation:.1f}"
         return avg_saturation < GRAY_SATURATION_MAX, msg
@@ -266,13 +267,33 @@ def select_server(wk, server: str) -> bool:
     _log(wk, "[LOGIN][SV] ❌ Không tìm thấy server theo OCR trong danh sách.")
     return False
 
+def _field_filled(wk, empty_tpl: str, region):
+    """Ô đã có chữ = template ô trống (placeholder) không còn khớp trong vùng ô. None = đã hủy, không kiểm."""
+    if not _sleep_coop(wk, 0.4):    # chờ ô vẽ lại sau broadcast/paste
+        return None
+    img = _grab_screen_np(wk)
+    try:
+        ok, _, _ = find_on_frame(img, empty_tpl, region=region, threshold=0.86)
+        return not ok
+    finally:
+        free_img(img)
+
+
+def _type_field(wk, text: str, empty_tpl: str, region, label: str) -> bool:
+    # nhập 1 phát (IME/clipboard nếu máy có), kiểm bằng template ô trống; không được thì 'input text'
+    filled = _type_text(wk, text, verify=lambda _t: _field_filled(wk, empty_tpl, region))
+    if _aborted(wk):
+        return False
+    if not filled:
+        _log(wk, f"[LOGIN] ⚠️ Ô {label} vẫn trống sau khi nhập.")
+    return filled
+
+
 def _pre_login_taps(wk):
     seq = [(690, 650, 0.15), (693, 758, 0.15), (690, 650, 0.15)]
-    for x, y, delay in seq:
-        if _aborted(wk): break
-        _tap(wk, x, y)
-        # Sử dụng _sleep_coop để an toàn
-        _sleep_coop(wk, delay)
+    if _aborted(wk): return
+    # cả chuỗi gửi 1 lần, nghỉ giữa các tap chạy trên máy
+    _input_batch(wk, [("tap", (x, y), int(delay * 1000)) for x, y, delay in seq])
 
 
 def login_once(wk, email: str, password: str, server: str = "", date: str = "", *, uga_id=None, cloud=None) -> bool:
@@ -300,8 +321,8 @@ def login_once(wk, email: str, password: str, server: str = "", date: str = "",
         if not _sleep_coop(wk, 0.2): return False
     _tap_center(wk, REG_EMAIL_EMPTY)
     if not _sleep_coop(wk, 0.2): return False
-    _type_text(wk, email)
-    if not _sleep_coop(wk, 0.2): return False
+    _type_field(wk, email, IMG_EMAIL_EMPTY, REG_EMAIL_EMPTY, "email")
+    if _aborted(wk) or not _sleep_coop(wk, 0.2): return False
 
     # 2) Clear & nhập password
     img = _grab_screen_np(wk)
@@ -312,8 +333,8 @@ def login_once(wk, email: str, password: str, server: str = "", date: str = "",
         if not _sleep_coop(wk, 0.2): return False
     _tap_center(wk, REG_PASSWORD_EMPTY)
     if not _sleep_coop(wk, 0.2): return False
-    _type_text(wk, password)
-    if not _sleep_coop(wk, 0.2): return False
+    _type_field(wk, password, IMG_PASSWORD_EMPTY, REG_PASSWORD_EMPTY, "mật khẩu")
+    if _aborted(wk) or not _sleep_coop(wk, 0.2): return False
 
     # 4) Nhấn Login
     img = _grab_screen_np(wk)
@@ -75,7 +75,7 @@ def _confirm_thoat_on_frame(wk, tries=6) -> bool:
         img = grab_screen_np(wk)
         ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_THOAT, region=REG_XAC_NHAN_THOAT, threshold=0.85)
         if not ok:
-            ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_THOAT, region=None, threshold=0.85)
+            ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_THOAT, region=None, threshold=0.85, pyramid=2)
         log(wk, f"[Try {t}/{tries}] xac-nhan-thoat: ok={ok}, sc={sc:.3f}, pt={pt}")
         free_img(img)
         if ok and pt:
@@ -161,7 +161,7 @@ def _menu_settings_switch_menuimg(wk) -> bool:
     img = grab_screen_np(wk)
     ok, pt, sc = find_on_frame(img, IMG_DOI_TAI_KHOAN, region=REG_DOI_TAI_KHOAN, threshold=0.88)
     if not ok:
-        ok, pt, sc = find_on_frame(img, IMG_DOI_TAI_KHOAN, threshold=0.88)
+        ok, pt, sc = find_on_frame(img, IMG_DOI_TAI_KHOAN, threshold=0.88, pyramid=2)
     log(wk, f"KQ 'doi-tai-khoan': ok={ok}, sc={sc:.3f}, pt={pt}")
     free_img(img)
     if not ok or not pt:
@@ -173,7 +173,7 @@ def _menu_settings_switch_menuimg(wk) -> bool:
     img = grab_screen_np(wk)
     ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, region=REG_XAC_NHAN_DOI_TK, threshold=0.88)
     if not ok:
-        ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, threshold=0.88)
+        ok, pt, sc = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, threshold=0.88, pyramid=2)
     log(wk, f"KQ 'xac-nhan-doi-tk': ok={ok}, sc={sc:.3f}, pt={pt}")
     free_img(img)
     if ok and pt:
@@ -316,7 +316,7 @@ def logout_once(wk, max_rounds: int = 5) -> bool:
                 img = grab_screen_np(wk)
                 ok2, pt2, _ = find_on_frame(img, IMG_DOI_TAI_KHOAN, region=REG_DOI_TAI_KHOAN, threshold=0.88)
                 if not ok2:
-                    ok2, pt2, _ = find_on_frame(img, IMG_DOI_TAI_KHOAN, threshold=0.88)
+                    ok2, pt2, _ = find_on_frame(img, IMG_DOI_TAI_KHOAN, threshold=0.88, pyramid=2)
                 free_img(img)
                 if not ok2 or not pt2:
                     break
@@ -326,7 +326,7 @@ def logout_once(wk, max_rounds: int = 5) -> bool:
                 img = grab_screen_np(wk)
                 ok3, pt3, _ = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, region=REG_XAC_NHAN_DOI_TK, threshold=0.88)
                 if not ok3:
-                    ok3, pt3, _ = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, threshold=0.88)
+                    ok3, pt3, _ = find_on_frame(img, IMG_XAC_NHAN_DOI_TK, threshold=0.88, pyramid=2)
                 free_img(img)
                 if ok3 and pt3:
                     tap(wk, *pt3)
@@ -5,8 +5,8 @@
 # - Tương thích hoàn toàn với cấu trúc project của bạn.
 
 from __future__ import annotations
+import os
 import time
-import cv2
 import numpy as np
 import heapq
 
@@ -16,6 +16,7 @@ from module import (
     adb_safe,
     grab_screen_np,
     find_on_frame,
+    find_all_on_frame,
     tap,
     swipe,
     sleep_coop,
@@ -77,40 +78,28 @@ def analyze_scene_with_templates(image, grid_dims, game_area):
     grid[:, 0] = 1
     grid[:, grid_dims[1] - 1] = 1
 
+    seen = set()
     for name, path in SNAKE_IMAGES.items():
-        template = cv2.imread(path, cv2.IMREAD_COLOR)
-        if template is None:
+        key = 'snake_head' if name == 'head' else name
+        # Mọi chỗ khớp (đã gộp đỉnh trùng bằng NMS), khớp màu như cũ để phân biệt mồi / tường
+        hits = find_all_on_frame(image, path, region=game_area, threshold=TEMPLATE_THRESHOLD,
+                                 grayscale=False, max_count=1 if key == 'snake_head' else None)
+        if not hits and not os.path.exists(path):
             log_wk(None, f"LỖI: Không thể tải ảnh mẫu: {path}")
             continue
 
-        # Dùng hàm find_on_frame của bạn để tìm tất cả các vị trí khớp
-        # (Lưu ý: find_on_frame chỉ trả về 1 kết quả, cần sửa đổi để trả về nhiều)
-        # Tạm thời, chúng ta sẽ quét thủ công để tìm nhiều đối tượng
-        res = cv2.matchTemplate(game_img, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= TEMPLATE_THRESHOLD)
-
-        for pt in zip(*loc[::-1]):  # pt là (x, y) của góc trên trái
-            center_x = pt[0] + template.shape[1] / 2
-            center_y = pt[1] + template.shape[0] / 2
-
-            grid_c = int(center_x / cell_w)
-            grid_r = int(center_y / cell_h)
-            pos = (grid_r, grid_c)
-
+        for cx, cy, _ in hits:
+            pos = (int((cy - y1) / cell_h), int((cx - x1) / cell_w))    # (hàng, cột)
             # Tránh thêm trùng lặp vị trí
-            is_duplicate = False
-            for obj_list in objects.values():
-                if isinstance(obj_list, list) and pos in obj_list:
-                    is_duplicate = True
-                    break
-            if pos == objects['snake_head']: is_duplicate = True
-            if is_duplicate: continue
+            if pos in seen:
+                continue
+            seen.add(pos)
 
-            if name == 'snake_head':
+            if key == 'snake_head':
                 objects['snake_head'] = pos
             else:
-                objects[name].append(pos)
-                if name == 'wall':
+                objects[key].append(pos)
+                if key == 'wall':
                     grid[pos] = 1
 
     # Thân rắn sẽ được suy luận từ vị trí đầu rắn và đường đi
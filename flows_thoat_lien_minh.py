@@ -27,7 +27,7 @@ import time
 # ====== IMPORT TOÀN BỘ HÀM DÙNG CHUNG TỪ module.py ======
 from module import (
     log_wk, adb_safe,
-    grab_screen_np, find_on_frame,
+    grab_screen_np, find_on_frame, find_many_on_frame,
     tap, tap_center, swipe,
     aborted, sleep_coop,
     free_img, mem_relief,resource_path
@@ -68,11 +68,10 @@ def _check_left_or_inside_from_img(img) -> str | None:
       - 'inside' : vẫn đang trong Liên minh
       - None     : không xác định từ frame hiện tại
     """
-    ok_left, _, _ = find_on_frame(img, IMG_KIEM_TRA_CHUNG, region=None)
-    if ok_left:
+    hits = find_many_on_frame(img, [(IMG_KIEM_TRA_CHUNG, None, None), (IMG_INSIDE, REG_INSIDE, None)])
+    if hits[IMG_KIEM_TRA_CHUNG]["ok"]:
         return "left"
-    ok_in, _, _ = find_on_frame(img, IMG_INSIDE, region=REG_INSIDE)
-    if ok_in:
+    if hits[IMG_INSIDE]["ok"]:
         return "inside"
     return None
 
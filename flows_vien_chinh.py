@@ -17,6 +17,7 @@ from module import (
     sleep_coop as _sleep_coop,
     aborted as _aborted,
     grab_screen_np as _grab_screen_np,
+    grab_screen_after as _grab_screen_after,
     # (SỬA LỖI) Thêm find_on_frame vào danh sách import
     find_on_frame,
     DEFAULT_THR as THR_DEFAULT,
@@ -80,12 +81,12 @@ def _ensure_inside_hard(wk) -> bool:
         ok_out, _, _ = find_on_frame(img, IMG_OUTSIDE, region=REG_OUTSIDE, threshold=THR_DEFAULT)
         _free_img(img)
         if ok_out:
-            _tap_center(wk, REG_OUTSIDE)
-            if not _sleep_coop(wk, 0.8): return False
-            # chờ INSIDE xuất hiện tối đa 10 nhịp
+            t_act = _tap_center(wk, REG_OUTSIDE)
+            if not _sleep_coop(wk, 0.4): return False
+            # chờ INSIDE xuất hiện tối đa 10 nhịp (chỉ xét frame chụp sau tap)
             for _ in range(10):
                 if _aborted(wk): return False
-                img2 = _grab_screen_np(wk)
+                img2 = _grab_screen_after(wk, t_act, timeout=1.0)
                 ok_in2, _, _ = find_on_frame(img2, IMG_INSIDE, region=REG_INSIDE, threshold=THR_DEFAULT)
                 _free_img(img2)
                 if ok_in2:
@@ -112,7 +113,7 @@ def _open_expedition(wk) -> bool:
 
         # 0) thử tìm ngay khi chưa vuốt
         img0 = _grab_screen_np(wk)
-        ok0, pt0, _ = find_on_frame(img0, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT)
+        ok0, pt0, _ = find_on_frame(img0, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT, pyramid=2)
         _free_img(img0)
         if ok0 and pt0:
             _tap(wk, *pt0)
@@ -146,7 +147,7 @@ def _open_expedition(wk) -> bool:
 
             # check trước swipe
             img1 = _grab_screen_np(wk)
-            ok1, pt1, _ = find_on_frame(img1, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT)
+            ok1, pt1, _ = find_on_frame(img1, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT, pyramid=2)
             _free_img(img1)
             if ok1 and pt1:
                 _tap(wk, *pt1)
@@ -160,7 +161,7 @@ def _open_expedition(wk) -> bool:
 
             # check ngay sau swipe
             img2 = _grab_screen_np(wk)
-            ok2, pt2, _ = find_on_frame(img2, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT)
+            ok2, pt2, _ = find_on_frame(img2, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT, pyramid=2)
             _free_img(img2)
             if ok2 and pt2:
                 _tap(wk, *pt2)
@@ -177,7 +178,7 @@ def _open_expedition(wk) -> bool:
 
             # check trước swipe
             img3 = _grab_screen_np(wk)
-            ok3, pt3, _ = find_on_frame(img3, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT)
+            ok3, pt3, _ = find_on_frame(img3, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT, pyramid=2)
             _free_img(img3)
             if ok3 and pt3:
                 _tap(wk, *pt3)
@@ -191,7 +192,7 @@ def _open_expedition(wk) -> bool:
 
             # check ngay sau swipe
             img4 = _grab_screen_np(wk)
-            ok4, pt4, _ = find_on_frame(img4, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT)
+            ok4, pt4, _ = find_on_frame(img4, IMG_VIEN_CHINH, region=REG_FIND, threshold=THR_DEFAULT, pyramid=2)
             _free_img(img4)
             if ok4 and pt4:
                 _tap(wk, *pt4)
@@ -240,19 +241,19 @@ def _do_trinh_sat_12_times(wk):
             continue
 
         # 2) bấm 'Trinh sát'
-        _tap(wk, *pt_ts)
-        if not _sleep_coop(wk, 0.25): return
+        t_act = _tap(wk, *pt_ts)
+        if not _sleep_coop(wk, 0.2): return
 
-        # 3) nếu có 'nut-den' → bấm
-        img2 = _grab_screen_np(wk)
+        # 3) nếu có 'nut-den' → bấm (frame phải chụp sau tap 'Trinh sát')
+        img2 = _grab_screen_after(wk, t_act, timeout=1.0)
         ok_den, p_den, _ = find_on_frame(img2, IMG_DEN, region=REG_DEN, threshold=THR_DEFAULT)
         _free_img(img2)
         if ok_den and p_den:
-            _tap(wk, *p_den)
+            t_act = _tap(wk, *p_den)
             if not _sleep_coop(wk, 0.2): return
 
         # 4) nếu có 'nut-dong' → bấm
-        img3 = _grab_screen_np(wk)
+        img3 = _grab_screen_after(wk, t_act, timeout=1.0)
         ok_dong, p_dong, _ = find_on_frame(img3, IMG_DONG, region=REG_DONG, threshold=THR_DEFAULT)
         _free_img(img3)
         if ok_dong and p_dong:
@@ -0,0 +1,208 @@
+# foreground_watcher.py
+# ==========================================================
+#  Giữ activity đang ở foreground của 1 máy trong bộ nhớ, thay cho việc chạy
+#  'cmd activity get-foreground-activity' / 'dumpsys activity activities' / 'dumpsys window windows'
+#  mỗi lần poll (wait_state 0.25s/lần, output dumpsys vài chục KB).
+#  - 1 tiến trình 'adb logcat -b events' sống lâu, chỉ lọc các tag đổi focus/resume:
+#       am_focused_activity, wm_set_resumed_activity, am_set_resumed_activity   -> [.., pkg/cls, ..]
+#       wm_on_resume_called, am_on_resume_called                                -> [.., cls, ..] (không có pkg)
+#  - top_component() trả component mới nhất; None = chưa biết (mới mở stream, stream chết,
+#    event chỉ có class chưa gặp) -> caller chạy dumpsys như cũ 1 lần rồi seed() lại.
+#  - Stream chết -> xoá trạng thái (có thể đã lỡ event), tự mở lại sau BACKOFF giây.
+#  - Mỗi máy 1 watcher dùng chung: for_serial() (đếm tham chiếu) / release(); AccountRunner và
+#    EmulatorWorker cùng máy chỉ mở 1 stream logcat + 1 thread đọc.
+# ==========================================================
+from __future__ import annotations
+
+import os
+import re
+import threading
+import subprocess
+from typing import Callable, Dict, Optional
+
+FOCUS_TAGS = ("am_focused_activity", "wm_set_resumed_activity", "am_set_resumed_activity")
+RESUME_TAGS = ("wm_on_resume_called", "am_on_resume_called")
+
+_RE_EVENT = re.compile(r"^\s*(?:\S+\s+\S+\s+\d+\s+\d+\s+\w\s+|\w/)?([a-z_]+)\s*(?:\(\s*\d+\))?\s*:\s*\[(.*)\]")
+_RE_COMPONENT = re.compile(r"([a-zA-Z0-9_.]+/[a-zA-Z0-9_.$]+)")
+_RE_CLASS = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_$]*(?:\.[a-zA-Z0-9_$]+)+$")
+_RESPAWN_BACKOFF_SEC = 3.0
+
+_SHARED: Dict[str, "ForegroundWatcher"] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def parse_event_line(line: str):
+    """
+    1 dòng logcat -b events -> ("focus", "pkg/cls") | ("resume", "cls") | None.
+    Nhận cả format brief 'I/tag( pid): [..]' lẫn threadtime.
+    """
+    m = _RE_EVENT.search(line or "")
+    if not m:
+        return None
+    tag, payload = m.group(1), m.group(2)
+    if tag in FOCUS_TAGS:
+        mc = _RE_COMPONENT.search(payload)
+        return ("focus", mc.group(1)) if mc else None
+    if tag in RESUME_TAGS:
+        for field in payload.split(","):
+            field = field.strip()
+            if _RE_CLASS.match(field):
+                return "resume", field
+    return None
+
+
+def full_class(comp: str) -> str:
+    """'pkg/.Act' -> 'pkg.Act'; 'pkg/a.b.Act' -> 'a.b.Act'."""
+    pkg, _, cls = comp.partition("/")
+    return pkg + cls if cls.startswith(".") else cls
+
+
+class ForegroundWatcher:
+    def __init__(self, adb_path: str, serial: str, log_cb: Optional[Callable[[str], None]] = None):
+        self.adb_path = adb_path
+        self.serial = serial
+        self._log_cb = log_cb
+        self._lock = threading.Lock()
+        self._comp: Optional[str] = None
+        self._classes: Dict[str, str] = {}      # class đầy đủ -> component (học từ event focus/seed)
+        self._proc: Optional[subprocess.Popen] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.events = 0
+        self.spawns = 0
+        self._refs = 0
+
+    # ---------------- dùng chung theo máy ----------------
+    @classmethod
+    def for_serial(cls, adb_path: str, serial: str,
+                   log_cb: Optional[Callable[[str], None]] = None) -> "ForegroundWatcher":
+        """Watcher (đã start) dùng chung của máy serial; mỗi lần gọi phải có 1 release() tương ứng."""
+        with _SHARED_LOCK:
+            fw = _SHARED.get(serial)
+            if fw is None:
+                fw = _SHARED[serial] = cls(adb_path, serial, log_cb)
+            if fw._log_cb is None:
+                fw._log_cb = log_cb
+            fw._refs += 1
+        fw.start()
+        return fw
+
+    def release(self):
+        """Bỏ 1 tham chiếu từ for_serial(); người cuối cùng thì đóng stream."""
+        with _SHARED_LOCK:
+            self._refs = max(0, self._refs - 1)
+            if self._refs:
+                return
+            if _SHARED.get(self.serial) is self:
+                del _SHARED[self.serial]
+        self.close()
+
+    # ---------------- API ----------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"FgWatch-{self.serial}", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._kill()
+
+    @property
+    def alive(self) -> bool:
+        p = self._proc
+        return p is not None and p.poll() is None
+
+    def top_component(self) -> Optional[str]:
+        """Component foreground hiện tại, hoặc None nếu chưa chắc (caller tự dumpsys rồi seed())."""
+        if not self.alive:
+            return None
+        with self._lock:
+            return self._comp
+
+    def top_package(self) -> Optional[str]:
+        comp = self.top_component()
+        return comp.split("/", 1)[0] if comp and "/" in comp else None
+
+    def seed(self, comp: Optional[str]):
+        """Nạp kết quả dumpsys của caller (chỉ nhận khi stream đang sống để không giữ giá trị cũ)."""
+        if not comp or "/" not in comp or not self.alive:
+            return
+        with self._lock:
+            self._set(comp)
+
+    # ---------------- nội bộ ----------------
+    def _log(self, s: str):
+        if self._log_cb:
+            try:
+                self._log_cb(s)
+            except Exception:
+                pass
+
+    def _set(self, comp: Optional[str]):
+        self._comp = comp
+        if comp:
+            self._classes[full_class(comp)] = comp
+
+    def _on_line(self, line: str):
+        ev = parse_event_line(line)
+        if not ev:
+            return
+        kind, value = ev
+        with self._lock:
+            self.events += 1
+            if kind == "focus":
+                self._set(value)
+            else:
+                # resume chỉ có class: biết pkg thì cập nhật, không thì coi như chưa biết
+                self._set(self._classes.get(value))
+
+    def _kill(self):
+        p, self._proc = self._proc, None
+        if p is None:
+            return
+        try:
+            p.kill()
+        except Exception:
+            pass
+
+    def _spawn(self) -> bool:
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        tags = [f"{t}:I" for t in FOCUS_TAGS + RESUME_TAGS]
+        try:
+            self._proc = subprocess.Popen(
+                [self.adb_path, "-s", self.serial, "logcat", "-b", "events", "-v", "brief", "-T", "1",
+                 *tags, "*:S"],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                startupinfo=startupinfo)
+        except Exception as e:
+            self._log(f"[FG] không mở được logcat: {e}")
+            self._proc = None
+            return False
+        self.spawns += 1
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                self._set(None)     # mở stream mới -> có thể đã lỡ event, chờ seed/event mới
+            if not self._spawn():
+                self._stop.wait(_RESPAWN_BACKOFF_SEC)
+                continue
+            p = self._proc
+            try:
+                for raw in iter(p.stdout.readline, b""):
+                    if self._stop.is_set():
+                        break
+                    self._on_line(raw.decode("utf-8", errors="ignore"))
+            except Exception:
+                pass
+            self._kill()
+            with self._lock:
+                self._set(None)
+            self._stop.wait(_RESPAWN_BACKOFF_SEC)
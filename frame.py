@@ -0,0 +1,123 @@
+# frame.py
+# ==========================================================
+#  Frame: ảnh BGR đã decode 1 lần + cache ảnh xám/HSV dùng chung
+#  cho mọi detector (find_on_frame, OCR, kiểm tra màu pixel).
+# ==========================================================
+from __future__ import annotations
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# ROI nhỏ hơn tỉ lệ này so với frame thì chỉ convert đúng ROI (không đáng để convert cả frame)
+_SMALL_ROI_RATIO = 1.0 / 16
+
+
+class Frame(np.ndarray):
+    """
+    ndarray BGR (H, W, 3) kèm:
+      - seq: số thứ tự frame (0 nếu không rõ nguồn, vd screencap)
+      - ts : time.monotonic() lúc chụp/nhận frame
+      - gray / hsv: tính lười, chỉ convert toàn frame tối đa 1 lần.
+    Vẫn là ndarray nên code cũ (img.shape, img[y1:y2, x1:x2], cv2.*) dùng như bình thường.
+    """
+
+    def __new__(cls, bgr: np.ndarray, seq: int = 0, ts: Optional[float] = None):
+        obj = np.asarray(bgr).view(cls)
+        obj.seq = int(seq)
+        obj.ts = time.monotonic() if ts is None else float(ts)
+        return obj
+
+    def __array_finalize__(self, obj):
+        # slice/view của Frame: giữ seq/ts, cache tính lại theo dữ liệu của chính nó
+        self.seq = getattr(obj, "seq", 0)
+        self.ts = getattr(obj, "ts", None)
+        self._gray = None
+        self._hsv = None
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return self.view(np.ndarray)
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self.ndim == 2:
+            return self.bgr
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def hsv(self) -> np.ndarray:
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+        return self._hsv
+
+    def has_gray(self) -> bool:
+        return self.ndim == 2 or self._gray is not None
+
+    def has_hsv(self) -> bool:
+        return self._hsv is not None
+
+
+def as_frame(img, seq: int = 0, ts: Optional[float] = None) -> Optional[Frame]:
+    """Bọc ndarray thành Frame (giữ nguyên nếu đã là Frame)."""
+    if img is None or isinstance(img, Frame):
+        return img
+    return Frame(img, seq=seq, ts=ts)
+
+
+def clamp_region(shape, region) -> Optional[Tuple[int, int, int, int]]:
+    """Kẹp (x1,y1,x2,y2) vào kích thước ảnh; None nếu vùng rỗng/không hợp lệ."""
+    try:
+        x1, y1, x2, y2 = region
+    except Exception:
+        return None
+    h, w = shape[:2]
+    x1 = max(0, min(int(x1), w)); x2 = max(0, min(int(x2), w))
+    y1 = max(0, min(int(y1), h)); y2 = max(0, min(int(y2), h))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
+
+
+def _is_small(shape, reg) -> bool:
+    h, w = shape[:2]
+    x1, y1, x2, y2 = reg
+    return (x2 - x1) * (y2 - y1) < _SMALL_ROI_RATIO * w * h
+
+
+def gray_of(img, region=None) -> Optional[np.ndarray]:
+    """
+    Ảnh xám của img (hoặc ROI đã kẹp của nó).
+    - Frame: dùng plane xám đã cache; ROI nhỏ khi chưa có cache thì chỉ convert ROI.
+    - ndarray thường: chỉ convert đúng ROI.
+    """
+    if img is None:
+        return None
+    reg = clamp_region(img.shape, region) if region is not None else None
+    if region is not None and reg is None:
+        return None
+    if img.ndim == 2:
+        g = np.asarray(img)
+        return g if reg is None else g[reg[1]:reg[3], reg[0]:reg[2]]
+    if isinstance(img, Frame) and (img.has_gray() or reg is None or not _is_small(img.shape, reg)):
+        g = img.gray
+        return g if reg is None else g[reg[1]:reg[3], reg[0]:reg[2]]
+    src = np.asarray(img) if reg is None else np.asarray(img)[reg[1]:reg[3], reg[0]:reg[2]]
+    return cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+
+
+def hsv_of(img, region=None) -> Optional[np.ndarray]:
+    """Giống gray_of nhưng cho HSV."""
+    if img is None or img.ndim != 3:
+        return None
+    reg = clamp_region(img.shape, region) if region is not None else None
+    if region is not None and reg is None:
+        return None
+    if isinstance(img, Frame) and (img.has_hsv() or reg is None or not _is_small(img.shape, reg)):
+        h = img.hsv
+        return h if reg is None else h[reg[1]:reg[3], reg[0]:reg[2]]
+    src = np.asarray(img) if reg is None else np.asarray(img)[reg[1]:reg[3], reg[0]:reg[2]]
+    return cv2.cvtColor(src, cv2.COLOR_BGR2HSV)
@@ -0,0 +1,246 @@
+# frame_recorder.py
+# ==========================================================
+#  Ghi lại 1 phiên chạy flow (mọi frame grab_screen_np trả về + mọi lệnh tap/swipe/keyevent/text
+#  đi qua adb_safe) vào archive append-only, rồi phát lại không cần giả lập.
+#  Lệnh text KHÔNG ghi nội dung (email / mật khẩu...), chỉ ghi độ dài: redact_input().
+#
+#    <dir>/data.bin   : magic + các blob nối tiếp (JPEG cho frame, JSON cho lệnh input)
+#    <dir>/index.bin  : bản ghi 32 byte cố định <B3xIdQI4x = kind, seq, ts, offset, length
+#
+#  - Frame lặp lại (flow gọi grab nhiều lần trên cùng 1 frame) chỉ thêm bản ghi index trỏ về blob cũ.
+#  - RecordingReader mở data.bin bằng mmap, index bằng np.fromfile -> đọc ngẫu nhiên không copy.
+#  - ReplayWorker: "wk" giả, frame_fetcher trả lần lượt các frame đã ghi, adb() chỉ ghi nhận lệnh.
+#  Bật ghi trong AccountRunner bằng BB_RECORD_DIR=<thư mục>.
+# ==========================================================
+from __future__ import annotations
+
+import json
+import mmap
+import time
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from frame import Frame
+
+_MAGIC = b"BBREC1\0\0"
+KIND_FRAME = 1
+KIND_INPUT = 2
+
+INDEX_DTYPE = np.dtype([
+    ("kind", "u1"), ("_pad", "V3"), ("seq", "<u4"),
+    ("ts", "<f8"), ("offset", "<u8"), ("length", "<u4"), ("_pad2", "V4"),
+])
+assert INDEX_DTYPE.itemsize == 32
+
+# lệnh 'adb shell input <op> ...' được ghi lại
+INPUT_OPS = ("tap", "swipe", "keyevent", "text")
+
+
+def redact_input(op: str, args) -> List[str]:
+    """Tham số được phép ghi xuống đĩa: text -> chỉ độ dài ('<text len=N>'), op khác giữ nguyên."""
+    args = [str(a) for a in args]
+    if op == "text":
+        return [f"<text len={len(' '.join(args))}>"]
+    return args
+
+
+def input_event_of(args) -> Optional[Tuple[str, List[str]]]:
+    """('tap', ['10','20']) nếu args là 'shell input <op> ...' thuộc INPUT_OPS, ngược lại None."""
+    a = [str(x) for x in args]
+    if len(a) >= 3 and a[0] == "shell" and a[1] == "input" and a[2] in INPUT_OPS:
+        return a[2], a[3:]
+    return None
+
+
+class FrameRecorder:
+    """Ghi archive; an toàn khi nhiều thread cùng gọi."""
+
+    def __init__(self, path, jpeg_quality: int = 90):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.jpeg_quality = int(jpeg_quality)
+        data_path = self.path / "data.bin"
+        new = not data_path.exists() or data_path.stat().st_size == 0
+        self._data = open(data_path, "ab")
+        self._index = open(self.path / "index.bin", "ab")
+        if new:
+            self._data.write(_MAGIC)
+            self._data.flush()
+        self._pos = self._data.tell()
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        # frame vừa ghi: (id(obj), seq) -> (offset, length) để frame lặp không ghi lại blob
+        self._last_key = None
+        self._last_blob = None
+        self.frames = 0
+        self.events = 0
+
+    def _append(self, kind: int, seq: int, ts: float, blob: Optional[bytes] = None,
+                at: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+        if at is None:
+            self._data.write(blob)
+            self._data.flush()
+            at = (self._pos, len(blob))
+            self._pos += len(blob)
+        rec = np.zeros(1, dtype=INDEX_DTYPE)
+        rec["kind"], rec["seq"], rec["ts"] = kind, seq & 0xFFFFFFFF, ts
+        rec["offset"], rec["length"] = at
+        self._index.write(rec.tobytes())
+        self._index.flush()
+        return at
+
+    def add_frame(self, img, ts: Optional[float] = None, jpeg: Optional[bytes] = None):
+        """Ghi 1 frame (ndarray/Frame, hoặc JPEG có sẵn qua `jpeg`)."""
+        if img is None and jpeg is None:
+            return
+        seq = int(getattr(img, "seq", 0) or 0)
+        ts = (time.monotonic() if ts is None else ts) - self._t0
+        key = (id(img), seq) if img is not None else None
+        with self._lock:
+            if key is not None and key == self._last_key and seq:
+                self._append(KIND_FRAME, seq, ts, at=self._last_blob)
+                self.frames += 1
+                return
+            if jpeg is None:
+                ok, enc = cv2.imencode(".jpg", np.asarray(img), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    return
+                jpeg = enc.tobytes()
+            self._last_blob = self._append(KIND_FRAME, seq, ts, jpeg)
+            self._last_key = key
+            self.frames += 1
+
+    def add_input(self, op: str, args, ts: Optional[float] = None):
+        """Ghi 1 lệnh input (tap/swipe/keyevent/text); text chỉ ghi độ dài, không ghi nội dung."""
+        ts = (time.monotonic() if ts is None else ts) - self._t0
+        blob = json.dumps({"op": op, "args": redact_input(op, args)}, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._append(KIND_INPUT, 0, ts, blob)
+            self.events += 1
+
+    def close(self):
+        with self._lock:
+            for f in (self._data, self._index):
+                try:
+                    f.close()
+                except Exception:
+                    pass
+
+
+class RecordingReader:
+    """Đọc archive: index là mảng numpy, blob là memoryview trên mmap (không copy)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index = np.fromfile(self.path / "index.bin", dtype=INDEX_DTYPE)
+        self._f = open(self.path / "data.bin", "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} không phải archive frame_recorder")
+        self.frame_rows = np.flatnonzero(self.index["kind"] == KIND_FRAME)
+        self.input_rows = np.flatnonzero(self.index["kind"] == KIND_INPUT)
+
+    def __len__(self):
+        return len(self.index)
+
+    def blob(self, row: int) -> memoryview:
+        r = self.index[row]
+        off, n = int(r["offset"]), int(r["length"])
+        return memoryview(self._mm)[off:off + n]
+
+    def frame(self, i: int) -> Optional[Frame]:
+        """Frame thứ i (theo thứ tự grab) đã decode."""
+        row = int(self.frame_rows[i])
+        img = cv2.imdecode(np.frombuffer(self.blob(row), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        r = self.index[row]
+        return Frame(img, seq=int(r["seq"]), ts=float(r["ts"]))
+
+    def inputs(self) -> List[Tuple[float, str, List[str]]]:
+        """[(ts, op, args), ...] theo thứ tự đã ghi."""
+        out = []
+        for row in self.input_rows:
+            d = json.loads(bytes(self.blob(int(row))).decode("utf-8"))
+            out.append((float(self.index[row]["ts"]), d["op"], d["args"]))
+        return out
+
+    def close(self):
+        try:
+            self._mm.close()
+        except Exception:
+            pass
+        try:
+            self._f.close()
+        except Exception:
+            pass
+
+
+class ReplayWorker:
+    """
+    "wk" giả để chạy flow trên archive đã ghi (không cần giả lập/adb):
+      - frame_fetcher(): JPEG kế tiếp theo đúng thứ tự phiên gốc; hết frame thì giữ frame cuối
+        (loop=True thì quay lại đầu).
+      - adb()/adb_bin(): không chạy gì, ghi lệnh vào self.sent; lệnh input so được với reader.inputs().
+    """
+
+    def __init__(self, path, loop: bool = False, log_cb: Optional[Callable[[str], None]] = None):
+        self.reader = RecordingReader(path)
+        self.loop = loop
+        self.device_id = "replay"
+        self.port = "replay"
+        self._abort = False
+        self._log_cb = log_cb
+        self._i = 0
+        self.sent: List[Tuple[float, Tuple[str, ...]]] = []
+        self.frame_fetcher = self._next_frame
+
+    def _next_frame(self) -> Optional[bytes]:
+        n = len(self.reader.frame_rows)
+        if n == 0:
+            return None
+        if self._i >= n:
+            if not self.loop:
+                return bytes(self.reader.blob(int(self.reader.frame_rows[n - 1])))
+            self._i = 0
+        row = int(self.reader.frame_rows[self._i])
+        self._i += 1
+        return bytes(self.reader.blob(row))
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.loop and self._i >= len(self.reader.frame_rows)
+
+    def log(self, s: str):
+        if self._log_cb:
+            self._log_cb(s)
+        else:
+            print(f"[replay] {s}", flush=True)
+
+    def adb(self, *args, timeout=8):
+        self.sent.append((time.monotonic(), tuple(str(a) for a in args)))
+        return 0, "", ""
+
+    def adb_bin(self, *args, timeout=8):
+        self.sent.append((time.monotonic(), tuple(str(a) for a in args)))
+        return 0, b"", b""
+
+    def sent_inputs(self) -> List[Tuple[str, List[str]]]:
+        """Các lệnh input flow đã phát trong lúc replay (để so với reader.inputs(), text cũng đã redact)."""
+        out = []
+        for _, args in self.sent:
+            ev = input_event_of(args)
+            if ev:
+                out.append((ev[0], redact_input(*ev)))
+        return out
+
+    def app_in_foreground(self, pkg: str) -> bool:
+        return True
+
+    def close(self):
+        self.reader.close()
@@ -10,9 +10,14 @@ import os
 import requests
 from PySide6.QtCore import QObject, QThread, QTimer, Signal, Qt
 from PySide6.QtWidgets import QApplication, QCheckBox, QTableWidgetItem, QDialog, QMessageBox, QProgressDialog
-from config import PLATFORM_TOOLS_ADB_PATH
+from config import PLATFORM_TOOLS_ADB_PATH, LDPLAYER_ADB_PATH
 from PySide6 import QtGui
 from module import resource_path
+from adb_client import get_client as get_adb_client
+from adb_scheduler import run_scheduled
+from device_watcher import DeviceWatcher
+from foreground_watcher import ForegroundWatcher
+from device_probe import probe_script, parse_probe
 from ui_main import MainWindow, ADB_PATH, list_adb_ports_with_status, list_known_ports_from_data
 from ui_auth import CloudClient, AuthDialog
 
@@ -159,6 +164,9 @@ def probe_port_from_device_id(device_id: str, timeout=0.5) -> bool:
     return False
 
 
+_PROBE_FAILED = object()    # probe lỗi trong tick này -> không chạy lại tới tick sau
+
+
 class EmulatorWorker(QObject):
     statusChanged = Signal(str, str)  # Sửa: Gửi device_id (str) thay vì port (int)
 
@@ -176,6 +184,8 @@ class EmulatorWorker(QObject):
         self._last_status = None
         self._last_game_state = None
         self._last_top_pkg = None
+        self._fg: ForegroundWatcher | None = None
+        self._probe = None   # kết quả probe gộp (dict | _PROBE_FAILED), dùng lại trong cùng 1 tick
 
     def emit_status(self, text: str):
         if text != self._last_status:
@@ -187,14 +197,28 @@ class EmulatorWorker(QObject):
 
     def stop(self):
         self._running = False
+        if self._fg is not None:
+            self._fg.release()
+            self._fg = None
 
     def isRunning(self):
         return self._running
 
     def adb(self, *args, timeout=6):
         if not self._adb: return -1, "", "adb not found"
+        return run_scheduled(self._serial, self._adb_direct, args, timeout, (124, "", "timeout"))
+
+    def _adb_direct(self, args, timeout):
         # Logic để chọn đúng adb.exe cho LDPlayer nếu cần
         # Hiện tại, giả định một adb chung có thể thấy tất cả devices
+        cli = get_adb_client()
+        if cli is not None:
+            try:
+                res = cli.run_args(self._serial, args, timeout=timeout, text=True)
+            except Exception:
+                res = None
+            if res is not None:
+                return res[0], res[1].strip(), res[2].strip()
         return run_cmd([self._adb, "-s", self._serial, *args], timeout)
 
     def adb_no_serial(self, *args, timeout=6):
@@ -210,16 +234,48 @@ class EmulatorWorker(QObject):
         code, out, _ = self.adb("get-state", timeout=2)
         return code == 0 and out.strip() == "device"
 
+    def probe(self) -> dict | None:
+        """
+        1 lần adb shell lấy boot/pid game/foreground/màn hình/wm size (device_probe).
+        Máy chưa bật chạy game chỉ probe boot (rẻ như getprop cũ), pid/foreground để lệnh lẻ.
+        Cache tới hết tick (doTask xoá), kể cả khi lỗi: None nếu không chạy được (offline...),
+        các hàm gọi sau trong tick đi thẳng đường lệnh lẻ, không chờ thêm 1 lần timeout 10s.
+        """
+        if self._probe is None:
+            known_fg = self._fg is not None and self._fg.top_component() is not None
+            pkg = getattr(self, "game_package", None) if getattr(self, "runRequested", False) else None
+            script = probe_script(pkg, with_foreground=not known_fg)
+            code, out, _ = self.adb("shell", script, timeout=10)
+            self._probe = (parse_probe(out) if code == 0 else None) or _PROBE_FAILED
+        return None if self._probe is _PROBE_FAILED else self._probe
+
     def boot_completed(self) -> bool:
+        if (p := self.probe()) is not None: return p["boot"]
         code, out, _ = self.adb("shell", "getprop", "sys.boot_completed", timeout=3)
         return code == 0 and out.strip() == "1"
 
+    def game_running(self, pkg: str) -> bool:
+        if (p := self.probe()) is not None and p["full"] and pkg == getattr(self, "game_package", None):
+            return p["pid"] is not None
+        code, out, _ = self.adb("shell", "pidof", pkg, timeout=3)
+        return code == 0 and bool(out.strip())
+
     def _top_component_precise(self) -> str | None:
+        # logcat events giữ sẵn component foreground -> chỉ dumpsys khi watcher chưa biết
+        if self._fg is None and self._adb and os.environ.get("BB_FG_WATCHER", "1") not in ("0", "false", "False"):
+            self._fg = ForegroundWatcher.for_serial(self._adb, self._serial)
+        if self._fg is not None and (comp := self._fg.top_component()) is not None:
+            return comp
+        if (p := self.probe()) is not None and p["full"] and p["foreground"]:
+            if self._fg is not None: self._fg.seed(p["foreground"])
+            return p["foreground"]
         code, out, _ = self.adb("shell", "dumpsys", "activity", "activities", timeout=8)
         if code == 0 and out:
             for line in out.splitlines():
                 if "topResumedActivity" in line or "mResumedActivity" in line:
-                    if m := re.search(r"([a-zA-Z0-9_.]+/[a-zA-Z0-9_.$]+)", line): return m.group(1)
+                    if m := re.search(r"([a-zA-Z0-9_.]+/[a-zA-Z0-9_.$]+)", line):
+                        if self._fg is not None: self._fg.seed(m.group(1))
+                        return m.group(1)
         code, out, _ = self.adb("shell", "dumpsys", "window", "windows", timeout=8)
         if code == 0 and out:
             for line in out.splitlines():
@@ -237,6 +293,7 @@ class EmulatorWorker(QObject):
         return (top_pkg == pkg)
 
     def start_app(self, package: str, activity: str | None = None) -> bool:
+        self._probe = None
         if activity:
             code, _, _ = self.adb("shell", "am", "start", "-n", activity, "-a", "android.intent.action.MAIN", "-c",
                                   "android.intent.category.LAUNCHER", timeout=10)
@@ -249,6 +306,7 @@ class EmulatorWorker(QObject):
         import time
         end = time.time() + timeout_sec
         while time.time() < end:
+            self._probe = None
             if self.app_in_foreground(package): return True
             time.sleep(1.0)
         return False
@@ -261,15 +319,15 @@ class EmulatorWorker(QObject):
 
     def doTask(self):
         if not self._running: return
-        # Thay thế probe_nox_port bằng ensure_connected để tổng quát hơn
-        if not self.ensure_connected(): self.emit_status("offline"); return
+        # 1 probe gộp cho cả tick; probe chạy được thì máy chắc chắn online, khỏi get-state
+        self._probe = None
+        if self.probe() is None and not self.ensure_connected(): self.emit_status("offline"); return
         if not self.boot_completed(): self.emit_status("booting…"); return
         if not getattr(self, "runRequested", False): self.emit_status("online"); return
         pkg = getattr(self, "game_package", None);
         act = getattr(self, "game_activity", None)
         if not pkg: self.emit_status("online"); return
-        code, out, _ = self.adb("shell", "pidof", pkg, timeout=3)
-        is_running = (code == 0 and bool(out.strip()))
+        is_running = self.game_running(pkg)
         if not is_running:
             self.emit_status("Mở game…");
             if self.start_app(pkg, act): self.wait_app_ready(pkg, 90)
@@ -297,6 +355,11 @@ class AppController(QObject):
         self.threads: dict[str, QThread] = {}  # Sửa: Key là device_id (str)
         self.workers: dict[str, EmulatorWorker] = {}  # Sửa: Key là device_id (str)
         self.hook_checkboxes()
+        # danh sách máy: adb server tự đẩy thay đổi (track-devices), không poll 'adb devices' nữa
+        label = "LDPlayer" if Path(LDPLAYER_ADB_PATH).exists() else "Nox"
+        self.deviceWatcher = DeviceWatcher(label=label, fallback_scan=list_adb_ports_with_status, parent=self)
+        self.deviceWatcher.devicesChanged.connect(self.sync_nox_table)
+        self.deviceWatcher.start()
         self.statusTimer = QTimer(self.w);
         self.statusTimer.timeout.connect(self.on_tick);
         self.statusTimer.start(5000)
@@ -346,6 +409,7 @@ class AppController(QObject):
 
     def stop_all(self):
         if self.statusTimer: self.statusTimer.stop()
+        self.deviceWatcher.stop()
         for did in list(self.workers.keys()): self.stop_worker(did)
 
     def get_ui_device_ids(self) -> List[str]:  # Sửa: đổi tên và logic
@@ -374,9 +438,10 @@ class AppController(QObject):
         self.w.tbl_nox.setItem(r, 4, mk_item("IDLE"))
         self._hook_row_checkbox(r)
 
-    def sync_nox_table(self):
+    def sync_nox_table(self, adb_map: Optional[dict] = None):
         try:
-            adb_map = list_adb_ports_with_status()  # key là device_id, value là "Tên - Trạng thái"
+            if adb_map is None:
+                adb_map = self.deviceWatcher.snapshot()  # key là device_id, value là "Tên - Trạng thái"
             target_devices = sorted(adb_map.keys())
             current_devices = set(self.get_ui_device_ids())
 
@@ -416,7 +481,6 @@ class AppController(QObject):
             pass
 
     def on_tick(self):
-        self.sync_nox_table()
         for wk in self.workers.values(): wk.doTask()
 
     def on_worker_status(self, device_id: str, text: str):  # Sửa: nhận device_id
@@ -2,11 +2,17 @@
 from __future__ import annotations
 import os
 import re
+import json
 import time
+import hashlib
+import socket
+import struct
 import threading
 import subprocess
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, NamedTuple, Optional, Tuple
+
+from adb_cache import cached_shell
 
 def _run(cmd, timeout=8, text=True):
     try:
@@ -45,12 +51,13 @@ def _push_if_missing(adb, serial, local: Path, remote: str):
         _adb(adb, serial, "push", str(local), remote, timeout=30, text=True)
 
 def _detect_display_size(adb, serial) -> Tuple[int, int]:
-    code, out, _ = _adb_shell(adb, serial, "wm", "size", timeout=5)
+    code, out, _ = cached_shell(serial, "wm size", lambda: _adb_shell(adb, serial, "wm", "size", timeout=5))
     if code == 0 and out and "Physical size" in out:
         m = re.search(r"Physical size:\s*(\d+)\s*x\s*(\d+)", out)
         if m:
             return int(m.group(1)), int(m.group(2))
-    code, out, _ = _adb_shell(adb, serial, "dumpsys", "display", timeout=8)
+    code, out, _ = cached_shell(serial, "dumpsys display",
+                                lambda: _adb_shell(adb, serial, "dumpsys", "display", timeout=8))
     if code == 0 and out:
         m = re.search(r"deviceWidth=(\d+),\s*deviceHeight=(\d+)", out)
         if m:
@@ -59,7 +66,12 @@ def _detect_display_size(adb, serial) -> Tuple[int, int]:
 
 def _detect_rotation(adb, serial) -> int:
     # 0: portrait, 1: landscape, 2: reverse portrait, 3: reverse landscape
-    code, out, _ = _adb_shell(adb, serial, "dumpsys", "input", timeout=5)
+    # chỉ giữ dòng SurfaceOrientation trong cache, không giữ cả output dumpsys input
+    def _query():
+        code, out, err = _adb_shell(adb, serial, "dumpsys", "input", timeout=5)
+        m = re.search(r"SurfaceOrientation:\s*\d+", out or "")
+        return code, (m.group(0) if m else ""), err
+    code, out, _ = cached_shell(serial, "SurfaceOrientation", _query)
     if code == 0 and out:
         m = re.search(r"SurfaceOrientation:\s*(\d+)", out)
         if m:
@@ -68,11 +80,13 @@ def _detect_rotation(adb, serial) -> int:
     return 0
 
 def _detect_abi(adb, serial) -> str:
-    code, out, _ = _adb_shell(adb, serial, "getprop", "ro.product.cpu.abi", timeout=5)
+    code, out, _ = cached_shell(serial, "getprop ro.product.cpu.abi",
+                                lambda: _adb_shell(adb, serial, "getprop", "ro.product.cpu.abi", timeout=5))
     return out.strip() if code == 0 else "arm64-v8a"
 
 def _detect_sdk(adb, serial) -> str:
-    code, out, _ = _adb_shell(adb, serial, "getprop", "ro.build.version.sdk", timeout=5)
+    code, out, _ = cached_shell(serial, "getprop ro.build.version.sdk",
+                                lambda: _adb_shell(adb, serial, "getprop", "ro.build.version.sdk", timeout=5))
     return out.strip() if code == 0 else "29"
 
 def _find_vendor_minicap(abi: str, sdk: str) -> Tuple[Optional[Path], Optional[Path]]:
@@ -95,6 +109,50 @@ def _find_vendor_minicap(abi: str, sdk: str) -> Tuple[Optional[Path], Optional[P
     return (cand_bin if cand_bin.exists() else None,
             cand_so if cand_so.exists() else None)
 
+# ---------------- cache năng lực thiết bị (ABI/SDK/size/rotation) ----------------
+# Mỗi serial 1 file JSON; hợp lệ khi ro.build.fingerprint không đổi.
+_CAPS_DIR = Path(os.environ.get("BB_DEVICE_CACHE", "device_cache"))
+
+def _caps_path(serial: str) -> Path:
+    return _CAPS_DIR / (re.sub(r"[^0-9A-Za-z._-]", "_", serial) + ".json")
+
+def _load_caps(serial: str) -> Optional[dict]:
+    try:
+        return json.loads(_caps_path(serial).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def _save_caps(serial: str, caps: dict):
+    try:
+        _CAPS_DIR.mkdir(parents=True, exist_ok=True)
+        _atomic_write(_caps_path(serial), json.dumps(caps, ensure_ascii=False).encode("utf-8"))
+    except Exception:
+        pass
+
+def _file_md5(path: Path) -> Optional[str]:
+    try:
+        return hashlib.md5(path.read_bytes()).hexdigest()
+    except Exception:
+        return None
+
+def _probe_device(adb, serial, remotes) -> Tuple[str, dict]:
+    """
+    1 lần adb duy nhất: fingerprint + md5 của các file minicap trên máy.
+    Trả (fingerprint, {remote_path: md5}); md5 rỗng nếu máy không có md5sum/chưa có file.
+    """
+    script = "getprop ro.build.fingerprint; md5sum " + " ".join(remotes) + " 2>/dev/null"
+    code, out, _ = _adb_shell(adb, serial, script, timeout=5)
+    if code != 0 or not out:
+        return "", {}
+    lines = out.replace("\r", "").splitlines()
+    fingerprint = lines[0].strip() if lines else ""
+    sums = {}
+    for line in lines[1:]:
+        m = re.match(r"^([0-9a-fA-F]{32})\s+(\S+)\s*$", line.strip())
+        if m:
+            sums[m.group(2)] = m.group(1).lower()
+    return fingerprint, sums
+
 def _atomic_write(path: Path, payload: bytes):
     tmp = path.with_suffix(path.suffix + ".tmp")
     with open(tmp, "wb") as f:
@@ -113,14 +171,126 @@ def _extract_valid_jpeg(payload: bytes) -> Optional[bytes]:
         pass
     return None
 
+class FrameEntry(NamedTuple):
+    seq: int      # số thứ tự tăng dần, bắt đầu từ 1
+    ts: float     # time.monotonic() lúc nhận frame
+    data: bytes   # JPEG
+
+
+class FrameRing:
+    """
+    Ring buffer giữ N frame JPEG gần nhất trong RAM (thay cho file mailbox/last.jpg).
+    Thread-safe: 1 luồng ghi (worker), nhiều luồng đọc (flows).
+    """
+    def __init__(self, capacity: int = 8):
+        self.capacity = max(1, int(capacity))
+        self._slots: list[Optional[FrameEntry]] = [None] * self.capacity
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def push(self, data: bytes, ts: Optional[float] = None) -> int:
+        with self._cond:
+            self._seq += 1
+            self._slots[self._seq % self.capacity] = FrameEntry(
+                self._seq, time.monotonic() if ts is None else ts, data)
+            self._cond.notify_all()
+            return self._seq
+
+    def latest(self) -> Optional[FrameEntry]:
+        with self._cond:
+            if self._seq == 0:
+                return None
+            return self._slots[self._seq % self.capacity]
+
+    def get(self, seq: int) -> Optional[FrameEntry]:
+        """Lấy frame theo seq; None nếu đã bị ghi đè hoặc chưa tới."""
+        with self._cond:
+            if seq <= 0 or seq > self._seq or seq <= self._seq - self.capacity:
+                return None
+            return self._slots[seq % self.capacity]
+
+    def wait_newer(self, seq: int, timeout: float) -> Optional[FrameEntry]:
+        """Chờ tới khi có frame seq > `seq` (tối đa timeout giây)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout=max(0.0, timeout)):
+                return None
+            return self._slots[self._seq % self.capacity]
+
+
+# Banner minicap (24 byte, little-endian):
+#   version(1) banner_len(1) pid(4) real_w(4) real_h(4) virt_w(4) virt_h(4) orientation(1) quirks(1)
+_BANNER_FMT = "<BBIIIIIBB"
+_BANNER_LEN = struct.calcsize(_BANNER_FMT)
+
+
+def _free_local_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def _popen_hidden(cmd, **kw):
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return subprocess.Popen(cmd, startupinfo=startupinfo, **kw)
+
+
+class _StreamDropped(Exception):
+    """Socket minicap bị đóng/lỗi giữa chừng -> quay về chế độ snapshot."""
+
+
+class _StreamPaused(_StreamDropped):
+    """Tự tắt stream vì lâu không ai cần frame (không phải lỗi)."""
+
+
+class StreamParser:
+    """
+    Tách frame [len(4 byte LE)][JPEG] từ byte stream minicap (sau banner) khi đọc non-blocking
+    (CaptureHub đọc nhiều socket bằng selectors nên không dùng được _recv_exact).
+    """
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buf += data
+        out = []
+        while len(self._buf) >= 4:
+            (length,) = struct.unpack_from("<I", self._buf)
+            if length <= 0 or length > 32 * 1024 * 1024:
+                raise _StreamDropped(f"bad frame length {length}")
+            if len(self._buf) < 4 + length:
+                break
+            out.append(bytes(self._buf[4:4 + length]))
+            del self._buf[:4 + length]
+        return out
+
+
 class MinicapWorker(threading.Thread):
     """
-    Worker đơn giản: mỗi vòng gọi minicap lấy 1 JPEG, ghi vào mailbox/last.jpg.
-    Dùng 'adb exec-out' để tránh PTY làm hỏng dữ liệu nhị phân.
+    Worker lấy ảnh từ minicap, đẩy JPEG vào ring buffer trong RAM (self.ring).
+    Flows đọc qua latest()/get(seq); mailbox/last.jpg chỉ còn là debug sink (BB_MINICAP_MAILBOX=1).
+    - Chế độ stream (mặc định): chạy minicap 1 lần dạng socket server, 'adb forward' về cổng local,
+      đọc banner + các frame [len(4 byte LE)][JPEG] liên tục.
+    - Chế độ snapshot (fallback khi stream rớt): mỗi vòng gọi 'minicap -s' lấy 1 JPEG.
+      Dùng 'adb exec-out' để tránh PTY làm hỏng dữ liệu nhị phân.
+    Tắt stream bằng biến môi trường BB_MINICAP_STREAM=0.
+    Không start() thread thì có thể điều khiển từng bước (bootstrap/snapshot_once/offer_frame),
+    CaptureHub dùng cách này để chạy nhiều máy trên 1 pool chung.
+
+    Chụp theo nhu cầu: mỗi lần flow đọc frame (latest/get/wait_newer/current) hoặc gọi touch()
+    là "có người cần ảnh".
+      - active (trong BB_CAPTURE_ACTIVE_SEC giây sau lần cần gần nhất): chụp nhanh (BB_CAPTURE_FPS)
+      - idle: giảm còn BB_CAPTURE_IDLE_FPS
+      - paused (quá BB_CAPTURE_PAUSE_SEC, 0 = không bao giờ): dừng hẳn, tắt stream; touch() đánh thức.
     """
     def __init__(self, adb_path: str, serial: str, mailbox_dir: Path,
                  virt_size=(900, 1600), jpeg_quality: int = 100,
-                 force_rotation: Optional[int] = None):
+                 force_rotation: Optional[int] = None, ring_size: int = 8):
         super().__init__(name=f"MinicapWorker-{serial}", daemon=True)
         self.adb_path = adb_path
         self.serial = serial
@@ -132,6 +302,36 @@ class MinicapWorker(threading.Thread):
                                else force_rotation)
         self.virt_w, self.virt_h = virt_size
         self.stop_evt = threading.Event()
+        self.ring = FrameRing(int(os.environ.get("BB_FRAME_RING", str(ring_size))))
+        self.debug_mailbox = os.environ.get("BB_MINICAP_MAILBOX", "0") in ("1", "true", "True")
+        self.use_stream = os.environ.get("BB_MINICAP_STREAM", "1") not in ("0", "false", "False")
+        # snapshot bao lâu rồi mới thử dựng lại stream sau khi stream rớt
+        self.stream_retry_sec = float(os.environ.get("BB_MINICAP_STREAM_RETRY", "30"))
+        self.socket_name = "minicap"
+        # nhịp chụp theo nhu cầu (xem docstring lớp)
+        self.active_fps = float(os.environ.get("BB_CAPTURE_FPS", "15"))
+        self.idle_fps = float(os.environ.get("BB_CAPTURE_IDLE_FPS", "1"))
+        self.active_window = float(os.environ.get("BB_CAPTURE_ACTIVE_SEC", "2"))
+        self.pause_after = float(os.environ.get("BB_CAPTURE_PAUSE_SEC", "15"))
+        self._last_demand = time.monotonic()
+        self._demand_evt = threading.Event()
+        # True khi frame mới nhất trong ring chắc chắn là màn hình hiện tại
+        # (stream đang sống; frame bỏ vì nhịp nằm ở _pending, chưa mất)
+        self._ring_live = False
+        self._last_pub = 0.0
+        # frame stream bị bỏ do nhịp idle/max_fps: vẫn là màn hình mới nhất -> touch() publish bù
+        self._pending: Optional[bytes] = None
+        self._pending_ts = 0.0      # lúc NHẬN frame chờ (không phải lúc publish bù)
+        self._pending_lock = threading.Lock()
+        self._use_exec_out = True
+        self.remote_bin: Optional[str] = None
+        self.proj: Optional[str] = None
+        self._stream_proc: Optional[subprocess.Popen] = None
+        self._stream_sock: Optional[socket.socket] = None
+        self._stream_port: Optional[int] = None
+        self._stream_pid: Optional[int] = None
+        self.banner: Optional[dict] = None
+        self.caps: Optional[dict] = None
         self._last_frame_path = self.mailbox_dir / "last.jpg"
         try:
             for p in self.mailbox_dir.glob("*"):
@@ -144,17 +344,96 @@ class MinicapWorker(threading.Thread):
 
     def request_stop(self):
         self.stop_evt.set()
+        self._demand_evt.set()
 
     def frame_path(self) -> Path:
         return self._last_frame_path
 
+    # ---------------- nhu cầu frame ----------------
+    def touch(self):
+        """Báo có người cần frame: giữ worker ở nhịp nhanh, đánh thức nếu đang idle/paused."""
+        self._last_demand = time.monotonic()
+        self._demand_evt.set()
+        self._flush_pending()
+
+    def _flush_pending(self):
+        """Publish frame stream đã bỏ vì nhịp (nếu có) - màn hình tĩnh thì minicap không gửi frame sau."""
+        with self._pending_lock:
+            payload, self._pending = self._pending, None
+            recv_ts = self._pending_ts
+        if payload is None:
+            return
+        buf = _extract_valid_jpeg(payload)
+        if buf and len(buf) > 512:
+            # giữ ts lúc nhận: grab_screen_after so ts với lúc tap, frame cũ không được tính là "sau tap"
+            self._publish(buf, live=self._ring_live, ts=recv_ts)
+        else:
+            self._ring_live = False
+
+    def demand_state(self) -> str:
+        """'active' | 'idle' | 'paused' theo thời gian từ lần cần frame gần nhất."""
+        quiet = time.monotonic() - self._last_demand
+        if quiet <= self.active_window:
+            return "active"
+        if self.pause_after > 0 and quiet >= self.pause_after:
+            return "paused"
+        return "idle"
+
+    def _wait_for_demand(self):
+        """Ngủ tới khi có touch() hoặc stop (kiểm tra lại mỗi giây)."""
+        while not self.stop_evt.is_set() and self.demand_state() == "paused":
+            self._demand_evt.clear()
+            if self.demand_state() != "paused":
+                return
+            self._demand_evt.wait(1.0)
+
+    def _pace(self, t_start: float):
+        """Chờ giữa 2 lần chụp snapshot theo trạng thái nhu cầu; touch() cắt ngắn lúc chờ."""
+        state = self.demand_state()
+        if state == "paused":
+            self._wait_for_demand()
+            return
+        fps = self.active_fps if state == "active" else self.idle_fps
+        interval = (1.0 / fps) if fps > 0 else 0.0
+        wait = max(0.05, interval - (time.monotonic() - t_start))
+        if state == "active":
+            self.stop_evt.wait(wait)
+            return
+        self._demand_evt.clear()
+        if self.demand_state() == "active":
+            return
+        self._demand_evt.wait(wait)
+
+    def latest(self) -> Optional[FrameEntry]:
+        self.touch()
+        return self.ring.latest()
+
+    def get(self, seq: int) -> Optional[FrameEntry]:
+        self.touch()
+        return self.ring.get(seq)
+
+    def wait_newer(self, seq: int, timeout: float) -> Optional[FrameEntry]:
+        self.touch()
+        return self.ring.wait_newer(seq, timeout)
+
+    def current(self, max_age: float = 0.5, timeout: float = 1.5) -> Optional[FrameEntry]:
+        """
+        Frame phản ánh màn hình lúc gọi:
+          - stream đang sống -> frame mới nhất (touch() đã publish bù frame bị bỏ vì nhịp;
+            màn hình tĩnh thì minicap không gửi)
+          - frame mới nhất chưa quá max_age giây -> dùng luôn
+          - còn lại (idle/paused/stream rớt): đánh thức worker, chờ frame mới tối đa timeout giây.
+        None nếu không kịp có frame mới (caller fallback sang screencap).
+        """
+        self.touch()
+        ent = self.ring.latest()
+        if ent is not None and (self._ring_live or time.monotonic() - ent.ts <= max_age):
+            return ent
+        return self.ring.wait_newer(ent.seq if ent else 0, timeout)
+
     def read_latest_frame(self) -> Optional[bytes]:
-        try:
-            if self._last_frame_path.exists() and self._last_frame_path.stat().st_size > 0:
-                return self._last_frame_path.read_bytes()
-        except Exception:
-            pass
-        return None
+        ent = self.latest()
+        return ent.data if ent else None
 
     def _build_minicap_cmd(self, remote_bin: str, proj: str, use_exec_out: bool = True):
         # Dùng 'exec-out' để ra nhị phân sạch; kèm 'sh -c' để redirect stderr
@@ -171,59 +450,279 @@ class MinicapWorker(threading.Thread):
             "-P", proj, "-s", "-Q", str(self.jpeg_quality)
         ]
 
-    def run(self):
-        abi = _detect_abi(self.adb_path, self.serial)
-        sdk = _detect_sdk(self.adb_path, self.serial)
-        real_w, real_h = _detect_display_size(self.adb_path, self.serial)
-        rot_auto = _detect_rotation(self.adb_path, self.serial)
-        rot = rot_auto if self.force_rotation is None else int(self.force_rotation)
+    def _publish(self, buf: bytes, live: bool = False, ts: Optional[float] = None):
+        with self._pending_lock:
+            self._pending = None
+        self.ring.push(buf, ts=ts)
+        self._ring_live = live
+        self._last_pub = time.monotonic()
+        if self.debug_mailbox:
+            try:
+                _atomic_write(self._last_frame_path, buf)
+            except Exception:
+                pass
 
-        bin_path, so_path = _find_vendor_minicap(abi, sdk)
-        remote_bin = "/data/local/tmp/minicap"
-        remote_so = "/data/local/tmp/minicap.so"
+    # ---------------- stream mode ----------------
+    def offer_frame(self, payload: bytes, max_fps: float = 0.0) -> bool:
+        """
+        Nhận 1 frame từ stream, publish theo nhịp nhu cầu.
+        False = chưa publish:
+          - bỏ vì nhịp (idle/quá max_fps): giữ làm frame chờ, touch() kế tiếp publish bù -> ring vẫn 'live'
+          - JPEG hỏng: mất 1 lần cập nhật màn hình -> ring không còn 'live'
+        """
+        fps = max_fps if self.demand_state() == "active" else self.idle_fps
+        if fps > 0 and time.monotonic() - self._last_pub < 1.0 / fps:
+            with self._pending_lock:
+                self._pending = payload
+                self._pending_ts = time.monotonic()
+            return False
+        buf = _extract_valid_jpeg(payload)
+        if not buf or len(buf) <= 512:
+            self._ring_live = False
+            return False
+        self._publish(buf, live=True)
+        return True
 
-        if bin_path and so_path:
-            _push_if_missing(self.adb_path, self.serial, bin_path, remote_bin)
-            _push_if_missing(self.adb_path, self.serial, so_path, remote_so)
-            _adb_shell(self.adb_path, self.serial, "chmod", "0755", remote_bin)
+    def _recv_exact(self, sock: socket.socket, n: int, deadline: Optional[float] = None,
+                    pause_ok: bool = False) -> bytes:
+        """
+        Đọc đủ n byte; timeout chỉ để kiểm tra stop_evt (màn hình tĩnh thì minicap không gửi gì).
+        pause_ok: đang chờ frame mà worker đã sang 'paused' thì bỏ stream luôn.
+        """
+        buf = bytearray(n)
+        view = memoryview(buf)
+        got = 0
+        while got < n:
+            if self.stop_evt.is_set():
+                raise _StreamDropped("stop requested")
+            try:
+                k = sock.recv_into(view[got:], n - got)
+            except socket.timeout:
+                if deadline is not None and time.time() >= deadline:
+                    raise _StreamDropped("timeout")
+                if pause_ok and got == 0 and self.demand_state() == "paused":
+                    raise _StreamPaused("no demand")
+                continue
+            except OSError as e:
+                raise _StreamDropped(f"socket error: {e}")
+            if k == 0:
+                raise _StreamDropped("socket closed")
+            got += k
+        return bytes(buf)
 
-        # Nếu muốn ảnh không bị resample, có thể đặt virt=real.
-        # Ở đây giữ virt_size theo config (mặc định 900x1600) để khớp template.
-        proj = f"{real_w}x{real_h}@{self.virt_w}x{self.virt_h}/{rot}"
+    def _forward(self) -> Optional[int]:
+        # 'tcp:0' để adb tự chọn cổng trống (adb mới in cổng ra stdout); adb cũ -> tự chọn cổng.
+        code, out, _ = _adb(self.adb_path, self.serial, "forward", "tcp:0",
+                            f"localabstract:{self.socket_name}", timeout=5)
+        if code == 0 and out.strip().isdigit():
+            return int(out.strip())
+        port = _free_local_port()
+        code, _, _ = _adb(self.adb_path, self.serial, "forward", f"tcp:{port}",
+                          f"localabstract:{self.socket_name}", timeout=5)
+        return port if code == 0 else None
 
-        idle = 0.05
-        use_exec_out = True
-        while not self.stop_evt.is_set():
+    def _start_stream(self, remote_bin: str, proj: str) -> bool:
+        cmd = [
+            self.adb_path, "-s", self.serial, "shell",
+            f"LD_LIBRARY_PATH=/data/local/tmp {remote_bin} -n {self.socket_name} "
+            f"-P {proj} -Q {self.jpeg_quality} 2>/dev/null"
+        ]
+        try:
+            self._stream_proc = _popen_hidden(cmd, stdin=subprocess.DEVNULL,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception:
+            self._stream_proc = None
+            return False
+
+        self._stream_port = self._forward()
+        if not self._stream_port:
+            return False
+
+        # minicap cần chút thời gian để mở socket; adb forward vẫn accept nhưng đóng ngay nếu chưa sẵn sàng
+        deadline = time.time() + 8.0
+        while time.time() < deadline and not self.stop_evt.is_set():
+            if self._stream_proc.poll() is not None:
+                return False
+            sock = None
             try:
-                startupinfo = None
-                if os.name == 'nt':
-                    startupinfo = subprocess.STARTUPINFO()
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-                cmd = self._build_minicap_cmd(remote_bin, proj, use_exec_out=use_exec_out)
-                p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
-                out, err = p.communicate(timeout=8)
-
-                buf = _extract_valid_jpeg(out)
-                if not buf:
-                    # thử fallback sang 'shell' nếu exec-out gặp vấn đề đặc thù
-                    if use_exec_out:
-                        use_exec_out = False
-                        time.sleep(0.2)
-                        continue
-                if buf and len(buf) > 512:
+                sock = socket.create_connection(("127.0.0.1", self._stream_port), timeout=2.0)
+                sock.settimeout(1.0)
+                head = self._recv_exact(sock, 2, deadline=deadline)
+                version, banner_len = head[0], head[1]
+                rest = self._recv_exact(sock, banner_len - 2, deadline=deadline)
+                fields = struct.unpack(_BANNER_FMT, (head + rest)[:_BANNER_LEN])
+                self.banner = {
+                    "version": version, "pid": fields[2],
+                    "real_w": fields[3], "real_h": fields[4],
+                    "virt_w": fields[5], "virt_h": fields[6],
+                    "orientation": fields[7] * 90, "quirks": fields[8],
+                }
+                self._stream_pid = fields[2]
+                self._stream_sock = sock
+                return True
+            except (_StreamDropped, OSError, struct.error):
+                if sock is not None:
                     try:
-                        _atomic_write(self._last_frame_path, buf)
+                        sock.close()
                     except Exception:
                         pass
-                else:
-                    time.sleep(0.2)
-                time.sleep(idle)
-            except subprocess.TimeoutExpired:
-                try:
-                    p.kill()
-                except Exception:
-                    pass
-                time.sleep(0.2)
+                time.sleep(0.3)
+        return False
+
+    def _stop_stream(self):
+        with self._pending_lock:
+            self._pending = None
+        self._ring_live = False
+        if self._stream_sock is not None:
+            try:
+                self._stream_sock.close()
             except Exception:
+                pass
+            self._stream_sock = None
+        if self._stream_pid:
+            _adb_shell(self.adb_path, self.serial, "kill", str(self._stream_pid), timeout=3)
+            self._stream_pid = None
+        if self._stream_proc is not None:
+            try:
+                self._stream_proc.kill()
+            except Exception:
+                pass
+            self._stream_proc = None
+        if self._stream_port:
+            _adb(self.adb_path, self.serial, "forward", "--remove", f"tcp:{self._stream_port}", timeout=3)
+            self._stream_port = None
+
+    def _stream_loop(self, remote_bin: str, proj: str) -> Tuple[int, bool]:
+        """
+        Đọc frame liên tục cho tới khi stream rớt/stop/hết nhu cầu.
+        Trả (số frame đã publish, paused): paused=True nghĩa là tự tắt vì không ai cần frame.
+        Lúc idle vẫn đọc hết socket (minicap không bị nghẽn) nhưng chỉ publish theo BB_CAPTURE_IDLE_FPS.
+        """
+        frames = 0
+        if not self._start_stream(remote_bin, proj):
+            self._stop_stream()
+            return frames, False
+        try:
+            while not self.stop_evt.is_set():
+                (length,) = struct.unpack("<I", self._recv_exact(self._stream_sock, 4, pause_ok=True))
+                if length <= 0 or length > 32 * 1024 * 1024:
+                    raise _StreamDropped(f"bad frame length {length}")
+                payload = self._recv_exact(self._stream_sock, length)
+                if self.demand_state() == "paused":
+                    raise _StreamPaused("no demand")
+                if self.offer_frame(payload):
+                    frames += 1
+        except _StreamPaused:
+            return frames, True
+        except _StreamDropped:
+            pass
+        finally:
+            self._stop_stream()
+        return frames, False
+
+    # ---------------- snapshot mode ----------------
+    def snapshot_once(self, remote_bin: str, proj: str) -> Optional[bytes]:
+        """Chụp 1 JPEG bằng 'minicap -s' và publish; None nếu lỗi/ảnh hỏng."""
+        p = None
+        try:
+            startupinfo = None
+            if os.name == 'nt':
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+            cmd = self._build_minicap_cmd(remote_bin, proj, use_exec_out=self._use_exec_out)
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+            out, err = p.communicate(timeout=8)
+        except subprocess.TimeoutExpired:
+            try:
+                p.kill()
+            except Exception:
+                pass
+            return None
+        except Exception:
+            return None
+
+        buf = _extract_valid_jpeg(out)
+        if not buf and self._use_exec_out:
+            # thử fallback sang 'shell' nếu exec-out gặp vấn đề đặc thù
+            self._use_exec_out = False
+            return None
+        if buf and len(buf) > 512:
+            self._publish(buf)
+            return buf
+        return None
+
+    def _snapshot_loop(self, remote_bin: str, proj: str, until: Optional[float] = None):
+        while not self.stop_evt.is_set():
+            if until is not None and time.time() >= until:
+                return
+            t_start = time.monotonic()
+            if self.snapshot_once(remote_bin, proj) is None:
                 time.sleep(0.2)
+            self._pace(t_start)
+
+    def bootstrap(self) -> Tuple[str, str]:
+        """
+        Chuẩn bị minicap trên máy, trả (remote_bin, proj).
+        Warm start (fingerprint khớp cache + md5 binary khớp): chỉ tốn 1 lần adb (_probe_device).
+        Cold start: detect ABI/SDK/size/rotation như cũ rồi lưu cache; chỉ push khi hash đổi.
+        """
+        remote_bin = "/data/local/tmp/minicap"
+        remote_so = "/data/local/tmp/minicap.so"
+        fingerprint, remote_md5 = _probe_device(self.adb_path, self.serial, [remote_bin, remote_so])
+
+        caps = _load_caps(self.serial)
+        if not (caps and fingerprint and caps.get("fingerprint") == fingerprint):
+            real_w, real_h = _detect_display_size(self.adb_path, self.serial)
+            caps = {
+                "fingerprint": fingerprint,
+                "abi": _detect_abi(self.adb_path, self.serial),
+                "sdk": _detect_sdk(self.adb_path, self.serial),
+                "real_w": real_w, "real_h": real_h,
+                "rotation": _detect_rotation(self.adb_path, self.serial),
+            }
+            if fingerprint:
+                _save_caps(self.serial, caps)
+        self.caps = caps
+
+        rot = caps["rotation"] if self.force_rotation is None else int(self.force_rotation)
+        bin_path, so_path = _find_vendor_minicap(caps["abi"], caps["sdk"])
+
+        if bin_path and so_path:
+            pushed = False
+            for local, remote in ((bin_path, remote_bin), (so_path, remote_so)):
+                if not remote_md5:
+                    # máy không có md5sum -> so kích thước như cũ
+                    _push_if_missing(self.adb_path, self.serial, local, remote)
+                    pushed = True
+                elif remote_md5.get(remote) != _file_md5(local):
+                    _adb(self.adb_path, self.serial, "push", str(local), remote, timeout=30, text=True)
+                    pushed = True
+            if pushed:
+                _adb_shell(self.adb_path, self.serial, "chmod", "0755", remote_bin)
+
+        # Nếu muốn ảnh không bị resample, có thể đặt virt=real.
+        # Ở đây giữ virt_size theo config (mặc định 900x1600) để khớp template.
+        proj = f"{caps['real_w']}x{caps['real_h']}@{self.virt_w}x{self.virt_h}/{rot}"
+        self.remote_bin, self.proj = remote_bin, proj
+        return remote_bin, proj
+
+    def run(self):
+        remote_bin, proj = self.bootstrap()
+
+        while not self.stop_evt.is_set():
+            if self.demand_state() == "paused":
+                self._wait_for_demand()
+                continue
+            if self.use_stream:
+                _, paused = self._stream_loop(remote_bin, proj)
+                if self.stop_evt.is_set():
+                    break
+                if paused:
+                    # tắt vì không ai cần frame, không phải rớt -> chờ nhu cầu rồi dựng lại stream
+                    continue
+                # stream rớt/không dựng được -> snapshot một lúc rồi thử lại stream
+                self._snapshot_loop(remote_bin, proj, until=time.time() + self.stream_retry_sec)
+            else:
+                self._snapshot_loop(remote_bin, proj)
+        self._stop_stream()
@@ -9,16 +9,23 @@ import time
 import uuid
 import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import gc
 from pathlib import Path
 from typing import Optional, Tuple, Callable
-from image_data import IMAGE_DATA # Import dictionary dữ liệu ảnh
-import base64
 import cv2
 import numpy as np
 import pytesseract
 from pytesseract import Output
 import unicodedata
+from frame import Frame, as_frame, gray_of, hsv_of, clamp_region
+from frame_recorder import input_event_of
+from touch_inject import TouchInjector
+from text_input import TextEntry, input_text_arg
+from adb_cache import get_cache, cached_shell
+from adb_scheduler import run_scheduled
+from template_store import get_templates, template_key
 # ================== CẤU HÌNH ==================
 ADB = r"D:\Program Files\Nox\bin\nox_adb.exe"
 DEVICE = "127.0.0.1:62025"
@@ -84,7 +91,10 @@ def ensure_connected() -> None:
     log(f"✅ ADB đã kết nối {DEVICE}")
 
 def wm_size_str() -> str:
-    return adb("shell", "wm", "size").stdout.strip()
+    def _query():
+        p = adb("shell", "wm", "size")
+        return p.returncode, p.stdout.strip(), p.stderr
+    return cached_shell(DEVICE, "wm size", _query)[1]
 
 def tap_global(x: int, y: int, delay_ms: int = 0):
     adb("shell", "input", "tap", str(x), str(y))
@@ -95,7 +105,7 @@ def swipe_global(x1, y1, x2, y2, dur_ms=200):
     adb("shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(dur_ms))
 
 def input_text(text: str):
-    adb("shell", "input", "text", text.replace(" ", "%s"))
+    adb("shell", "input", "text", input_text_arg(text))
 
 
 # ================== MÀN HÌNH (toàn cục) ==================
@@ -123,49 +133,17 @@ def crop_wh(img, x, y, w, h):
 
 
 # ================== TEMPLATE MATCH (CÓ CACHE) ==================
-_template_cache: dict[str, np.ndarray] = {}
-
-
-def _load_image_from_b64(path_key: str) -> np.ndarray | None:
-    """
-    Giải mã một chuỗi Base64 từ dictionary IMAGE_DATA và chuyển thành ảnh OpenCV.
-    """
-    # Lấy chuỗi base64 từ dictionary bằng key (chính là đường dẫn)
-    b64_string = IMAGE_DATA.get(path_key)
-    if not b64_string:
-        # Nếu không tìm thấy, có thể ảnh mới chưa được mã hóa
-        raise FileNotFoundError(
-            f"Không tìm thấy dữ liệu ảnh cho key '{path_key}' trong image_data.py. Bạn đã chạy lại encode_images.py chưa?")
-
-    # Giải mã chuỗi Base64 về dạng nhị phân
-    image_bytes = base64.b64decode(b64_string)
-
-    # Chuyển dữ liệu nhị phân thành một mảng numpy
-    np_array = np.frombuffer(image_bytes, np.uint8)
-
-    # Đọc mảng numpy thành ảnh màu OpenCV
-    return cv2.imdecode(np_array, cv2.IMREAD_COLOR)
-
-
-# Cache vẫn giữ nguyên để tăng tốc
-_template_cache: dict[str, np.ndarray] = {}
-
+# Kho template dùng chung (template_store): LRU, thread-safe, có sẵn bản xám.
 
 def load_template(path: str) -> np.ndarray:
     """
-    Nâng cấp: Load ảnh từ cache, nếu không có thì giải mã từ image_data.py
+    Template màu (read-only) từ kho chung: đọc đĩa hoặc giải mã từ image_data.py lần đầu.
     """
-    # Chuẩn hóa đường dẫn để khớp với key trong dictionary
-    path_key = Path(path).as_posix()
-
-    if path_key not in _template_cache:
-        # Thay vì cv2.imread, chúng ta gọi hàm giải mã mới
-        mat = _load_image_from_b64(path_key)
-        if mat is None:
-            raise RuntimeError(f"Giải mã ảnh thất bại từ key: {path_key}")
-        _template_cache[path_key] = mat
-
-    return _template_cache[path_key]
+    mat = get_templates().get(path, gray=False)
+    if mat is None:
+        raise FileNotFoundError(
+            f"Không tìm thấy ảnh '{template_key(path)}' trên đĩa lẫn image_data.py. Bạn đã chạy lại encode_images.py chưa?")
+    return mat
 
 def match_template(screen: np.ndarray, template: np.ndarray, thr=DEFAULT_THR
                    ) -> Tuple[bool, Optional[Tuple[int,int]], float]:
@@ -216,12 +194,15 @@ def wait_visible(template_path: str, timeout: float = 10, thr=DEFAULT_THR, inter
 
 # ================== OCR ==================
 def _list_langs() -> str:
-    try:
-        _set_tess_prefix()
-        out = _run([TESSERACT_EXE, "--list-langs"], text=True, timeout=5).stdout
-        return out or ""
-    except Exception:
-        return ""
+    def _query() -> str:
+        try:
+            _set_tess_prefix()
+            out = _run([TESSERACT_EXE, "--list-langs"], text=True, timeout=5).stdout
+            return out or ""
+        except Exception:
+            return ""
+    # danh sách ngôn ngữ tesseract không đổi trong phiên -> cache theo máy host (serial "")
+    return get_cache().get("", "tesseract --list-langs", _query, keep=bool)
 
 
 def _lang_available(lang_code: str) -> bool:
@@ -229,7 +210,8 @@ def _lang_available(lang_code: str) -> bool:
 
 def ocr_image(img_bgr: np.ndarray, lang="vie", psm=6, whitelist: Optional[str] = None,
               save_debug: bool = False) -> str:
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    # nhận BGR, ảnh xám hoặc Frame (dùng lại plane xám đã cache)
+    gray = gray_of(img_bgr)
     gray = cv2.GaussianBlur(gray, (3,3), 0)
     gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1]
 
@@ -261,7 +243,10 @@ def ocr_image(img_bgr: np.ndarray, lang="vie", psm=6, whitelist: Optional[str] =
     return txt.strip()
 
 def ocr_region(img_bgr: np.ndarray, x1, y1, x2, y2, **kwargs) -> str:
-    roi = crop(img_bgr, x1, y1, x2, y2)
+    # Frame: cắt trên plane xám dùng chung thay vì convert lại ROI
+    roi = gray_of(img_bgr, (x1, y1, x2, y2)) if isinstance(img_bgr, Frame) else crop(img_bgr, x1, y1, x2, y2)
+    if roi is None:
+        return ""
     return ocr_image(roi, **kwargs)
 
 # ===== OCR: tìm vị trí dòng text tự do =====
@@ -295,7 +280,7 @@ def ocr_find_text_boxes(img_bgr, query: str, psm: int = 6,
     qnorm = _normalize_text(query)
 
     # Tiền xử lý giống ocr_image hiện có
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    gray = gray_of(img_bgr)
     gray = cv2.GaussianBlur(gray, (3,3), 0)
     gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1]
 
@@ -412,7 +397,7 @@ def type_text_via_adb(text: str, clear_first: bool=False, clear_taps: int=1, cle
 # ================== CLEAR RAM / CACHE ==================
 def clear_caches():
     try:
-        _template_cache.clear()
+        get_templates().clear()
     except Exception:
         pass
     try:
@@ -437,7 +422,45 @@ def log_wk(wk, msg: str):
         pass
     print(f"[{getattr(wk,'port',-1)}] {msg}", flush=True)
 
+def _record_input(wk, args):
+    """wk.recorder (frame_recorder.FrameRecorder) đang bật -> ghi lệnh 'shell input tap/swipe/keyevent/text'."""
+    rec = getattr(wk, "recorder", None)
+    if rec is None:
+        return
+    try:
+        ev = input_event_of(args)
+        if ev:
+            rec.add_input(*ev)
+    except Exception:
+        pass
+
+def _record_frame(wk, img):
+    """Ghi frame flow vừa nhận vào wk.recorder (nếu có); trả lại img."""
+    rec = getattr(wk, "recorder", None)
+    if rec is not None and img is not None:
+        try:
+            rec.add_frame(img)
+        except Exception as e:
+            log_wk(wk, f"recorder lỗi: {e}")
+    return img
+
+def _session_run(sess):
+    """fn(args, timeout) cho run_scheduled: chạy 'shell ...' trên session; None = chưa gửi được."""
+    return lambda args, timeout: sess.run(" ".join(str(a) for a in args[1:]), timeout=timeout)
+
 def adb_safe(wk, *args, timeout=6):
+    _record_input(wk, args)
+    # 'shell ...' đi qua adb shell sống lâu của máy (adb_shell_session) nếu có; adb cũng nối args bằng dấu cách.
+    # Vẫn xếp hàng qua adb_scheduler như wk.adb: input đi trước probe, chung trần lệnh/máy.
+    sess = getattr(wk, "shell_session", None) if wk is not None else None
+    if sess is not None and len(args) > 1 and args[0] == "shell":
+        try:
+            res = run_scheduled(getattr(sess, "serial", "") or "", _session_run(sess), args, timeout,
+                                (124, "", "timeout"))
+            if res is not None:
+                return res
+        except Exception as e:
+            log_wk(wk, f"shell session lỗi: {e}")
     try:
         if wk and hasattr(wk, "adb") and callable(wk.adb):
             return wk.adb(*args, timeout=timeout)
@@ -516,6 +539,83 @@ def screencap_bytes_wk(wk) -> Optional[bytes]:
         except Exception as e:
             log_wk(wk, f"Cảnh báo: Lỗi khi dọn dẹp file tạm: {e}")
 
+# format pixel của `screencap` (không -p) -> số byte/pixel
+_RAW_BPP = {1: 4, 2: 4, 3: 3, 4: 2, 5: 4}
+_RAW_CHUNK = 1 << 20
+
+def _wk_adb_cmd(wk) -> Optional[list]:
+    """[adb, -s, serial] của wk (SimpleNoxWorker/EmulatorWorker) hoặc cấu hình toàn cục khi wk=None."""
+    if wk is None:
+        return [ADB, "-s", DEVICE]
+    adb_path = getattr(wk, "_adb", None)
+    serial = getattr(wk, "_serial", None) or getattr(wk, "device_id", None)
+    if not adb_path or not serial or not isinstance(adb_path, (str, os.PathLike)):
+        return None
+    return [str(adb_path), "-s", str(serial)]
+
+def screencap_raw_wk(wk=None, timeout: float = 6.0) -> Optional[np.ndarray]:
+    """
+    Chụp qua 'exec-out screencap' (raw, KHÔNG PNG, không file tạm) -> ảnh BGR.
+    Output: header [w, h, format] (+ colorspace từ Android 9) rồi tới pixel.
+    Đọc theo chunk vào buffer cấp phát sẵn (giữ lại trên wk cho lần sau) để tránh MemoryError.
+    Trả None nếu không dùng được -> caller fallback sang screencap -p.
+    """
+    cmd = _wk_adb_cmd(wk)
+    if cmd is None:
+        return None
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    p = subprocess.Popen(cmd + ["exec-out", "screencap"], stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, startupinfo=startupinfo)
+    killer = threading.Timer(timeout, p.kill)
+    killer.start()
+    try:
+        head = p.stdout.read(12)
+        if len(head) < 12:
+            return None
+        w, h, fmt = np.frombuffer(head, dtype="<u4", count=3).tolist()
+        bpp = _RAW_BPP.get(fmt)
+        if not bpp or not (0 < w <= 8192 and 0 < h <= 8192):
+            return None
+        n_px = w * h * bpp
+        need = n_px + 4  # +4 cho colorspace (Android 9+)
+        holder = wk if wk is not None else sys.modules[__name__]
+        buf = getattr(holder, "_raw_cap_buf", None)
+        if buf is None or len(buf) < need:
+            buf = bytearray(need)
+            setattr(holder, "_raw_cap_buf", buf)
+        view = memoryview(buf)
+        got = 0
+        while got < need:
+            k = p.stdout.readinto(view[got:min(need, got + _RAW_CHUNK)])
+            if not k:
+                break
+            got += k
+        if got == need:
+            off = 4
+        elif got == n_px:
+            off = 0
+        else:
+            return None
+        px = np.frombuffer(buf, dtype=np.uint8, count=n_px, offset=off)
+        if bpp == 4:
+            code = cv2.COLOR_BGRA2BGR if fmt == 5 else cv2.COLOR_RGBA2BGR
+            return cv2.cvtColor(px.reshape(h, w, 4), code)
+        if bpp == 3:
+            return cv2.cvtColor(px.reshape(h, w, 3), cv2.COLOR_RGB2BGR)
+        return cv2.cvtColor(px.view("<u2").reshape(h, w), cv2.COLOR_BGR5652BGR)
+    except Exception:
+        return None
+    finally:
+        killer.cancel()
+        try:
+            p.kill()
+            p.wait(timeout=1)
+        except Exception:
+            pass
+
 def _try_wk_frame_fetcher(wk) -> Optional[np.ndarray]:
     """
     Nếu wk có frame_fetcher() trả về bytes ảnh (JPEG/PNG), dùng nó thay cho screencap.
@@ -536,31 +636,79 @@ def _try_wk_frame_fetcher(wk) -> Optional[np.ndarray]:
     return None
 
 
-def grab_screen_np(wk=None) -> Optional[np.ndarray]:
+def _try_wk_frame_ring(wk) -> Optional[np.ndarray]:
+    """
+    Nếu wk có `minicap` (MinicapWorker với ring buffer), lấy frame mới nhất trực tiếp từ RAM.
+    Frame cũ (worker đang idle/paused) bị bỏ: current() đánh thức worker và chờ frame mới
+    (BB_FRAME_MAX_AGE, BB_FRAME_WAKE_WAIT).
+    Trả None nếu chưa có frame để fallback sang frame_fetcher/screencap.
     """
-    Ưu tiên lấy ảnh từ Minicap (wk.frame_fetcher) nếu có.
+    try:
+        src = getattr(wk, "minicap", None)
+        if src is None or not callable(getattr(src, "latest", None)):
+            return None
+        if callable(getattr(src, "current", None)):
+            ent = src.current(max_age=float(os.environ.get("BB_FRAME_MAX_AGE", "0.5")),
+                              timeout=float(os.environ.get("BB_FRAME_WAKE_WAIT", "1.5")))
+        else:
+            ent = src.latest()
+        if ent is None or not ent.data:
+            return None
+        # decode 1 lần / frame: gọi lại khi chưa có frame mới thì dùng lại Frame (kèm cache gray/HSV)
+        cached = getattr(wk, "_frame_cache", None)
+        if cached is not None and cached.seq == ent.seq:
+            return cached
+        img = cv2.imdecode(np.frombuffer(ent.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        frm = Frame(img, seq=ent.seq, ts=ent.ts)
+        setattr(wk, "_frame_cache", frm)
+        return frm
+    except Exception as e:
+        try:
+            log_wk(wk, f"frame ring lỗi: {e}")
+        except Exception:
+            pass
+    return None
+
+
+def _try_wk_capture_hub(wk) -> Optional[Frame]:
+    """Nếu runner chạy qua CaptureHub (BB_CAPTURE_HUB=1): lấy Frame đã decode từ hub.get_frame(serial)."""
+    hub = getattr(wk, "capture_hub", None)
+    if hub is None:
+        return None
+    try:
+        serial = getattr(wk, "device_id", None) or getattr(wk, "_serial", None)
+        return hub.get_frame(serial) if serial else None
+    except Exception as e:
+        try:
+            log_wk(wk, f"capture hub lỗi: {e}")
+        except Exception:
+            pass
+    return None
+
+
+def grab_screen_np(wk=None) -> Optional[Frame]:
+    """
+    Ưu tiên lấy ảnh từ Minicap: CaptureHub (wk.capture_hub) / ring buffer (wk.minicap.latest())
+    rồi tới wk.frame_fetcher.
     Nếu không có/ lỗi, fallback về screencap logic gốc để BẢO TOÀN HÀNH VI CŨ.
     Kèm theo ghi nhận nguồn frame cho mục đích debug/giám sát.
+    Trả về Frame (ndarray BGR + seq/ts + cache gray/HSV) để các detector dùng chung.
     """
     try:
         if wk is not None:
-            img = _try_wk_frame_fetcher(wk)
+            t_fetch = time.monotonic()
+            img = _try_wk_capture_hub(wk)
+            if img is None and getattr(wk, "capture_hub", None) is None:
+                img = _try_wk_frame_ring(wk)
+            if img is None:
+                img = as_frame(_try_wk_frame_fetcher(wk), ts=t_fetch)
             if img is not None:
                 _frame_src_note(wk, "minicap")
-                return img
+                return _record_frame(wk, img)
 
-        raw = screencap_bytes_wk(wk) if wk is not None else screencap_bytes()
-        if not raw:
-            if wk is not None:
-                log_wk(wk, "Không chụp được màn hình.")
-            else:
-                log("Không chụp được màn hình.")
-            return None
-
-        img = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR)
-        if wk is not None:
-            _frame_src_note(wk, "screencap")
-        return img
+        return _record_frame(wk, _grab_screencap_frame(wk))
 
     except Exception as e:
         if wk is not None:
@@ -569,6 +717,63 @@ def grab_screen_np(wk=None) -> Optional[np.ndarray]:
             log(f"imdecode lỗi: {e}")
         return None
 
+def _grab_screencap_frame(wk=None) -> Optional[Frame]:
+    """
+    Chụp trực tiếp qua ADB screencap (luôn là ảnh tại thời điểm gọi).
+    Ưu tiên raw framebuffer (screencap_raw_wk); tắt bằng BB_SCREENCAP_RAW=0.
+    """
+    t_cap = time.monotonic()
+    if os.environ.get("BB_SCREENCAP_RAW", "1") not in ("0", "false", "False"):
+        img = screencap_raw_wk(wk)
+        if img is not None:
+            if wk is not None:
+                _frame_src_note(wk, "screencap")
+            return as_frame(img, ts=t_cap)
+    raw = screencap_bytes_wk(wk) if wk is not None else screencap_bytes()
+    if not raw:
+        if wk is not None:
+            log_wk(wk, "Không chụp được màn hình.")
+        else:
+            log("Không chụp được màn hình.")
+        return None
+
+    img = as_frame(cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR), ts=t_cap)
+    if wk is not None:
+        _frame_src_note(wk, "screencap")
+    return img
+
+def grab_screen_after(wk, t_action: Optional[float] = None, timeout: float = 2.0) -> Optional[Frame]:
+    """
+    Chờ frame được chụp SAU mốc t_action (time.monotonic(); mặc định wk._last_action_ts do tap/swipe ghi).
+    - Có ring buffer minicap: chờ frame mới có ts > t_action (tối đa timeout giây).
+    - Hết timeout (minicap đứng/màn hình tĩnh) hoặc không có ring: chụp screencap trực tiếp (luôn mới).
+    """
+    if t_action is None:
+        t_action = getattr(wk, "_last_action_ts", None)
+    if wk is None or t_action is None:
+        return grab_screen_np(wk)
+    try:
+        src = getattr(wk, "minicap", None)
+        if src is None or not callable(getattr(src, "wait_newer", None)):
+            # không có ring: grab thường (frame_fetcher/screencap đều là ảnh tại lúc gọi)
+            return grab_screen_np(wk)
+        end = time.monotonic() + max(0.0, timeout)
+        while True:
+            ent = src.latest()
+            if ent is not None and ent.ts > t_action:
+                img = _try_wk_frame_ring(wk)
+                if img is not None:
+                    _frame_src_note(wk, "minicap")
+                    return _record_frame(wk, img)
+            remaining = end - time.monotonic()
+            if remaining <= 0 or aborted(wk):
+                break
+            src.wait_newer(ent.seq if ent else 0, min(remaining, 0.2))
+        return _record_frame(wk, _grab_screencap_frame(wk))
+    except Exception as e:
+        log_wk(wk, f"grab_screen_after lỗi: {e}")
+        return None
+
 def _frame_src_note(wk, src_name):
     """
     Ghi nhận nguồn frame ('minicap' | 'screencap') vào wk, chỉ log khi chuyển nguồn.
@@ -600,6 +805,71 @@ def get_frame_source(wk):
 
 
 
+# ---------- pyramid coarse-to-fine ----------
+_PYR_MIN_TPL = 8            # cạnh template sau khi thu nhỏ tối thiểu (nhỏ hơn -> giảm cấp / khớp thường)
+_PYR_MIN_AREA = 96 * 96     # vùng kết quả nhỏ hơn -> khớp full luôn rẻ hơn
+_PYR_REJECT_MARGIN = 0.25   # điểm thô < threshold - margin -> coi như không có, khỏi refine
+
+def _pyramid_level() -> int:
+    try:
+        return int(os.environ.get("BB_MATCH_PYRAMID", "0") or 0)
+    except ValueError:
+        return 0
+
+def _pyramid_match(img, tpl, template_path: str, grayscale: bool, factor: int, top_k: int, threshold: float):
+    """
+    Khớp thô ở 1/factor rồi khớp lại full-res chỉ trong cửa sổ nhỏ quanh top_k ứng viên.
+    Trả (score, top_left) ở toạ độ của img; None nếu không đáng dùng pyramid (caller khớp thường).
+    Khi bị loại sớm ở mức thô, score trả về là điểm thô (xấp xỉ).
+    """
+    ih, iw = img.shape[:2]
+    th, tw = tpl.shape[:2]
+    while factor > 1 and min(th, tw) // factor < _PYR_MIN_TPL:
+        factor //= 2
+    if factor <= 1 or (ih - th + 1) * (iw - tw + 1) < _PYR_MIN_AREA:
+        return None
+    s = 1.0 / factor
+    tpl_s = get_templates().get(template_path, gray=grayscale, scale=s)
+    img_s = cv2.resize(img, (max(1, int(iw * s)), max(1, int(ih * s))), interpolation=cv2.INTER_AREA)
+    ths, tws = tpl_s.shape[:2]
+    if img_s.shape[0] < ths or img_s.shape[1] < tws:
+        return None
+    coarse = cv2.matchTemplate(img_s, tpl_s, cv2.TM_CCOEFF_NORMED,
+                               result=_match_buffer(img_s.shape[0] - ths + 1, img_s.shape[1] - tws + 1))
+
+    # top-k: lấy max rồi xoá vùng lân cận (cỡ nửa template) để ứng viên sau không trùng chỗ
+    cands = []
+    best_coarse = -1.0
+    for _ in range(max(1, int(top_k))):
+        _, v, _, loc = cv2.minMaxLoc(coarse)
+        if not cands:
+            best_coarse = float(v)
+            if v < threshold - _PYR_REJECT_MARGIN:
+                return best_coarse, (int(loc[0] * factor), int(loc[1] * factor))
+        elif v < threshold - _PYR_REJECT_MARGIN:
+            break
+        cands.append(loc)
+        x, y = loc
+        coarse[max(0, y - ths // 2):y + ths // 2 + 1, max(0, x - tws // 2):x + tws // 2 + 1] = -1.0
+
+    pad = factor * 2 + 2
+    best = (-1.0, None)
+    for cx, cy in cands:
+        x0 = max(0, cx * factor - pad); y0 = max(0, cy * factor - pad)
+        x1 = min(iw, cx * factor + tw + pad); y1 = min(ih, cy * factor + th + pad)
+        win = img[y0:y1, x0:x1]
+        if win.shape[0] < th or win.shape[1] < tw:
+            continue
+        res = cv2.matchTemplate(win, tpl, cv2.TM_CCOEFF_NORMED,
+                                result=_match_buffer(win.shape[0] - th + 1, win.shape[1] - tw + 1))
+        _, v, _, loc = cv2.minMaxLoc(res)
+        if v > best[0]:
+            best = (float(v), (loc[0] + x0, loc[1] + y0))
+    if best[1] is None:
+        return best_coarse, (int(cands[0][0] * factor), int(cands[0][1] * factor))
+    return best
+
+
 def find_on_frame(
         frame_bgr_or_gray,
         template_path: str,
@@ -609,9 +879,16 @@ def find_on_frame(
         grayscale: bool = True,
         allow_downscale: bool = False,
         max_dim: int = 1280,
+        pyramid: int | None = None,
+        top_k: int = 3,
 ):
     """
     Khớp template trên 1 frame (hoặc ROI).
+    frame_bgr_or_gray: ndarray BGR/xám hoặc Frame (dùng lại plane xám đã cache của frame).
+    pyramid: 2 | 4 -> tìm ứng viên ở 1/2 | 1/4 rồi khớp lại full-res quanh top_k ứng viên
+             (None = theo BB_MATCH_PYRAMID, mặc định 0 = tắt: phần lớn flow khớp ROI nhỏ, không lợi;
+             flow tìm vùng rộng tự truyền pyramid=2 - số đo ở bench_template_match.py).
+             Bật pyramid thì bỏ qua allow_downscale.
     Trả: (ok: bool, point: (x,y) | None, score: float) - Point là TÂM của vùng khớp.
     """
     import cv2
@@ -620,36 +897,45 @@ def find_on_frame(
     if frame_bgr_or_gray is None:
         return False, None, 0.0
 
-    tpl = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    tpl = get_templates().get(template_path, gray=grayscale)
     if tpl is None or tpl.size == 0:
         return False, None, 0.0
 
-    img = frame_bgr_or_gray
-
-    if grayscale and img.ndim == 3:
-        try:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        except Exception:
-            return False, None, 0.0
+    frame = frame_bgr_or_gray
 
     offx = offy = 0
+    reg = None
     if region is not None:
+        reg = clamp_region(frame.shape, region)
+        if reg is None:
+            return False, None, 0.0
+        offx, offy = reg[0], reg[1]
+
+    try:
+        if grayscale and frame.ndim == 3:
+            img = gray_of(frame, reg)
+        elif reg is not None:
+            img = np.asarray(frame)[reg[1]:reg[3], reg[0]:reg[2]]
+        else:
+            img = np.asarray(frame)
+    except Exception:
+        return False, None, 0.0
+    if img is None or img.size == 0:
+        return False, None, 0.0
+
+    if pyramid is None:
+        pyramid = _pyramid_level()
+    if pyramid and pyramid > 1:
         try:
-            x1, y1, x2, y2 = region
+            pm = _pyramid_match(img, tpl, template_path, grayscale, int(pyramid), top_k, float(threshold))
         except Exception:
-            return False, None, 0.0
-        h, w = img.shape[:2]
-        x1 = max(0, min(int(x1), w));
-        x2 = max(0, min(int(x2), w))
-        y1 = max(0, min(int(y1), h));
-        y2 = max(0, min(int(y2), h))
-        if x2 <= x1 or y2 <= y1:
-            return False, None, 0.0
-        roi = img[y1:y2, x1:x2]
-        if roi is None or roi.size == 0:
-            return False, None, 0.0
-        img = roi.copy()
-        offx, offy = x1, y1
+            pm = None
+        if pm is not None:
+            score, loc = pm
+            if score < float(threshold):
+                return False, None, score
+            th, tw = tpl.shape[:2]
+            return True, (loc[0] + tw // 2 + offx, loc[1] + th // 2 + offy), score
 
     scale = 1.0
     ih, iw = img.shape[:2]
@@ -658,8 +944,7 @@ def find_on_frame(
         new_w = max(1, int(iw * scale));
         new_h = max(1, int(ih * scale))
         img_use = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        th, tw = tpl.shape[:2]
-        tpl_use = cv2.resize(tpl, (max(1, int(tw * scale)), max(1, int(th * scale))), interpolation=cv2.INTER_AREA)
+        tpl_use = get_templates().get(template_path, gray=grayscale, scale=scale)
     else:
         img_use = img
         tpl_use = tpl
@@ -692,6 +977,170 @@ def find_on_frame(
     center_y_original = int(center_y_scaled / scale) + offy
 
     return True, (center_x_original, center_y_original), score
+
+
+# ---------- nhiều template trên cùng 1 frame ----------
+_MATCH_POOL: Optional[ThreadPoolExecutor] = None
+_MATCH_POOL_LOCK = threading.Lock()
+_MATCH_LOCAL = threading.local()
+
+def _match_pool() -> ThreadPoolExecutor:
+    """Pool dùng chung cho find_many_on_frame (cv2.matchTemplate nhả GIL nên chạy song song thật)."""
+    global _MATCH_POOL
+    with _MATCH_POOL_LOCK:
+        if _MATCH_POOL is None:
+            n = int(os.environ.get("BB_MATCH_THREADS", "0") or 0) or min(4, os.cpu_count() or 2)
+            _MATCH_POOL = ThreadPoolExecutor(max_workers=n, thread_name_prefix="match")
+        return _MATCH_POOL
+
+def _match_buffer(h: int, w: int) -> np.ndarray:
+    """Buffer kết quả matchTemplate dùng lại theo kích thước (mỗi thread 1 bộ)."""
+    bufs = getattr(_MATCH_LOCAL, "bufs", None)
+    if bufs is None:
+        bufs = _MATCH_LOCAL.bufs = {}
+    buf = bufs.get((h, w))
+    if buf is None:
+        if len(bufs) >= 32:
+            bufs.clear()
+        buf = bufs[(h, w)] = np.empty((h, w), np.float32)
+    return buf
+
+def find_many_on_frame(frame_bgr_or_gray, specs, *, grayscale: bool = True,
+                       parallel: Optional[bool] = None) -> dict:
+    """
+    Khớp nhiều template trên CÙNG 1 frame ("cái nào đang có trên màn hình?").
+    specs: [(template_path, region | None, threshold | None), ...] (threshold None = 0.85 như find_on_frame).
+    - Kẹp ROI + chuyển xám 1 lần cho vùng bao tất cả ROI; buffer kết quả dùng lại.
+    - parallel=True (hoặc BB_MATCH_PARALLEL=1) -> chạy matchTemplate trên pool thread.
+    Trả {template_path: {"ok", "pt", "score", "ms"}} (pt là TÂM vùng khớp).
+    Mỗi template chỉ được 1 spec (kết quả theo path) -> trùng path: ValueError; cần nhiều ROI thì gọi riêng.
+    """
+    paths = [spec[0] for spec in specs]
+    if len(set(paths)) != len(paths):
+        dup = sorted({p for p in paths if paths.count(p) > 1})
+        raise ValueError(f"find_many_on_frame: template lặp lại trong specs: {dup}")
+    miss = lambda: {"ok": False, "pt": None, "score": 0.0, "ms": 0.0}
+    out = {}
+    if frame_bgr_or_gray is None:
+        return {spec[0]: miss() for spec in specs}
+
+    jobs = []
+    full = (0, 0, frame_bgr_or_gray.shape[1], frame_bgr_or_gray.shape[0])
+    for spec in specs:
+        path, region, thr = (tuple(spec) + (None, None))[:3]
+        reg = clamp_region(frame_bgr_or_gray.shape, region) if region is not None else full
+        if reg is None:
+            out[path] = miss()
+            continue
+        jobs.append((path, reg, 0.85 if thr is None else float(thr)))
+    if not jobs:
+        return out
+
+    ux1 = min(j[1][0] for j in jobs); uy1 = min(j[1][1] for j in jobs)
+    ux2 = max(j[1][2] for j in jobs); uy2 = max(j[1][3] for j in jobs)
+    try:
+        if grayscale and frame_bgr_or_gray.ndim == 3:
+            base = gray_of(frame_bgr_or_gray, (ux1, uy1, ux2, uy2))
+        else:
+            base = np.asarray(frame_bgr_or_gray)[uy1:uy2, ux1:ux2]
+    except Exception:
+        base = None
+    if base is None or base.size == 0:
+        out.update({j[0]: miss() for j in jobs})
+        return out
+
+    def _one(job):
+        path, (x1, y1, x2, y2), thr = job
+        t0 = time.perf_counter()
+        r = {"ok": False, "pt": None, "score": 0.0}
+        tpl = get_templates().get(path, gray=grayscale)
+        img = base[y1 - uy1:y2 - uy1, x1 - ux1:x2 - ux1]
+        if tpl is not None and tpl.size and img.ndim == tpl.ndim:
+            th, tw = tpl.shape[:2]
+            ih, iw = img.shape[:2]
+            if ih >= th and iw >= tw:
+                try:
+                    res = cv2.matchTemplate(img, tpl, cv2.TM_CCOEFF_NORMED,
+                                            result=_match_buffer(ih - th + 1, iw - tw + 1))
+                    _, max_val, _, max_loc = cv2.minMaxLoc(res)
+                    r["score"] = float(max_val)
+                    if r["score"] >= thr:
+                        r["ok"] = True
+                        r["pt"] = (max_loc[0] + tw // 2 + x1, max_loc[1] + th // 2 + y1)
+                except Exception:
+                    pass
+        r["ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        return path, r
+
+    if parallel is None:
+        parallel = os.environ.get("BB_MATCH_PARALLEL", "0") in ("1", "true", "True")
+    if parallel and len(jobs) > 1:
+        results = list(_match_pool().map(_one, jobs))
+    else:
+        results = [_one(j) for j in jobs]
+    out.update(results)
+    return out
+
+
+def find_all_on_frame(frame_bgr_or_gray, template_path: str, *,
+                      region: tuple[int, int, int, int] | None = None,
+                      threshold: float = 0.85, grayscale: bool = True,
+                      max_count: int | None = None, min_dist: int | None = None) -> list:
+    """
+    Tìm MỌI chỗ khớp template (mồi/tường trong snake, ô trong danh sách...).
+    - Đỉnh cục bộ lấy vectorized: res == dilate(res) trong cửa sổ (2*min_dist+1) và res >= threshold
+      (khỏi quét hàng nghìn điểm sát nhau quanh 1 vật bằng vòng lặp Python).
+    - Sau đó NMS tham lam theo điểm: bỏ đỉnh cách đỉnh đã giữ < min_dist theo cả 2 trục
+      (min_dist None = nửa cạnh nhỏ của template).
+    Trả [(x, y, score), ...] - (x, y) là TÂM, điểm giảm dần, tối đa max_count phần tử.
+    """
+    if frame_bgr_or_gray is None:
+        return []
+    tpl = get_templates().get(template_path, gray=grayscale)
+    if tpl is None or tpl.size == 0:
+        return []
+    frame = frame_bgr_or_gray
+    reg = clamp_region(frame.shape, region) if region is not None else (0, 0, frame.shape[1], frame.shape[0])
+    if reg is None:
+        return []
+    try:
+        if grayscale and frame.ndim == 3:
+            img = gray_of(frame, reg)
+        else:
+            img = np.asarray(frame)[reg[1]:reg[3], reg[0]:reg[2]]
+    except Exception:
+        return []
+    th, tw = tpl.shape[:2]
+    if img is None or img.ndim != tpl.ndim or img.shape[0] < th or img.shape[1] < tw:
+        return []
+    try:
+        res = cv2.matchTemplate(img, tpl, cv2.TM_CCOEFF_NORMED,
+                                result=_match_buffer(img.shape[0] - th + 1, img.shape[1] - tw + 1))
+    except Exception:
+        return []
+
+    r = max(1, int(min_dist if min_dist is not None else min(th, tw) // 2))
+    peaks = (res >= float(threshold)) & (res >= cv2.dilate(res, np.ones((2 * r + 1, 2 * r + 1), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    if xs.size == 0:
+        return []
+    scores = res[ys, xs]
+    order = np.argsort(-scores, kind="stable")
+    xs, ys, scores = xs[order], ys[order], scores[order]
+
+    # vùng phẳng (nhiều điểm cùng max) vẫn còn đỉnh sát nhau -> NMS trên số ít đỉnh còn lại
+    limit = int(max_count) if max_count else xs.size
+    keep = []
+    for i in range(xs.size):
+        if keep:
+            k = np.asarray(keep)
+            if np.any((np.abs(xs[k] - xs[i]) < r) & (np.abs(ys[k] - ys[i]) < r)):
+                continue
+        keep.append(i)
+        if len(keep) >= limit:
+            break
+    ox, oy = reg[0] + tw // 2, reg[1] + th // 2
+    return [(int(xs[i]) + ox, int(ys[i]) + oy, float(scores[i])) for i in keep]
 # ==== CLOUD API (chuẩn dùng chung cho toàn app) ====
 import os, json, platform, hashlib, uuid, requests
 from pathlib import Path
@@ -823,21 +1272,204 @@ def api_license_status() -> dict:
     return data
 
 
-def tap(wk, x, y):
+def _mark_action(wk) -> float:
+    """Ghi mốc time.monotonic() của thao tác vừa gửi vào wk._last_action_ts (dùng cho grab_screen_after)."""
+    t = time.monotonic()
+    if wk is not None:
+        try:
+            setattr(wk, "_last_action_ts", t)
+        except Exception:
+            pass
+    return t
+
+def touch_injector(wk) -> Optional[TouchInjector]:
+    """
+    Backend sendevent (touch_inject) của wk, dò 1 lần rồi nhớ trên wk._touch.
+    BB_TOUCH=input: luôn dùng 'input'; auto (mặc định): sendevent nếu dò được touchscreen ghi được.
+    """
+    if wk is None or os.environ.get("BB_TOUCH", "auto").lower() == "input":
+        return None
+    inj = getattr(wk, "_touch", None)
+    if inj is None:
+        try:
+            inj = TouchInjector.discover(lambda cmd, timeout=3: adb_safe(wk, "shell", cmd, timeout=timeout))
+        except Exception:
+            inj = None
+        if inj is not None:
+            log_wk(wk, f"[TOUCH] sendevent qua {inj.device} ({inj.name}), "
+                       f"x{inj.x_range} y{inj.y_range}, screen {inj.screen_w}x{inj.screen_h}")
+        try:
+            setattr(wk, "_touch", inj or False)
+        except Exception:
+            pass
+    return inj or None
+
+def _touch_failed(wk):
+    """sendevent lỗi giữa chừng -> bỏ backend, từ giờ dùng 'input'."""
+    log_wk(wk, "[TOUCH] sendevent lỗi, quay về 'input'.")
+    try:
+        setattr(wk, "_touch", False)
+    except Exception:
+        pass
+
+def tap(wk, x, y) -> float:
     if wk:
-        adb_safe(wk, "shell", "input", "tap", str(x), str(y), timeout=3)
+        inj = touch_injector(wk)
+        if inj is not None and inj.tap(x, y):
+            _record_input(wk, ("shell", "input", "tap", x, y))
+        else:
+            if inj is not None:
+                _touch_failed(wk)
+            adb_safe(wk, "shell", "input", "tap", str(x), str(y), timeout=3)
     else:
         tap_global(x, y)
+    return _mark_action(wk)
+
+def long_press(wk, x, y, hold_ms: int = 800) -> float:
+    if wk:
+        inj = touch_injector(wk)
+        if inj is not None and inj.long_press(x, y, hold_ms):
+            _record_input(wk, ("shell", "input", "swipe", x, y, x, y, hold_ms))
+        else:
+            if inj is not None:
+                _touch_failed(wk)
+            adb_safe(wk, "shell", "input", "swipe", str(x), str(y), str(x), str(y), str(hold_ms),
+                     timeout=3 + hold_ms / 1000.0)
+    else:
+        swipe_global(x, y, x, y, hold_ms)
+    return _mark_action(wk)
 
-def tap_center(wk, reg):
+def tap_center(wk, reg) -> float:
     x1, y1, x2, y2 = reg
-    tap(wk, (x1+x2)//2, (y1+y2)//2)
+    return tap(wk, (x1+x2)//2, (y1+y2)//2)
 
-def swipe(wk, x1, y1, x2, y2, dur_ms=450):
+def swipe(wk, x1, y1, x2, y2, dur_ms=450) -> float:
     if wk:
-        adb_safe(wk, "shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(dur_ms), timeout=3)
+        inj = touch_injector(wk)
+        if inj is not None and inj.swipe(x1, y1, x2, y2, dur_ms):
+            _record_input(wk, ("shell", "input", "swipe", x1, y1, x2, y2, dur_ms))
+        else:
+            if inj is not None:
+                _touch_failed(wk)
+            adb_safe(wk, "shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(dur_ms), timeout=3)
     else:
         swipe_global(x1, y1, x2, y2, dur_ms)
+    return _mark_action(wk)
+
+_BATCH_MARK = "__BB_STEP"
+_BATCH_OPS = ("tap", "swipe", "keyevent", "text", "sleep")
+# lỗi phía host, lệnh chắc chắn CHƯA tới máy: thiếu adb, adb báo máy offline/không thấy.
+# 'timeout' KHÔNG tính: không biết script đã chạy tới đâu.
+_BATCH_NOT_SENT = re.compile(r"^(adb not found|error: (device|no devices|more than one)|(ERR:)?\[Errno 2\])", re.I)
+
+def _batch_not_sent(code, out, err) -> bool:
+    return code != 0 and not (out or "").strip() and bool(_BATCH_NOT_SENT.match((err or "").strip()))
+
+def _batch_script(steps) -> str:
+    """
+    Dịch [(op, args, delay_ms)] thành 1 script sh: mỗi bước in mốc /proc/uptime trước/sau
+    (dùng 'read' builtin, không spawn thêm tiến trình), rồi 'sleep' delay_ms trên máy.
+    """
+    parts = []
+    stamp = f'read u _ </proc/uptime; echo "{_BATCH_MARK} %d %s $u"'
+    for i, (op, args, delay_ms) in enumerate(steps):
+        if op not in _BATCH_OPS:
+            raise ValueError(f"input_batch: op không hỗ trợ: {op}")
+        parts.append(stamp % (i, "b"))
+        if op == "text":
+            parts.append("input text " + input_text_arg(args[0]))
+        elif op != "sleep":
+            parts.append("input " + op + " " + " ".join(str(int(a)) for a in args))
+        parts.append(stamp % (i, "e"))
+        if delay_ms and delay_ms > 0:
+            parts.append(f"sleep {delay_ms / 1000.0:.3f}")
+    return "; ".join(parts)
+
+def _batch_parse(out: str, steps) -> list:
+    marks = {}
+    for line in (out or "").splitlines():
+        p = line.strip().split()
+        if len(p) == 4 and p[0] == _BATCH_MARK:
+            try:
+                marks[(int(p[1]), p[2])] = float(p[3])
+            except ValueError:
+                pass
+    timing, prev_end = [], None
+    for i, (op, args, delay_ms) in enumerate(steps):
+        b, e = marks.get((i, "b")), marks.get((i, "e"))
+        if b is None or e is None:
+            break
+        timing.append({
+            "i": i, "op": op, "args": tuple(args), "delay_ms": delay_ms,
+            "start": b, "end": e, "ms": round((e - b) * 1000.0, 1),
+            "gap_ms": None if prev_end is None else round((b - prev_end) * 1000.0, 1),
+        })
+        prev_end = e
+    return timing
+
+def input_batch(wk, steps, timeout: Optional[float] = None) -> Optional[list]:
+    """
+    Gửi cả chuỗi thao tác trong 1 lần gọi adb: steps = [(op, args, delay_ms), ...]
+      op: 'tap' (x,y) | 'swipe' (x1,y1,x2,y2,dur_ms) | 'keyevent' (code,) | 'text' (chuỗi,) | 'sleep' ()
+      delay_ms: nghỉ SAU bước đó, chạy bằng 'sleep' ngay trên máy (không dính jitter phía host).
+    Trả list timing từng bước [{i, op, args, delay_ms, start, end, ms, gap_ms}] (start/end = /proc/uptime
+    của máy, giây; gap_ms = từ lúc bước trước xong tới lúc bước này bắt đầu).
+    Script đã gửi mà timeout / thiếu mốc -> trả list ngắn hơn steps (có thể rỗng) = KHÔNG chạy đủ;
+    không chạy lại bước nào vì có thể đã tap trên máy (tránh mua / xác nhận 2 lần).
+    Chỉ khi lệnh chưa gửi được (wk=None, adb lỗi phía host) mới chạy tuần tự từng lệnh phía host.
+    None nếu đã abort trước khi gửi.
+    """
+    steps = [(op, tuple(args or ()), int(delay_ms or 0)) for op, args, delay_ms in steps]
+    if not steps or aborted(wk):
+        return None if aborted(wk) else []
+    rec = getattr(wk, "recorder", None)
+    if rec is not None:
+        for op, args, _ in steps:
+            if op != "sleep":
+                try:
+                    rec.add_input(op, args)
+                except Exception:
+                    pass
+
+    timing = []
+    if wk:
+        if timeout is None:
+            timeout = 3.0 + sum(1.5 + d / 1000.0 for _, _, d in steps)
+        code, out, err = adb_safe(wk, "shell", _batch_script(steps), timeout=timeout)
+        timing = _batch_parse(out, steps)
+        if timing or not _batch_not_sent(code, out, err):
+            _mark_action(wk)
+            if len(timing) < len(steps):
+                log_wk(wk, f"input_batch: chỉ xác nhận được {len(timing)}/{len(steps)} bước (code={code}), "
+                           f"không chạy lại phần còn lại")
+            return timing
+
+    # fallback: từng lệnh một phía host (wk=None hoặc lệnh chưa gửi được tới máy)
+    prev_end = None
+    for i, (op, args, delay_ms) in enumerate(steps):
+        if aborted(wk):
+            break
+        b = time.monotonic()
+        if op == "tap":
+            tap(wk, *args[:2])
+        elif op == "swipe":
+            swipe(wk, *args[:4], dur_ms=args[4] if len(args) > 4 else 450)
+        elif op == "keyevent":
+            adb_safe(wk, "shell", "input", "keyevent", str(args[0]), timeout=3)
+            _mark_action(wk)
+        elif op == "text":
+            type_text(wk, str(args[0]))
+        e = time.monotonic()
+        timing.append({
+            "i": i, "op": op, "args": args, "delay_ms": delay_ms, "start": b, "end": e,
+            "ms": round((e - b) * 1000.0, 1),
+            "gap_ms": None if prev_end is None else round((b - prev_end) * 1000.0, 1),
+            "host": True,
+        })
+        prev_end = e
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+    return timing
 
 def aborted(wk) -> bool:
     return bool(getattr(wk, "_abort", False))
@@ -864,15 +1496,65 @@ def mem_relief():
     except:
         pass
 
-def type_text(wk, text: str):
-    adb_safe(wk, "shell", "input", "text", text, timeout=4)
+def text_entry(wk) -> Optional[TextEntry]:
+    """
+    Backend nhập chữ nhanh (text_input) của wk, dò 1 lần rồi nhớ trên wk._text_entry.
+    BB_TEXT_INPUT=input: luôn dùng 'input text'; auto (mặc định): ADBKeyboard / Clipper nếu máy có.
+    """
+    if wk is None or os.environ.get("BB_TEXT_INPUT", "auto").lower() == "input":
+        return None
+    te = getattr(wk, "_text_entry", None)
+    if te is None:
+        try:
+            te = TextEntry.discover(lambda cmd, timeout=5: adb_safe(wk, "shell", cmd, timeout=timeout))
+        except Exception:
+            te = None
+        if te is not None:
+            log_wk(wk, f"[TEXT] nhập chữ qua {', '.join(te.backends)}")
+        try:
+            setattr(wk, "_text_entry", te or False)
+        except Exception:
+            pass
+    return te or None
+
+def type_text(wk, text: str, verify: Optional[Callable[[str], Optional[bool]]] = None) -> bool:
+    """
+    Nhập text vào ô đang focus. Thử backend nhanh (1 broadcast) trước, verify(text) kiểm lại
+    (None = không kiểm được); không được thì 'input text' đã escape như cũ.
+    Trả kết quả verify của lần nhập cuối (True nếu không có verify); False nếu đã abort trước khi nhập.
+    """
+    if aborted(wk):
+        return False
+    te = text_entry(wk)
+    if te is not None and te.type(text, verify) is not None:
+        _record_input(wk, ("shell", "input", "text", text))
+        _mark_action(wk)
+        return True
+    adb_safe(wk, "shell", "input", "text", input_text_arg(text), timeout=4)
+    _mark_action(wk)
+    if verify is None:
+        return True
+    try:
+        return verify(text) is not False
+    except Exception:
+        return True
 
 def back(wk, times: int = 1, wait_each: float = 0.2):
     for _ in range(times):
         adb_safe(wk, "shell", "input", "keyevent", "4", timeout=2)
+        _mark_action(wk)
         time.sleep(wait_each)
 
-def state_simple(wk, package_hint: str = "com.phsgdbz.vn") -> str:
+def foreground_component(wk, package_hint: str = "com.phsgdbz.vn") -> str:
+    """
+    Component đang foreground. Có wk.fg_watcher (foreground_watcher, theo logcat events) thì chỉ là tra bộ nhớ;
+    watcher chưa biết -> dumpsys như cũ 1 lần rồi seed cho watcher.
+    """
+    fw = getattr(wk, "fg_watcher", None)
+    if fw is not None:
+        comp = fw.top_component()
+        if comp is not None:
+            return comp
     code, out, _ = adb_safe(wk, "shell", "cmd", "activity", "get-foreground-activity", timeout=5)
     comp = ""
     if code == 0 and out and "ComponentInfo{" in out:
@@ -880,6 +1562,8 @@ def state_simple(wk, package_hint: str = "com.phsgdbz.vn") -> str:
             comp = out.split("ComponentInfo{", 1)[1].split("}", 1)[0]
         except Exception:
             comp = ""
+    if fw is not None and comp:
+        fw.seed(comp)   # chỉ seed kết quả get-foreground-activity (dò dumpsys window theo package_hint không chắc là top)
     if not comp:
         c2, out2, _ = adb_safe(wk, "shell", "dumpsys", "window", "windows", timeout=6)
         if c2 == 0 and out2:
@@ -889,7 +1573,11 @@ def state_simple(wk, package_hint: str = "com.phsgdbz.vn") -> str:
                     if m:
                         comp = m.group(1)
                         break
+    return comp
 
+
+def state_simple(wk, package_hint: str = "com.phsgdbz.vn") -> str:
+    comp = foreground_component(wk, package_hint)
     if "com.bbt.android.sdk.login.HWLoginActivity" in comp:
         return "need_login"
     if "org.cocos2dx.javascript.GameTwActivity" in comp:
@@ -924,8 +1612,7 @@ def is_green_pixel(wk, x: int, y: int, h_range=(35,85), s_min=80, v_min=80, samp
         r = max(1, sample//2)
         x1, y1 = max(0, x - r), max(0, y - r)
         x2, y2 = min(w, x + r + 1), min(h, y + r + 1)
-        roi = img[y1:y2, x1:x2].copy()
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+        hsv = hsv_of(img, (x1, y1, x2, y2))
         H = float(np.mean(hsv[..., 0]))
         S = float(np.mean(hsv[..., 1]))
         V = float(np.mean(hsv[..., 2]))
@@ -960,6 +1647,24 @@ def wait_visible_region(wk, tpl_path: str, region: Optional[Tuple[int,int,int,in
             return False
     return False
 
+def find_after_action(wk, t_action: Optional[float], tpl_path: str,
+                      region: Optional[Tuple[int,int,int,int]] = None,
+                      thr: float = DEFAULT_THR, timeout: float = 1.5, interval: float = 0.1):
+    """
+    Sau 1 thao tác (t_action = giá trị trả về của tap/swipe): chỉ xét frame chụp SAU thao tác,
+    poll tới khi thấy template hoặc hết timeout. Trả (ok, point, score) như find_on_frame.
+    """
+    end = time.monotonic() + timeout
+    img = grab_screen_after(wk, t_action, timeout=timeout)
+    while True:
+        ok, pt, sc = find_on_frame(img, tpl_path, region=region, threshold=thr)
+        free_img(img)
+        if ok or time.monotonic() >= end:
+            return ok, pt, sc
+        if not sleep_coop(wk, interval):
+            return False, None, sc
+        img = grab_screen_np(wk)
+
 def ensure_inside_generic(wk,
                           img_outside: str, reg_outside: Tuple[int,int,int,int],
                           img_inside: str,  reg_inside: Tuple[int,int,int,int],
@@ -972,8 +1677,9 @@ def ensure_inside_generic(wk,
             return False
 
         img = grab_screen_np(wk)
-        ok_in, _, _  = find_on_frame(img, img_inside,  region=reg_inside,  threshold=DEFAULT_THR)
-        ok_out, _, _ = find_on_frame(img, img_outside, region=reg_outside, threshold=DEFAULT_THR)
+        hits = find_many_on_frame(img, [(img_inside, reg_inside, DEFAULT_THR),
+                                        (img_outside, reg_outside, DEFAULT_THR)])
+        ok_in, ok_out = hits[img_inside]["ok"], hits[img_outside]["ok"]
         free_img(img)
 
         if ok_in:
@@ -1088,10 +1794,9 @@ def ocr_text_in_region(wk, y1: int, y2: int, x1: int, x2: int,
         if y2c <= y1c or x2c <= x1c:
             return ""
 
-        # Cắt ROI (copy) và tiền xử lý: gray -> blur -> Otsu
-        roi = img[y1c:y2c, x1c:x2c].copy()
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (3, 3), 0)
+        # Cắt ROI xám (Frame: dùng plane đã cache) và tiền xử lý: gray -> blur -> Otsu
+        roi = gray_of(img, (x1c, y1c, x2c, y2c))
+        gray = cv2.GaussianBlur(roi, (3, 3), 0)
         gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
         # Chọn ngôn ngữ: ưu tiên vie+eng -> vie -> eng
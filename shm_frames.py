@@ -0,0 +1,203 @@
+# shm_frames.py
+# ==========================================================
+#  Chuyển frame đã decode giữa các tiến trình qua multiprocessing.shared_memory.
+#  - Bên chụp (CaptureHub) giữ ShmFrameWriter, bên runner (tiến trình con) giữ ShmFrameReader.
+#  - Double buffer: 2 slot cố định HxWx3 (mặc định 900x1600), ghi luân phiên.
+#  - Mỗi slot có seqlock: bộ đếm lẻ = đang ghi, chẵn = ổn định. Reader đọc bộ đếm
+#    trước/sau để biết ảnh có bị ghi đè giữa chừng không -> đọc zero-copy an toàn.
+#
+#  Bố cục vùng nhớ:
+#    [0:32)    header chung  <IHHIIIIQ: magic, version, nslots, h, w, c, latest_slot, demand
+#    [64*(1+i)) header slot i <QQd: lock, frame_seq, ts
+#    [data_off + i*slot_bytes) pixel BGR của slot i
+# ==========================================================
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from frame import Frame
+
+_MAGIC = 0x42424652          # 'BBFR'
+_VERSION = 1
+_HDR_FMT = "<IHHIIIIQ"
+_SLOT_FMT = "<QQd"
+_SLOT_HDR = 64
+_NO_SLOT = 0xFFFFFFFF
+_OFF_LATEST = 20             # vị trí latest_slot trong header chung
+_OFF_DEMAND = 24             # vị trí bộ đếm demand (reader tăng, writer đọc)
+
+
+def shm_name_for(serial: str) -> str:
+    """Tên vùng nhớ cho 1 máy (ký tự lạ trong serial -> '_')."""
+    return "bb_frames_" + re.sub(r"[^0-9A-Za-z]", "_", serial)
+
+
+def _layout(nslots: int, h: int, w: int, c: int):
+    data_off = _SLOT_HDR * (1 + nslots)
+    slot_bytes = h * w * c
+    return data_off, slot_bytes, data_off + nslots * slot_bytes
+
+
+class ShmFrame(NamedTuple):
+    frame: Frame      # view (zero-copy) hoặc bản copy
+    slot: int
+    lock: int         # giá trị seqlock lúc đọc, dùng cho ShmFrameReader.valid()
+
+
+class _ShmBase:
+    def _map_slots(self):
+        data_off, slot_bytes, _ = _layout(self.nslots, self.height, self.width, self.channels)
+        self._slots = [
+            np.ndarray((self.height, self.width, self.channels), dtype=np.uint8,
+                       buffer=self._shm.buf, offset=data_off + i * slot_bytes)
+            for i in range(self.nslots)
+        ]
+
+    def _slot_off(self, idx: int) -> int:
+        return _SLOT_HDR * (1 + idx)
+
+    def _lock(self, idx: int) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, self._slot_off(idx))[0]
+
+    def _latest_slot(self) -> int:
+        return struct.unpack_from("<I", self._shm.buf, _OFF_LATEST)[0]
+
+    def _demand(self) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, _OFF_DEMAND)[0]
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def close(self):
+        # còn view zero-copy trỏ vào buf thì close() báo BufferError -> bỏ qua, GC sẽ dọn
+        self._slots = []
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+
+class ShmFrameWriter(_ShmBase):
+    """Bên chụp: tạo vùng nhớ và publish frame BGR (đúng kích thước slot)."""
+
+    def __init__(self, name: Optional[str] = None, width: int = 900, height: int = 1600,
+                 channels: int = 3, slots: int = 2):
+        self.width, self.height, self.channels, self.nslots = int(width), int(height), int(channels), int(slots)
+        size = _layout(self.nslots, self.height, self.width, self.channels)[2]
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # tiến trình trước chết không kịp unlink -> dùng lại vùng cũ
+            self._shm = shared_memory.SharedMemory(name=name, create=False)
+            if self._shm.size < size:
+                raise
+        self._shm.buf[:_SLOT_HDR * (1 + self.nslots)] = bytes(_SLOT_HDR * (1 + self.nslots))
+        struct.pack_into(_HDR_FMT, self._shm.buf, 0, _MAGIC, _VERSION, self.nslots,
+                         self.height, self.width, self.channels, _NO_SLOT, 0)
+        self._map_slots()
+        self._latest = -1
+        self._seq = 0
+
+    def publish(self, img: np.ndarray, seq: Optional[int] = None, ts: Optional[float] = None) -> bool:
+        """Ghi frame vào slot không phải slot mới nhất. False nếu sai kích thước."""
+        if img is None or img.shape != (self.height, self.width, self.channels):
+            return False
+        idx = (self._latest + 1) % self.nslots
+        off = self._slot_off(idx)
+        lock = self._lock(idx)
+        struct.pack_into("<Q", self._shm.buf, off, lock + 1)          # lẻ: đang ghi
+        np.copyto(self._slots[idx], img)
+        self._seq = int(seq) if seq is not None else self._seq + 1
+        struct.pack_into(_SLOT_FMT, self._shm.buf, off, lock + 1, self._seq,
+                         time.monotonic() if ts is None else float(ts))
+        struct.pack_into("<Q", self._shm.buf, off, lock + 2)          # chẵn: xong
+        struct.pack_into("<I", self._shm.buf, _OFF_LATEST, idx)
+        self._latest = idx
+        return True
+
+    def demand_count(self) -> int:
+        """Bộ đếm reader tăng mỗi lần đọc (CaptureHub dùng để biết tiến trình con còn cần frame)."""
+        return self._demand()
+
+    def close(self, unlink: bool = True):
+        super().close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except Exception:
+                pass
+
+
+class ShmFrameReader(_ShmBase):
+    """Bên runner (tiến trình con): gắn vào vùng nhớ theo tên và đọc frame mới nhất."""
+
+    def __init__(self, name: str):
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name=name, create=False, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name, create=False)
+            if os.name != "nt" and multiprocessing.get_start_method(allow_none=True) != "fork":
+                # reader không sở hữu vùng nhớ: đừng để resource_tracker riêng của tiến trình con
+                # unlink khi nó thoát (fork thì dùng chung tracker với writer, không cần)
+                try:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(self._shm._name, "shared_memory")
+                except Exception:
+                    pass
+        magic, version, nslots, h, w, c, _, _ = struct.unpack_from(_HDR_FMT, self._shm.buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._shm.close()
+            raise ValueError(f"shm '{name}' không phải vùng frame hợp lệ")
+        self.nslots, self.height, self.width, self.channels = nslots, h, w, c
+        self._map_slots()
+
+    def touch(self):
+        """Báo bên chụp là vẫn cần frame (giữ CaptureHub ở nhịp active)."""
+        struct.pack_into("<Q", self._shm.buf, _OFF_DEMAND, (self._demand() + 1) & 0xFFFFFFFFFFFFFFFF)
+
+    def latest(self, copy: bool = False, retries: int = 4) -> Optional[ShmFrame]:
+        """
+        Frame mới nhất. copy=False: Frame là view thẳng vào shared memory (không copy 5.7MB);
+        view còn đúng chừng nào valid() còn True (writer phải ghi thêm >= 1 frame nữa mới đè lại slot này).
+        """
+        self.touch()
+        for _ in range(retries):
+            idx = self._latest_slot()
+            if idx == _NO_SLOT or idx >= self.nslots:
+                return None
+            off = self._slot_off(idx)
+            l1, seq, ts = struct.unpack_from(_SLOT_FMT, self._shm.buf, off)
+            if l1 & 1:
+                time.sleep(0)
+                continue
+            arr = self._slots[idx].copy() if copy else self._slots[idx]
+            if self._lock(idx) != l1:
+                continue
+            return ShmFrame(Frame(arr, seq=seq, ts=ts), idx, l1)
+        return None
+
+    def valid(self, view: ShmFrame) -> bool:
+        """True nếu slot chưa bị ghi lại kể từ lúc đọc (kết quả xử lý trên view là đáng tin)."""
+        return self._lock(view.slot) == view.lock
+
+    def wait_newer(self, seq: int, timeout: float, copy: bool = False,
+                   interval: float = 0.005) -> Optional[ShmFrame]:
+        """Chờ frame có frame_seq > seq (poll, không có event xuyên tiến trình)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            v = self.latest(copy=copy)
+            if v is not None and v.frame.seq > seq:
+                return v
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
@@ -0,0 +1,145 @@
+# template_atlas.py
+# ==========================================================
+#  Atlas nhị phân chứa sẵn pixel đã giải mã của mọi template (thay cho image_data.py base64 2MB+):
+#
+#    [8]  magic 'BBATLAS1'
+#    [4]  độ dài header (uint32 LE)
+#    [n]  header JSON: {key: {"bgr": [offset, h, w, 3], "gray": [offset, h, w],
+#                             "dtype": "uint8", "src": [size, mtime_ns]}}
+#    [..] các khối pixel uint8 liền (C-order), mỗi khối căn 64 byte
+#
+#  - compile_atlas(): quét images/**/*.png -> ghi atlas (encode_images.py gọi).
+#  - TemplateAtlas: mmap chỉ-đọc; get() trả np.frombuffer view (không copy, không decode),
+#    template không dùng tới không tốn gì lúc khởi động.
+#  - Entry có file gốc trên đĩa khác size/mtime lúc compile -> bỏ qua (ảnh đã sửa, atlas cũ).
+# ==========================================================
+from __future__ import annotations
+
+import os
+import sys
+import json
+import mmap
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+MAGIC = b"BBATLAS1"
+ALIGN = 64
+ATLAS_FILE = "images.atlas"
+
+
+def _pad(n: int) -> int:
+    return (-n) % ALIGN
+
+
+def compile_atlas(src_dir="images", out_path=ATLAS_FILE) -> Dict[str, dict]:
+    """Giải mã mọi PNG trong src_dir, ghi atlas (BGR + xám). Trả header đã ghi."""
+    src = Path(src_dir)
+    blocks, header, pos = [], {}, 0
+    for path in sorted(src.rglob("*.png")):
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is None or img.size == 0:
+            print(f"  ! Bỏ qua (không đọc được): {path}")
+            continue
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        st = path.stat()
+        entry = {"dtype": "uint8", "src": [st.st_size, st.st_mtime_ns]}
+        for name, arr in (("bgr", img), ("gray", gray)):
+            data = np.ascontiguousarray(arr).tobytes()
+            entry[name] = [pos, *arr.shape]
+            blocks.append(data + b"\0" * _pad(len(data)))
+            pos += len(data) + _pad(len(data))
+        header[path.as_posix()] = entry
+    head = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    prefix = len(MAGIC) + 4 + len(head)
+    base = prefix + _pad(prefix)
+    # offset trong header là tương đối với đầu vùng dữ liệu -> cộng base khi đọc
+    tmp = Path(str(out_path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head + b"\0" * (base - prefix))
+        for b in blocks:
+            f.write(b)
+    os.replace(tmp, out_path)
+    return header
+
+
+class TemplateAtlas:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{self.path} không phải template atlas")
+            (n,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+            prefix = len(MAGIC) + 4 + n
+            self.header: Dict[str, dict] = json.loads(bytes(self._mm[len(MAGIC) + 4:prefix]).decode("utf-8"))
+            self._base = prefix + _pad(prefix)
+        except Exception:
+            self._f.close()
+            raise
+        self._valid: Dict[str, bool] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.header
+
+    def __len__(self):
+        return len(self.header)
+
+    def _fresh(self, key: str, root: str) -> bool:
+        """File gốc còn trên đĩa mà khác lúc compile -> atlas cũ cho key này (kiểm 1 lần)."""
+        ok = self._valid.get(key)
+        if ok is None:
+            ok = True
+            try:
+                st = os.stat(os.path.join(root, key))
+                size, mtime_ns = self.header[key].get("src", (None, None))
+                ok = (st.st_size == size and st.st_mtime_ns == mtime_ns)
+            except OSError:
+                pass        # không có file gốc (bản build) -> tin atlas
+            self._valid[key] = ok
+        return ok
+
+    def get(self, key: str, gray: bool = True, root: Optional[str] = None) -> Optional[np.ndarray]:
+        """View read-only trên mmap, hoặc None nếu không có / đã cũ."""
+        e = self.header.get(key)
+        if e is None or not self._fresh(key, root or os.path.abspath(".")):
+            return None
+        off, *shape = e["gray" if gray else "bgr"]
+        n = int(np.prod(shape))
+        return np.frombuffer(self._mm, dtype=e.get("dtype", "uint8"), count=n,
+                             offset=self._base + off).reshape(shape)
+
+    def close(self):
+        try:
+            self._mm.close()
+        except Exception:
+            pass
+        try:
+            self._f.close()
+        except Exception:
+            pass
+
+
+_ATLAS = None
+_ATLAS_LOCK = threading.Lock()
+
+
+def get_atlas() -> Optional[TemplateAtlas]:
+    """Atlas dùng chung (mở 1 lần); None nếu chưa compile hoặc tắt bằng BB_TEMPLATE_ATLAS=0."""
+    global _ATLAS
+    if os.environ.get("BB_TEMPLATE_ATLAS", "1") in ("0", "false", "False"):
+        return None
+    with _ATLAS_LOCK:
+        if _ATLAS is None:
+            base = getattr(sys, "_MEIPASS", None) or os.path.abspath(".")
+            path = os.environ.get("BB_TEMPLATE_ATLAS_PATH") or os.path.join(base, ATLAS_FILE)
+            try:
+                _ATLAS = TemplateAtlas(path)
+            except Exception:
+                _ATLAS = False
+        return _ATLAS or None
@@ -0,0 +1,161 @@
+# template_store.py
+# ==========================================================
+#  Kho template dùng chung cho find_on_frame / load_template / match (thay cho cv2.imread
+#  mỗi lần gọi và _template_cache riêng của load_template).
+#  - Khoá (key ảnh, "gray"|"color", scale). Key ảnh chuẩn hoá về dạng 'images/...png' giống
+#    IMAGE_DATA, nên resource_path(...) tuyệt đối và đường dẫn tương đối dùng chung 1 bản.
+#  - Nguồn: atlas nhị phân (template_atlas, view mmap không copy, không tính vào trần LRU),
+#    rồi file trên đĩa, cuối cùng IMAGE_DATA (base64, chỉ import khi thật sự cần).
+#  - Lần nạp đầu đọc bản màu, tạo sẵn bản xám; bản scale != 1 resize từ bản scale 1 trong kho.
+#  - LRU theo tổng nbytes, trần BB_TEMPLATE_CACHE_MB (mặc định 64MB); mảng trả về read-only.
+#  - Thread-safe (nhiều AccountRunner cùng gọi); decode nằm ngoài lock.
+# ==========================================================
+from __future__ import annotations
+
+import os
+import sys
+import base64
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from template_atlas import get_atlas
+
+Key = Tuple[str, str, float]
+
+
+def _base_dir() -> str:
+    return getattr(sys, "_MEIPASS", None) or os.path.abspath(".")
+
+
+def template_key(path: str) -> str:
+    """Đường dẫn bất kỳ -> key dạng IMAGE_DATA ('images/login/x.png')."""
+    p = Path(path)
+    if p.is_absolute():
+        try:
+            return p.relative_to(_base_dir()).as_posix()
+        except ValueError:
+            pass
+        posix = p.as_posix()
+        i = posix.rfind("/images/")
+        if i >= 0:
+            return posix[i + 1:]
+        return posix
+    return p.as_posix()
+
+
+def _decode_b64(key: str) -> Optional[np.ndarray]:
+    from image_data import IMAGE_DATA
+    b64_string = IMAGE_DATA.get(key)
+    if not b64_string:
+        return None
+    return cv2.imdecode(np.frombuffer(base64.b64decode(b64_string), np.uint8), cv2.IMREAD_COLOR)
+
+
+class TemplateStore:
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("BB_TEMPLATE_CACHE_MB", "64")) * 1024 * 1024)
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Key, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._views: Dict[Key, np.ndarray] = {}     # view trên atlas mmap
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------------- API ----------------
+    def get(self, path: str, gray: bool = True, scale: float = 1.0) -> Optional[np.ndarray]:
+        """Template (read-only) hoặc None nếu không có ở atlas, đĩa lẫn IMAGE_DATA."""
+        key = template_key(path)
+        k = (key, "gray" if gray else "color", round(float(scale), 4))
+        with self._lock:
+            arr = self._views.get(k)
+            if arr is None:
+                arr = self._items.get(k)
+                if arr is not None:
+                    self._items.move_to_end(k)
+            if arr is not None:
+                self.hits += 1
+                return arr
+            self.misses += 1
+        if k[2] != 1.0:
+            base = self.get(path, gray, 1.0)
+            if base is None:
+                return None
+            th, tw = base.shape[:2]
+            arr = cv2.resize(base, (max(1, int(tw * k[2])), max(1, int(th * k[2]))), interpolation=cv2.INTER_AREA)
+            return self._put(k, arr)
+        atlas = get_atlas()
+        view = atlas.get(key, gray, _base_dir()) if atlas is not None else None
+        if view is not None:
+            with self._lock:
+                self._views[k] = view
+            return view
+        color = self._load(path, key)
+        if color is None:
+            return None
+        gray_arr = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        kc, kg = (key, "color", 1.0), (key, "gray", 1.0)
+        color = self._put(kc, color)
+        gray_arr = self._put(kg, gray_arr)
+        return gray_arr if gray else color
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._views.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "atlas_views": len(self._views), "mb": round(self._bytes / 1048576.0, 2),
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    # ---------------- nội bộ ----------------
+    @staticmethod
+    def _load(path: str, key: str) -> Optional[np.ndarray]:
+        for cand in (path, os.path.join(_base_dir(), key)):
+            if cand and os.path.isfile(cand):
+                img = cv2.imread(cand, cv2.IMREAD_COLOR)
+                if img is not None and img.size:
+                    return img
+        try:
+            return _decode_b64(key)
+        except Exception:
+            return None
+
+    def _put(self, k: Key, arr: np.ndarray) -> np.ndarray:
+        arr.flags.writeable = False
+        with self._lock:
+            old = self._items.get(k)
+            if old is not None:         # thread khác nạp trước -> dùng bản đó
+                self._items.move_to_end(k)
+                return old
+            self._items[k] = arr
+            self._bytes += arr.nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                ek, ev = next(iter(self._items.items()))
+                if ek == k:
+                    break
+                del self._items[ek]
+                self._bytes -= ev.nbytes
+                self.evictions += 1
+        return arr
+
+
+_STORE: Optional[TemplateStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_templates() -> TemplateStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = TemplateStore()
+        return _STORE
@@ -0,0 +1,266 @@
+# test_adb_client.py
+# Kiểm tra adb_client với 1 adb server giả (socket thật, 127.0.0.1:cổng tự chọn):
+# host services, shell v2 / shell cũ (dòng đánh dấu exit code), exec, sync push/pull.
+# Chạy: python -m pytest -q test/test_adb_client.py
+
+import sys
+import socket
+import struct
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from adb_client import AdbClient, AdbError, _EXIT_MARK, _SYNC_CHUNK  # noqa: E402
+
+V2 = "emulator-5554"        # máy có shell_v2
+OLD = "127.0.0.1:62001"     # máy chỉ có shell: cũ
+
+
+def _block(data: bytes) -> bytes:
+    return b"%04x" % len(data) + data
+
+
+class FakeAdbServer:
+    """adb server giả: mỗi kết nối 1 thread, trả lời theo đúng framing smart socket."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.devices = {V2: "device", OLD: "device"}
+        self.features = {V2: "shell_v2,cmd,stat_v2", OLD: "cmd"}
+        # lệnh shell -> (exit code, stdout, stderr)
+        self.shell = {
+            "echo hi": (0, b"hi\n", b""),
+            "false": (1, b"", b"boom\n"),
+            "wm size": (0, b"Physical size: 900x1600\n", b""),
+        }
+        self.files = {}
+        self.services = []
+        self._stop = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._stop = True
+        self.sock.close()
+
+    # ---------------- framing ----------------
+    @staticmethod
+    def _recv_exact(c, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = c.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError
+            buf += chunk
+        return buf
+
+    def _read_service(self, c):
+        n = int(self._recv_exact(c, 4), 16)
+        svc = self._recv_exact(c, n).decode()
+        self.services.append(svc)
+        return svc
+
+    def _accept(self):
+        while not self._stop:
+            try:
+                c, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(c,), daemon=True).start()
+
+    def _serve(self, c):
+        try:
+            self._handle(c)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            c.close()
+
+    def _handle(self, c):
+        svc = self._read_service(c)
+        if svc == "host:version":
+            c.sendall(b"OKAY" + _block(b"0029"))
+        elif svc == "host:devices":
+            body = "".join(f"{s}\t{st}\n" for s, st in self.devices.items()).encode()
+            c.sendall(b"OKAY" + _block(body))
+        elif svc == "host:track-devices":
+            c.sendall(b"OKAY" + _block(f"{V2}\tdevice\n".encode()))
+            c.sendall(_block(f"{V2}\toffline\n{OLD}\tdevice\n".encode()))
+            self._recv_exact(c, 1)      # giữ kết nối tới khi client đóng
+        elif svc.startswith("host-serial:"):
+            serial, _, what = svc[len("host-serial:"):].rpartition(":")
+            if serial not in self.devices:
+                c.sendall(b"FAIL" + _block(b"device not found"))
+            elif what == "features":
+                c.sendall(b"OKAY" + _block(self.features[serial].encode()))
+            elif what == "get-state":
+                c.sendall(b"OKAY" + _block(self.devices[serial].encode()))
+        elif svc.startswith("host:transport:"):
+            serial = svc[len("host:transport:"):]
+            if serial not in self.devices:
+                c.sendall(b"FAIL" + _block(f"device '{serial}' not found".encode()))
+                return
+            c.sendall(b"OKAY")
+            self._device_service(c, serial, self._read_service(c))
+        else:
+            c.sendall(b"FAIL" + _block(b"unknown service"))
+
+    def _device_service(self, c, serial, svc):
+        if svc.startswith("shell,v2,raw:"):
+            code, out, err = self.shell.get(svc[len("shell,v2,raw:"):], (127, b"", b"not found\n"))
+            c.sendall(b"OKAY")
+            # cắt stdout thành nhiều gói, xen stderr để kiểm tra ghép gói
+            for i in range(0, len(out), 3):
+                c.sendall(b"\x01" + struct.pack("<I", len(out[i:i + 3])) + out[i:i + 3])
+            if err:
+                c.sendall(b"\x02" + struct.pack("<I", len(err)) + err)
+            c.sendall(b"\x03" + struct.pack("<I", 1) + bytes([code]))
+        elif svc.startswith("shell:"):
+            # client gửi '( cmd ); echo __BB_EXIT__$?'
+            body = svc[len("shell:"):]
+            cmd = body[2:body.index(" ); echo ")]
+            code, out, err = self.shell.get(cmd, (127, b"", b"not found\n"))
+            c.sendall(b"OKAY" + out + err + _EXIT_MARK + str(code).encode() + b"\n")
+        elif svc.startswith("exec:"):
+            c.sendall(b"OKAY" + b"\x89PNG\r\n\x1a\n" + bytes(range(256)))
+        elif svc == "sync:":
+            c.sendall(b"OKAY")
+            self._sync(c)
+
+    def _sync(self, c):
+        while True:
+            cmd = self._recv_exact(c, 4)
+            (n,) = struct.unpack("<I", self._recv_exact(c, 4))
+            if cmd == b"QUIT":
+                return
+            if cmd == b"SEND":
+                remote = self._recv_exact(c, n).decode().rsplit(",", 1)[0]
+                data = b""
+                while True:
+                    sub = self._recv_exact(c, 4)
+                    (m,) = struct.unpack("<I", self._recv_exact(c, 4))
+                    if sub == b"DATA":
+                        assert m <= _SYNC_CHUNK
+                        data += self._recv_exact(c, m)
+                    elif sub == b"DONE":
+                        break
+                self.files[remote] = data
+                c.sendall(b"OKAY" + struct.pack("<I", 0))
+            elif cmd == b"RECV":
+                remote = self._recv_exact(c, n).decode()
+                data = self.files.get(remote)
+                if data is None:
+                    msg = b"No such file or directory"
+                    c.sendall(b"FAIL" + struct.pack("<I", len(msg)) + msg)
+                    continue
+                for i in range(0, len(data), _SYNC_CHUNK):
+                    part = data[i:i + _SYNC_CHUNK]
+                    c.sendall(b"DATA" + struct.pack("<I", len(part)) + part)
+                c.sendall(b"DONE" + struct.pack("<I", 0))
+
+
+@pytest.fixture
+def server():
+    srv = FakeAdbServer()
+    yield srv
+    srv.close()
+
+
+@pytest.fixture
+def cli(server):
+    return AdbClient(port=server.port, timeout=3.0)
+
+
+# ---------------- host services ----------------
+def test_host_version_and_devices(cli):
+    assert cli.version() == 0x29
+    assert cli.devices() == [(V2, "device"), (OLD, "device")]
+    assert cli.get_state(V2) == "device"
+
+
+def test_host_service_framing(cli, server):
+    cli.devices()
+    assert "host:devices" in server.services
+
+
+def test_track_devices_yields_each_update(cli):
+    stop = threading.Event()
+    it = cli.track_devices(stop)
+    assert next(it) == [(V2, "device")]
+    assert next(it) == [(V2, "offline"), (OLD, "device")]
+    stop.set()
+    it.close()
+
+
+def test_features_cached_only_on_success(cli, server):
+    assert cli.features("nope") == set()
+    assert "nope" not in cli._features
+    assert "shell_v2" in cli.features(V2)
+
+
+# ---------------- shell ----------------
+def test_shell_v2_collects_stdout_stderr_and_exit_code(cli, server):
+    assert cli.shell(V2, "echo hi") == (0, b"hi\n", b"")
+    assert cli.shell(V2, "false") == (1, b"", b"boom\n")
+    assert cli.shell(V2, "wm size")[1] == b"Physical size: 900x1600\n"
+    assert "shell,v2,raw:echo hi" in server.services
+
+
+def test_legacy_shell_exit_code_from_marker(cli, server):
+    assert cli.shell(OLD, "echo hi") == (0, b"hi\n", b"")
+    code, out, _ = cli.shell(OLD, "false")
+    assert code == 1 and out == b"boom\n"
+    assert cli.shell(OLD, "missing")[0] == 127
+    assert not any(s.startswith("shell,v2") for s in server.services if "missing" in s)
+
+
+def test_transport_fail_raises(cli):
+    with pytest.raises(AdbError):
+        cli.shell("emulator-9999", "echo hi")
+
+
+def test_run_args_text_and_bytes(cli):
+    assert cli.run_args(V2, ["shell", "echo", "hi"]) == (0, "hi\n", "")
+    code, out, err = cli.run_args(V2, ["exec-out", "screencap", "-p"], text=False)
+    assert code == 0 and out.startswith(b"\x89PNG") and len(out) == 8 + 256
+    assert cli.run_args(V2, ["get-state"]) == (0, "device\n", "")
+    assert cli.run_args(V2, ["install", "x.apk"]) is None
+    assert cli.run_args("emulator-9999", ["shell", "id"])[0] == 1
+
+
+def test_run_args_server_down_returns_none():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    c = AdbClient(port=port, timeout=1.0)
+    assert c.run_args(V2, ["shell", "id"]) is None
+    assert not c.available
+
+
+# ---------------- sync ----------------
+def test_push_then_pull_roundtrip_multi_chunk(cli, server, tmp_path):
+    data = bytes(range(256)) * ((_SYNC_CHUNK * 2 + 1000) // 256)
+    src = tmp_path / "minicap"
+    src.write_bytes(data)
+    cli.push(V2, src, "/data/local/tmp/minicap", mode=0o755)
+    assert server.files["/data/local/tmp/minicap"] == data
+
+    dst = tmp_path / "back.bin"
+    cli.pull(V2, "/data/local/tmp/minicap", dst)
+    assert dst.read_bytes() == data
+    assert not (tmp_path / "back.bin.part").exists()
+
+
+def test_pull_missing_file_fails_cleanly(cli, tmp_path):
+    dst = tmp_path / "x.bin"
+    with pytest.raises(AdbError):
+        cli.pull(V2, "/sdcard/none", dst)
+    assert not dst.exists() and not (tmp_path / "x.bin.part").exists()
+    code, _, err = cli.run_args(V2, ["pull", "/sdcard/none", str(dst)])
+    assert code == 1 and "No such file" in err
@@ -0,0 +1,106 @@
+# text_input.py
+# ==========================================================
+#  Nhập chữ nhanh + đúng ký tự đặc biệt cho ô đang focus, thay cho 'input text' từng ký tự
+#  (chậm, hỏng với khoảng trắng / ký tự shell / tiếng Việt trong mật khẩu, tên liên minh...).
+#  Thứ tự backend (mỗi cái chỉ dùng khi dò thấy trên máy):
+#    1) ime       : ADBKeyboard (com.android.adbkeyboard) -> 1 broadcast ADB_INPUT_B64 (UTF-8 base64)
+#    2) clipboard : Clipper (ca.zgrs.clipper) 'clipper.set' + keyevent PASTE (279)
+#  Sau mỗi lần nhập gọi verify() (OCR / template ô trống của caller); False -> xoá ô, thử backend sau.
+#  Hết backend -> trả None để caller dùng 'input text' (input_text_arg() đã escape cho sh).
+#  Giống touch_inject: mọi lệnh đi qua shell_fn (module.adb_safe -> shell session nếu có).
+# ==========================================================
+from __future__ import annotations
+
+import base64
+from typing import Callable, Optional, Tuple
+
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+CLIPPER_PKG = "ca.zgrs.clipper"
+KEYCODE_DEL = 67
+KEYCODE_MOVE_END = 123
+KEYCODE_PASTE = 279
+
+ShellFn = Callable[..., Tuple[int, str, str]]
+VerifyFn = Callable[[str], Optional[bool]]
+
+
+def sh_quote(s: str) -> str:
+    """Bọc 1 tham số trong '...' cho sh trên máy."""
+    return "'" + str(s).replace("'", "'\\''") + "'"
+
+
+def input_text_arg(text: str) -> str:
+    """Tham số cho 'input text': khoảng trắng -> %s (quy ước của 'input'), rồi quote cho sh."""
+    return sh_quote(str(text).replace(" ", "%s"))
+
+
+class TextEntry:
+    def __init__(self, shell_fn: ShellFn, has_ime: bool = False, has_clipper: bool = False):
+        self.shell_fn = shell_fn
+        self.has_ime = has_ime
+        self.has_clipper = has_clipper
+        self.last_backend: Optional[str] = None
+
+    # ---------------- dò backend ----------------
+    @classmethod
+    def discover(cls, shell_fn: ShellFn) -> Optional["TextEntry"]:
+        """1 lệnh shell dò ADBKeyboard + Clipper; bật ADBKeyboard làm IME mặc định nếu có. None nếu không có gì."""
+        code, out, _ = shell_fn(f"ime list -a -s; pm path {CLIPPER_PKG}", timeout=6)
+        if code not in (0, 1) or not out:
+            return None
+        lines = [ln.strip() for ln in out.splitlines()]
+        has_ime = ADB_KEYBOARD_IME in lines
+        has_clipper = any(ln.startswith("package:") for ln in lines)
+        if has_ime:
+            c2, _, _ = shell_fn(f"ime enable {ADB_KEYBOARD_IME}; ime set {ADB_KEYBOARD_IME}", timeout=6)
+            has_ime = c2 == 0
+        if not (has_ime or has_clipper):
+            return None
+        return cls(shell_fn, has_ime, has_clipper)
+
+    @property
+    def backends(self) -> list:
+        return [name for name, ok in (("ime", self.has_ime), ("clipboard", self.has_clipper)) if ok]
+
+    # ---------------- nhập ----------------
+    def _ime(self, text: str) -> bool:
+        b64 = base64.b64encode(text.encode("utf-8")).decode("ascii")
+        code, _, _ = self.shell_fn(f"am broadcast -a ADB_INPUT_B64 --es msg {b64}", timeout=5)
+        return code == 0
+
+    def _clipboard(self, text: str) -> bool:
+        code, _, _ = self.shell_fn(
+            f"am broadcast -a clipper.set -e text {sh_quote(text)} && input keyevent {KEYCODE_PASTE}", timeout=6)
+        return code == 0
+
+    def clear(self, n: int):
+        """Xoá ô đang focus: về cuối dòng rồi DEL n lần (1 lệnh 'input keyevent' nhiều mã)."""
+        if n <= 0:
+            return
+        if self.has_ime and self.shell_fn("am broadcast -a ADB_CLEAR_TEXT", timeout=5)[0] == 0:
+            return
+        self.shell_fn(f"input keyevent {KEYCODE_MOVE_END} " + " ".join([str(KEYCODE_DEL)] * n), timeout=8)
+
+    def type(self, text: str, verify: Optional[VerifyFn] = None) -> Optional[str]:
+        """
+        Nhập text bằng backend nhanh đầu tiên được verify. Trả tên backend, hoặc None nếu
+        không backend nào được (ô đã được xoá lại) -> caller dùng 'input text'.
+        verify(text) trả None = không kiểm được, coi như đạt.
+        """
+        self.last_backend = None
+        for name in self.backends:
+            ok = self._ime(text) if name == "ime" else self._clipboard(text)
+            if not ok:
+                continue
+            if verify is None:
+                self.last_backend = name
+                return name
+            try:
+                res = verify(text)
+            except Exception:
+                res = None
+            if res is None or res:
+                self.last_backend = name
+                return name
+            self.clear(len(text) + 4)
+        return None
@@ -0,0 +1,227 @@
+# touch_inject.py
+# ==========================================================
+#  Chạm màn hình bằng 'sendevent' ghi thẳng event multitouch vào /dev/input/eventX
+#  thay cho 'input tap' (mỗi lần 'input' khởi động app_process/JVM: 150-400ms trên giả lập).
+#  - discover(): chạy 'getevent -p' 1 lần, chọn thiết bị có ABS_MT_POSITION_X/Y,
+#    đọc min/max để quy đổi toạ độ màn hình (wm size) sang toạ độ cảm ứng.
+#  - tap / swipe / long_press: dựng cả chuỗi sendevent thành 1 dòng lệnh shell,
+#    gửi qua shell_fn (module.adb_safe -> adb shell sống lâu nếu có).
+#  - Mỗi 'sendevent' trên máy vẫn là 1 tiến trình (vài ms tới hàng chục ms trên giả lập):
+#    swipe đo 1 lần chi phí/lệnh (event_cost_ms) rồi giới hạn số điểm + trừ vào sleep
+#    để cả cử chỉ vẫn đúng dur_ms (vận tốc vuốt không đổi).
+#  Hỗ trợ MT protocol B (SLOT/TRACKING_ID) và A (SYN_MT_REPORT).
+#  Giả định màn hình không xoay so với hướng tự nhiên của panel cảm ứng.
+# ==========================================================
+from __future__ import annotations
+
+import re
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+EV_SYN, EV_KEY, EV_ABS = 0, 1, 3
+SYN_REPORT, SYN_MT_REPORT = 0, 2
+BTN_TOUCH = 0x14a
+ABS_MT_SLOT = 0x2f
+ABS_MT_TOUCH_MAJOR = 0x30
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+ABS_MT_PRESSURE = 0x3a
+
+_RE_DEVICE = re.compile(r"add device \d+:\s*(\S+)")
+_RE_NAME = re.compile(r'name:\s*"(.*)"')
+_RE_ABS = re.compile(r"([0-9a-fA-F]{4})\s*:\s*value\s+-?\d+,\s*min\s+(-?\d+),\s*max\s+(-?\d+)")
+_RE_WM = re.compile(r"(Physical|Override) size:\s*(\d+)x(\d+)")
+
+ShellFn = Callable[..., Tuple[int, str, str]]
+
+_CALIB_EVENTS = 20          # số sendevent rỗng (SYN_REPORT không kèm event, kernel bỏ qua) khi đo
+_DEFAULT_EVENT_MS = 5.0     # đo không được thì giả định
+
+
+def parse_getevent(text: str) -> Dict[str, dict]:
+    """
+    'getevent -p' -> {path: {"name", "abs": {code: (min, max)}, "keys": set(code)}}
+    """
+    devices: Dict[str, dict] = {}
+    cur = None
+    section = ""
+    for line in (text or "").splitlines():
+        m = _RE_DEVICE.search(line)
+        if m:
+            cur = {"name": "", "abs": {}, "keys": set()}
+            devices[m.group(1)] = cur
+            section = ""
+            continue
+        if cur is None:
+            continue
+        m = _RE_NAME.search(line)
+        if m:
+            cur["name"] = m.group(1)
+            continue
+        s = line.strip()
+        if s.startswith("KEY (0001):"):
+            section, s = "key", s.split(":", 1)[1]
+        elif s.startswith("ABS (0003):"):
+            section, s = "abs", s.split(":", 1)[1]
+        elif re.match(r"^[A-Z]{3} \([0-9a-fA-F]{4}\):", s) or s.startswith("input props"):
+            section = ""
+            continue
+        if section == "abs":
+            for code, lo, hi in _RE_ABS.findall(s):
+                cur["abs"][int(code, 16)] = (int(lo), int(hi))
+        elif section == "key":
+            for tok in s.split():
+                if re.fullmatch(r"[0-9a-fA-F]{4}", tok):
+                    cur["keys"].add(int(tok, 16))
+    return devices
+
+
+def pick_touchscreen(devices: Dict[str, dict]) -> Optional[Tuple[str, dict]]:
+    """Thiết bị có ABS_MT_POSITION_X/Y; nhiều cái thì ưu tiên cái có TRACKING_ID (protocol B)."""
+    best = None
+    for path, info in devices.items():
+        a = info["abs"]
+        if ABS_MT_POSITION_X in a and ABS_MT_POSITION_Y in a:
+            score = 2 if ABS_MT_TRACKING_ID in a else 1
+            if best is None or score > best[0]:
+                best = (score, path, info)
+    return (best[1], best[2]) if best else None
+
+
+class TouchInjector:
+    def __init__(self, shell_fn: ShellFn, device: str, info: dict, screen_size: Tuple[int, int]):
+        self.shell_fn = shell_fn
+        self.device = device
+        self.name = info.get("name", "")
+        a = info["abs"]
+        self.x_range = a[ABS_MT_POSITION_X]
+        self.y_range = a[ABS_MT_POSITION_Y]
+        self.protocol_b = ABS_MT_TRACKING_ID in a
+        self.has_slot = ABS_MT_SLOT in a
+        self.has_btn = BTN_TOUCH in info.get("keys", ())
+        self.pressure = a.get(ABS_MT_PRESSURE)
+        self.touch_major = a.get(ABS_MT_TOUCH_MAJOR)
+        self.screen_w, self.screen_h = screen_size
+        self._tid = 0
+        self._lock = threading.Lock()
+        self.event_cost_ms: Optional[float] = None
+
+    # ---------------- dò thiết bị ----------------
+    @classmethod
+    def discover(cls, shell_fn: ShellFn, screen_size: Optional[Tuple[int, int]] = None) -> Optional["TouchInjector"]:
+        """None nếu không tìm thấy touchscreen / không ghi được vào /dev/input/eventX."""
+        code, out, _ = shell_fn("getevent -p", timeout=5)
+        if code != 0 or not out:
+            return None
+        picked = pick_touchscreen(parse_getevent(out))
+        if not picked:
+            return None
+        path, info = picked
+        code, out, _ = shell_fn(f"[ -w {path} ] && echo W; wm size", timeout=5)
+        if code != 0 or not out or "W" not in out.split():
+            return None
+        if screen_size is None:
+            sizes = {kind: (int(w), int(h)) for kind, w, h in _RE_WM.findall(out)}
+            screen_size = sizes.get("Override") or sizes.get("Physical")
+        if not screen_size:
+            return None
+        return cls(shell_fn, path, info, screen_size)
+
+    # ---------------- dựng chuỗi event ----------------
+    def _scale(self, x: float, y: float) -> Tuple[int, int]:
+        (x0, x1), (y0, y1) = self.x_range, self.y_range
+        sx = x0 + round(min(max(x, 0), self.screen_w - 1) * (x1 - x0) / max(1, self.screen_w - 1))
+        sy = y0 + round(min(max(y, 0), self.screen_h - 1) * (y1 - y0) / max(1, self.screen_h - 1))
+        return int(sx), int(sy)
+
+    def _ev(self, typ: int, code: int, value: int) -> str:
+        return f"sendevent {self.device} {typ} {code} {value}"
+
+    def _down(self, x: float, y: float) -> list:
+        sx, sy = self._scale(x, y)
+        ev = []
+        if self.protocol_b:
+            if self.has_slot:
+                ev.append(self._ev(EV_ABS, ABS_MT_SLOT, 0))
+            with self._lock:
+                self._tid = (self._tid + 1) % 65535
+                tid = self._tid
+            ev.append(self._ev(EV_ABS, ABS_MT_TRACKING_ID, tid))
+        if self.has_btn:
+            ev.append(self._ev(EV_KEY, BTN_TOUCH, 1))
+        ev += self._pos(sx, sy)
+        return ev
+
+    def _pos(self, sx: int, sy: int) -> list:
+        ev = [self._ev(EV_ABS, ABS_MT_POSITION_X, sx), self._ev(EV_ABS, ABS_MT_POSITION_Y, sy)]
+        if self.touch_major:
+            ev.append(self._ev(EV_ABS, ABS_MT_TOUCH_MAJOR, max(1, self.touch_major[1] // 8)))
+        if self.pressure:
+            ev.append(self._ev(EV_ABS, ABS_MT_PRESSURE, max(1, self.pressure[1] // 2)))
+        if not self.protocol_b:
+            ev.append(self._ev(EV_SYN, SYN_MT_REPORT, 0))
+        ev.append(self._ev(EV_SYN, SYN_REPORT, 0))
+        return ev
+
+    def _move(self, x: float, y: float) -> list:
+        return self._pos(*self._scale(x, y))
+
+    def _up(self) -> list:
+        ev = []
+        if self.protocol_b:
+            ev.append(self._ev(EV_ABS, ABS_MT_TRACKING_ID, -1))
+        if self.has_btn:
+            ev.append(self._ev(EV_KEY, BTN_TOUCH, 0))
+        if not self.protocol_b:
+            ev.append(self._ev(EV_SYN, SYN_MT_REPORT, 0))
+        ev.append(self._ev(EV_SYN, SYN_REPORT, 0))
+        return ev
+
+    def measure_event_cost(self) -> float:
+        """ms cho 1 lệnh sendevent trên máy (đo 1 lần bằng /proc/uptime trong cùng script, rồi cache)."""
+        if self.event_cost_ms is not None:
+            return self.event_cost_ms
+        cost = _DEFAULT_EVENT_MS
+        script = "; ".join(["read a _ </proc/uptime"] + [self._ev(EV_SYN, SYN_REPORT, 0)] * _CALIB_EVENTS
+                           + ["read b _ </proc/uptime", 'echo "$a $b"'])
+        try:
+            code, out, _ = self.shell_fn(script, timeout=5)
+            a, b = (float(v) for v in (out or "").split()[-2:])
+            if code == 0 and b >= a:
+                # /proc/uptime chỉ chính xác 10ms -> sàn 0.5ms/lệnh
+                cost = max(0.5, (b - a) * 1000.0 / _CALIB_EVENTS)
+        except Exception:
+            pass
+        self.event_cost_ms = cost
+        return cost
+
+    def _send(self, events: list, timeout: float) -> bool:
+        code, _, _ = self.shell_fn("; ".join(events), timeout=timeout)
+        return code == 0
+
+    # ---------------- thao tác ----------------
+    def tap(self, x: float, y: float, hold_ms: int = 40) -> bool:
+        ev = self._down(x, y)
+        if hold_ms > 0:
+            ev.append(f"sleep {hold_ms / 1000.0:.3f}")
+        return self._send(ev + self._up(), timeout=3)
+
+    def long_press(self, x: float, y: float, hold_ms: int = 800) -> bool:
+        return self._send(self._down(x, y) + [f"sleep {hold_ms / 1000.0:.3f}"] + self._up(),
+                          timeout=3 + hold_ms / 1000.0)
+
+    def swipe(self, x1: float, y1: float, x2: float, y2: float, dur_ms: int = 300,
+              step_ms: int = 30) -> bool:
+        # mỗi điểm tốn len(_move) lệnh sendevent -> không cho 1 điểm ngắn hơn thời gian gửi nó,
+        # phần còn lại của nhịp mới là sleep
+        point_ms = len(self._move(x2, y2)) * self.measure_event_cost()
+        steps = max(2, int(dur_ms // max(1.0, step_ms, point_ms)))
+        pause_s = (dur_ms / steps - point_ms) / 1000.0
+        ev = self._down(x1, y1)
+        for i in range(1, steps + 1):
+            t = i / steps
+            if pause_s >= 0.001:
+                ev.append(f"sleep {pause_s:.3f}")
+            ev += self._move(x1 + (x2 - x1) * t, y1 + (y2 - y1) * t)
+        return self._send(ev + self._up(), timeout=3 + (dur_ms + len(ev) * self.event_cost_ms) / 1000.0)